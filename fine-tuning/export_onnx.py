@@ -0,0 +1,96 @@
+import argparse
+import inspect
+import os
+
+import torch
+from transformers import AutoModelForQuestionAnswering, AutoTokenizer
+
+"""
+Export a question answering checkpoint trained by qa_fine_tuning_en.py or qa_fine_tuning_it.py
+(bert-finetuned-squad-accelerate, legal-bert-finetuned-squad-it) to ONNX, for the ONNX Runtime backend of the
+web application (odner_app/myapp/qa/onnx_backend.py).
+
+The graph takes input_ids, attention_mask (and token_type_ids for the BERT models) and returns start_logits and
+end_logits; the batch and sequence axes are dynamic, so the same graph serves windows of any length and batches
+of any size. By default it is written as model.onnx in the folder of the checkpoint, where the application finds it.
+
+    python export_onnx.py bert-finetuned-squad-accelerate
+    python export_onnx.py legal-bert-finetuned-squad-it --check
+"""
+
+
+def export(checkpoint, output, opset):
+
+    tokenizer = AutoTokenizer.from_pretrained(checkpoint)
+
+    # torchscript=True makes the model return plain tuples, which the exporter can trace
+    model = AutoModelForQuestionAnswering.from_pretrained(checkpoint, torchscript=True)
+    model.eval()
+
+    # A dummy question and context, only used to trace the graph
+    inputs = tokenizer("What is the governing law?", "This agreement is governed by the laws of Italy.",
+                       return_tensors="pt")
+
+    input_names = [name for name in ["input_ids", "attention_mask", "token_type_ids"] if name in inputs]
+
+    # Batch and sequence axes are dynamic
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["start_logits", "end_logits"]}
+
+    # Recent versions of torch export with dynamo by default, which ignores dynamic_axes: keep the tracing exporter
+    options = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(inputs[name] for name in input_names),
+            output,
+            input_names=input_names,
+            output_names=["start_logits", "end_logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True,
+            **options,
+        )
+
+    return tokenizer, model, inputs, input_names
+
+
+def check(output, model, tokenizer, input_names):
+
+    import numpy as np
+    import onnxruntime
+
+    session = onnxruntime.InferenceSession(output, providers=["CPUExecutionProvider"])
+
+    # A batch of two windows of different lengths, padded, to check the dynamic axes
+    inputs = tokenizer(["Who are the parties?", "When does the contract end?"],
+                       ["The parties are Alpha S.p.A. and Beta S.r.l.", "The contract ends on 31 December 2025."],
+                       padding=True, return_tensors="pt")
+
+    with torch.no_grad():
+        expected = model(*[inputs[name] for name in input_names])
+
+    outputs = session.run(["start_logits", "end_logits"], {name: inputs[name].numpy() for name in input_names})
+
+    for name, value, reference in zip(["start_logits", "end_logits"], outputs, expected):
+        difference = np.abs(value - reference.numpy()).max()
+        print(f"{name}: max difference with PyTorch {difference:.2e}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Export a question answering checkpoint to ONNX")
+    parser.add_argument("checkpoint", help="folder (or hub name) of the fine-tuned model")
+    parser.add_argument("--output", default=None, help="path of the graph (default: <checkpoint>/model.onnx)")
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--check", action="store_true", help="compare the outputs of ONNX Runtime with PyTorch")
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(args.checkpoint, "model.onnx")
+
+    tokenizer, model, inputs, input_names = export(args.checkpoint, output, args.opset)
+
+    print(f"Exported {args.checkpoint} to {output}")
+
+    if args.check:
+        check(output, model, tokenizer, input_names)
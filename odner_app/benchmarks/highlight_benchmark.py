@@ -0,0 +1,102 @@
+"""
+Benchmark of the entity highlighting of /api/filter/.
+
+Compares the previous implementation, which calls `text.replace(word, ...)` once per word per entity, with the
+single-pass Aho-Corasick highlighter of `myapp/filter/highlighter.py` on a synthetic contract.
+
+Run from the odner_app/ folder:
+
+    python benchmarks/highlight_benchmark.py --size 1000000 --entities 3000
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from myapp.filter.highlighter import HTML_COLORS, highlight_entities
+
+
+def highlight_entities_replace(text, entity_dict):
+    """
+    Previous implementation: one `str.replace` over the whole text per word per entity.
+    """
+    colors = []
+    name_entities = []
+
+    for i, (entity, words) in enumerate(entity_dict.items()):
+        style = f"background-color: {HTML_COLORS[i % len(HTML_COLORS)]};"
+
+        colors.append(HTML_COLORS[i % len(HTML_COLORS)])
+        name_entities.append(entity)
+
+        for word in words:
+            text = text.replace(word, f"<span style='{style}'>{word}</span>")
+
+    return text, colors, name_entities
+
+
+def make_corpus(size, n_entities, n_labels, seed):
+    """
+    Build a random text of about `size` characters and an entity dictionary of `n_entities` words taken from it.
+    """
+    rng = random.Random(seed)
+
+    vocabulary = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10))).capitalize()
+                  for _ in range(20000)]
+
+    words = []
+    length = 0
+
+    while length < size:
+        word = rng.choice(vocabulary)
+        words.append(word)
+        length += len(word) + 1
+
+    text = ' '.join(words)
+
+    labels = ['LABEL_%d' % i for i in range(n_labels)]
+    entity_dict = {label: [] for label in labels}
+
+    for i in range(n_entities):
+        # Entities of one or two consecutive words of the text
+        start = rng.randrange(len(words) - 1)
+        entity = ' '.join(words[start:start + rng.randint(1, 2)])
+        entity_dict[labels[i % n_labels]].append(entity)
+
+    return text, entity_dict
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=1000000, help="size of the text in characters")
+    parser.add_argument('--entities', type=int, default=3000, help="number of entity strings")
+    parser.add_argument('--labels', type=int, default=18, help="number of entity labels")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-replace', action='store_true', help="do not run the previous implementation")
+    args = parser.parse_args()
+
+    text, entity_dict = make_corpus(args.size, args.entities, args.labels, args.seed)
+
+    print("text: %d characters, %d entity strings, %d labels" % (len(text), args.entities, args.labels))
+
+    (html, _, _), elapsed = timed(highlight_entities, text, entity_dict)
+    print("aho-corasick: %8.3f s  (%d spans)" % (elapsed, html.count('<span')))
+
+    if not args.skip_replace:
+        (html, _, _), elapsed = timed(highlight_entities_replace, text, entity_dict)
+        print("str.replace:  %8.3f s  (%d spans, nested ones included)" % (elapsed, html.count('<span')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark of the ONNX Runtime backend of the question-answering models.
+
+Answers the same questions over the same contexts with the PyTorch pipeline and with the ONNX Runtime backend of
+`myapp/qa/onnx_backend.py` (the graph must have been exported first with `fine-tuning/export_onnx.py`), and reports
+the time per window, the speed-up and the fraction of identical answers.
+
+Run from the odner_app/ folder:
+
+    python benchmarks/onnx_benchmark.py --model ../fine-tuning/bert-finetuned-squad-accelerate --contexts 50 --words 600 --threads 4
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import django
+from django.conf import settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', required=True, help="local checkpoint with its exported model.onnx")
+    parser.add_argument('--contexts', type=int, default=50, help="number of (question, context) pairs")
+    parser.add_argument('--words', type=int, default=600, help="words per context")
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--threads', type=int, default=None, help="intra-op threads of torch and ONNX Runtime")
+    args = parser.parse_args()
+
+    settings.configure(QA_ONNX_THREADS=args.threads)
+    django.setup()
+
+    import torch
+    from transformers import pipeline
+    from myapp.qa import onnx_backend
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    if not onnx_backend.available(args.model):
+        sys.exit("No exported graph for %s: run fine-tuning/export_onnx.py first" % args.model)
+
+    pt = pipeline("question-answering", model=args.model, device=-1)
+    ort = onnx_backend.ORTPipeline(args.model)
+
+    random.seed(0)
+    vocabulary = [word for word in pt.tokenizer.get_vocab() if word.isalpha()]
+
+    inputs = [{'question': ' '.join(random.choices(vocabulary, k=8)) + '?',
+               'context': ' '.join(random.choices(vocabulary, k=args.words))} for _ in range(args.contexts)]
+
+    n_windows = sum(len(pt.tokenizer(item['question'], item['context'], truncation='only_second', max_length=384,
+                                     stride=128, return_overflowing_tokens=True)['input_ids']) for item in inputs)
+
+    # Warm-up
+    pt(inputs[:2], batch_size=args.batch_size)
+    ort(inputs[:2], batch_size=args.batch_size)
+
+    timings, answers = {}, {}
+
+    for name, qa in [('pytorch', pt), ('onnxruntime', ort)]:
+        start = time.perf_counter()
+        answers[name] = qa(inputs, batch_size=args.batch_size)
+        timings[name] = time.perf_counter() - start
+
+        print("%-12s %.2f s  %.1f ms per window" % (name, timings[name], 1000 * timings[name] / n_windows))
+
+    identical = sum(a['answer'] == b['answer'] for a, b in zip(answers['pytorch'], answers['onnxruntime']))
+
+    print("%d windows  speed-up %.2fx  identical answers %d/%d" % (
+        n_windows, timings['pytorch'] / timings['onnxruntime'], identical, len(inputs)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Benchmark of the response building of /api/qa/.
+
+Compares the previous implementation, which highlights each sentence through a function behind a process-wide lock and
+appends it to the response with `highlight_texts = highlight_texts + highlight_text2`, with `build_response` of
+`myapp/qa/question_answering.py` in its 'html' and 'offsets' modes. No model is needed: the answers of the sentences
+are synthetic. The time per sentence stays flat when the building is linear in the size of the document; with
+`--threads`, several requests build their responses at the same time.
+
+Run from the odner_app/ folder:
+
+    python benchmarks/qa_response_benchmark.py --sentences 1000 10000 100000 --threads 1 8
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import threading
+import time
+from functools import wraps
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import django
+from django.conf import settings
+
+
+def thread_safe(func):
+    lock = threading.RLock()
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with lock:
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+@thread_safe
+def highlight_entities_locked(text, start_pos, end_pos):
+    """
+    Previous highlighting of an answer, behind a process-wide lock.
+    """
+    style = "background-color: red;"
+
+    return f"{text[:start_pos]}<span style='{style}'>{text[start_pos:end_pos]}</span>{text[end_pos:]}"
+
+
+def build_response_concat(sentes, results, result, context_qa, context, highlight='html'):
+    """
+    Previous implementation: the highlighted sentences are appended one at a time to the response.
+    """
+    highlight_texts = ""
+    answers = []
+    scores = []
+
+    for textx, result1 in zip(sentes, results):
+        highlight_text2 = highlight_entities_locked(textx, result1['start'], result1['end'])
+
+        answers.append(result1['answer'])
+        scores.append(result1['score'])
+        highlight_texts = highlight_texts + highlight_text2
+
+    # The highlighting of the whole context was computed, but not returned
+    highlight_entities_locked(context_qa, result['start'], result['end'])
+
+    return {'high_qa': highlight_texts, 'answer': result['answer'], 'score': result['score'], 'answers': answers,
+            'scores': scores, 'sentes': sentes}
+
+
+def make_answers(n_sentences, seed):
+    """
+    Build `n_sentences` random sentences, each with a random answer inside it.
+    """
+    rng = random.Random(seed)
+
+    vocabulary = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10)))
+                  for _ in range(5000)]
+
+    sentes = []
+    results = []
+
+    for _ in range(n_sentences):
+        words = rng.choices(vocabulary, k=rng.randint(8, 30))
+        text = ' '.join(words).capitalize() + '. '
+
+        first = rng.randrange(len(words))
+        start = len(' '.join(words[:first])) + (1 if first else 0)
+        end = start + len(words[first])
+
+        sentes.append(text)
+        results.append({'answer': text[start:end], 'score': rng.random(), 'start': start, 'end': end})
+
+    context = ''.join(sentes)
+    result = max(results, key=lambda result1: result1['score'])
+
+    return sentes, results, dict(result, start=0, end=len(result['answer'])), context
+
+
+def timed(threads, build, *args):
+    """
+    Run `build(*args)` in `threads` threads at the same time, and return the elapsed time.
+    """
+    workers = [threading.Thread(target=build, args=args) for _ in range(threads)]
+
+    start = time.perf_counter()
+
+    for worker in workers:
+        worker.start()
+
+    for worker in workers:
+        worker.join()
+
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sentences', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8], help="concurrent requests")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    settings.configure(INSTALLED_APPS=['myapp'])
+    django.setup()
+
+    from myapp.qa.question_answering import build_response
+
+    builders = [
+        ('concatenation + lock', build_response_concat, 'html'),
+        ('join (html)', build_response, 'html'),
+        ('offsets', build_response, 'offsets'),
+    ]
+
+    for n_sentences in args.sentences:
+        sentes, results, result, context = make_answers(n_sentences, args.seed)
+
+        assert build_response_concat(sentes, results, result, context, context)['high_qa'] == \
+            build_response(sentes, results, result, context, context)['high_qa']
+
+        print("%d sentences, %d characters" % (n_sentences, len(context)))
+
+        for threads in args.threads:
+            for name, build, highlight in builders:
+                elapsed = timed(threads, build, sentes, results, result, context, context, highlight)
+
+                print("  %-22s threads=%-3d %8.3f s  %6.2f us/sentence" % (
+                    name, threads, elapsed, elapsed / (threads * n_sentences) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
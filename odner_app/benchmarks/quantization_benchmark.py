@@ -0,0 +1,165 @@
+"""
+Benchmark of the dynamic int8 quantization of the question-answering models.
+
+Answers a held-out slice of a dataset in the SQuAD format (e.g. the dev set of SQuAD v1.1 for
+`bert-finetuned-squad-accelerate`, or the test set of the Italian SQuAD for `legal-bert-finetuned-squad-it`) with the
+float32 model and with the same model quantized to int8 (see `myapp/qa/quantization.py`), on CPU, and reports for
+both:
+
+    - the exact match and the F1 score of the answers (SQuAD normalization);
+    - the latency of a question (mean, median and 95th percentile) and the throughput;
+    - the size of the model in memory;
+    - the agreement of the two models (fraction of identical answers).
+
+Run from the odner_app/ folder:
+
+    python benchmarks/quantization_benchmark.py --model ../fine-tuning/bert-finetuned-squad-accelerate --squad dev-v1.1.json --limit 1000
+"""
+
+import argparse
+import collections
+import json
+import os
+import re
+import statistics
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import django
+from django.conf import settings
+
+
+def load_squad(path, offset, limit):
+    """
+    Yield the (context, question, answer texts) of a SQuAD-format file, skipping the first `offset` questions.
+    """
+    with open(path) as f:
+        data = json.load(f)['data']
+
+    count = 0
+
+    for article in data:
+        for paragraph in article['paragraphs']:
+            for qa in paragraph['qas']:
+                if not qa.get('answers'):
+                    continue
+
+                count += 1
+
+                if count <= offset:
+                    continue
+
+                yield paragraph['context'], qa['question'], [answer['text'] for answer in qa['answers']]
+
+                if limit and count >= offset + limit:
+                    return
+
+
+def normalize(text):
+    """
+    SQuAD normalization: lower case, no punctuation, no articles, single spaces.
+    """
+    text = ''.join(c for c in text.lower() if c not in set(string.punctuation))
+    text = re.sub(r'\b(a|an|the|il|lo|la|i|gli|le|un|uno|una)\b', ' ', text)
+
+    return ' '.join(text.split())
+
+
+def f1(prediction, truth):
+    prediction, truth = normalize(prediction).split(), normalize(truth).split()
+    common = sum((collections.Counter(prediction) & collections.Counter(truth)).values())
+
+    if not common:
+        return 0.0
+
+    precision, recall = common / len(prediction), common / len(truth)
+
+    return 2 * precision * recall / (precision + recall)
+
+
+def run(qa, examples):
+    """
+    Answer the examples one at a time, as the views do.
+
+    :return: The answers and the latency of each question in seconds.
+    :rtype: tuple
+    """
+    answers, latencies = [], []
+
+    for context, question, _ in examples:
+        start = time.perf_counter()
+        answers.append(qa(question=question, context=context)['answer'])
+        latencies.append(time.perf_counter() - start)
+
+    return answers, latencies
+
+
+def report(name, examples, answers, latencies, size):
+    exact = sum(max(normalize(answer) == normalize(truth) for truth in truths)
+                for answer, (_, _, truths) in zip(answers, examples)) / len(examples)
+    score = sum(max(f1(answer, truth) for truth in truths) for answer, (_, _, truths) in zip(answers, examples)) / len(examples)
+
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+
+    print("%-8s EM %.3f  F1 %.3f  latency mean %.1f ms  p50 %.1f ms  p95 %.1f ms  %.1f q/s  size %.1f MB" % (
+        name, exact, score, 1000 * statistics.mean(latencies), 1000 * statistics.median(latencies), 1000 * p95,
+        len(latencies) / sum(latencies), size / 1024 ** 2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', required=True, help="question-answering model (name or local path)")
+    parser.add_argument('--squad', required=True, help="dataset in the SQuAD format")
+    parser.add_argument('--offset', type=int, default=0, help="questions skipped at the start of the dataset")
+    parser.add_argument('--limit', type=int, default=1000, help="number of questions (0: all)")
+    parser.add_argument('--threads', type=int, default=None, help="torch intra-op threads (default: torch's)")
+    args = parser.parse_args()
+
+    # The quantized weights of the benchmark do not go to the folder of the application
+    settings.configure(QA_QUANTIZED_DIR=tempfile.mkdtemp())
+    django.setup()
+
+    import torch
+    from transformers import pipeline
+    from myapp.qa import quantization
+    from myapp.qa.model_registry import model_size
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    examples = list(load_squad(args.squad, args.offset, args.limit))
+
+    print("%d questions, %d threads" % (len(examples), torch.get_num_threads()))
+
+    fp32 = pipeline("question-answering", model=args.model, device=-1)
+
+    start = time.perf_counter()
+    int8 = quantization.load_quantized_pipeline(args.model)
+    print("quantization: %.1f s" % (time.perf_counter() - start))
+
+    start = time.perf_counter()
+    quantization.load_quantized_pipeline(args.model)
+    print("load from the cached weights: %.1f s" % (time.perf_counter() - start))
+
+    # Warm-up
+    run(fp32, examples[:5])
+    run(int8, examples[:5])
+
+    answers_fp32, latencies_fp32 = run(fp32, examples)
+    answers_int8, latencies_int8 = run(int8, examples)
+
+    report('float32', examples, answers_fp32, latencies_fp32, model_size(fp32.model))
+    report('int8', examples, answers_int8, latencies_int8, model_size(int8.model))
+
+    agreement = sum(a == b for a, b in zip(answers_fp32, answers_int8)) / len(examples)
+
+    print("identical answers: %.3f  speed-up: %.2fx" % (agreement, sum(latencies_fp32) / sum(latencies_int8)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark of the retrieval pre-filter of /api/qa/.
+
+Reads a dataset in the SQuAD format (e.g. the dev set of SQuAD v1.1, or the Italian SQuAD), splits each context in
+sentences with spaCy and, for several values of top_k, measures:
+
+    - the recall of the shortlist: the fraction of the questions whose answer lies in a selected sentence;
+    - the work left to the model: the fraction of the sentences selected.
+
+With --qa-model, the question-answering model is also run over the whole context and over the shortlisted sentences,
+and the exact match of both answers is reported.
+
+Run from the odner_app/ folder:
+
+    python benchmarks/retrieval_benchmark.py --squad dev-v1.1.json --top-k 1 3 5 10 --limit 2000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import django
+from django.conf import settings
+
+
+def load_squad(path, limit):
+    """
+    Yield the (context, question, answer text, answer start) of a SQuAD-format file.
+    """
+    with open(path) as f:
+        data = json.load(f)['data']
+
+    count = 0
+
+    for article in data:
+        for paragraph in article['paragraphs']:
+            for qa in paragraph['qas']:
+                if not qa.get('answers'):
+                    continue
+
+                answer = qa['answers'][0]
+
+                yield paragraph['context'], qa['question'], answer['text'], answer['answer_start']
+
+                count += 1
+
+                if limit and count >= limit:
+                    return
+
+
+def normalize(text):
+    return ' '.join(text.lower().strip(' .,;:').split())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--squad', required=True, help="dataset in the SQuAD format")
+    parser.add_argument('--top-k', type=int, nargs='+', default=[1, 3, 5, 10])
+    parser.add_argument('--margin', type=float, default=0.2, help="recall margin of the shortlist")
+    parser.add_argument('--limit', type=int, default=2000, help="number of questions (0: all)")
+    parser.add_argument('--spacy-model', default=None, help="spaCy model splitting the sentences (default: blank + sentencizer)")
+    parser.add_argument('--language', default='en', help="language of the blank spaCy pipeline")
+    parser.add_argument('--qa-model', default=None, help="also measure the exact match of this question-answering model")
+    args = parser.parse_args()
+
+    settings.configure()
+    django.setup()
+
+    import spacy
+    from myapp.qa import retrieval
+
+    if args.spacy_model:
+        nlp = spacy.load(args.spacy_model)
+    else:
+        nlp = spacy.blank(args.language)
+        nlp.add_pipe('sentencizer')
+
+    qa = None
+    if args.qa_model:
+        from transformers import pipeline
+        qa = pipeline("question-answering", model=args.qa_model)
+
+    found = {k: 0 for k in args.top_k}
+    kept = {k: 0.0 for k in args.top_k}
+    exact = {k: 0 for k in args.top_k}
+    exact_full = 0
+    n = 0
+
+    start = time.perf_counter()
+
+    for context, question, answer, answer_start in load_squad(args.squad, args.limit):
+        doc = nlp(context)
+        sentences = list(doc.sents)
+
+        index = retrieval.BM25([retrieval.terms(sentence) for sentence in sentences])
+        scores = index.scores(retrieval.terms(nlp.tokenizer(question)))
+
+        if qa is not None:
+            exact_full += normalize(qa(question=question, context=context)['answer']) == normalize(answer)
+
+        for k in args.top_k:
+            selected = retrieval.shortlist(scores, k, args.margin)
+
+            found[k] += any(sentences[i].start_char <= answer_start < sentences[i].end_char for i in selected)
+            kept[k] += len(selected) / len(sentences)
+
+            if qa is not None:
+                shortlisted = ' '.join(sentences[i].text for i in selected)
+                exact[k] += normalize(qa(question=question, context=shortlisted)['answer']) == normalize(answer)
+
+        n += 1
+
+    elapsed = time.perf_counter() - start
+
+    print("%d questions (%.1f s)" % (n, elapsed))
+
+    if qa is not None:
+        print("whole context:  exact match %.3f" % (exact_full / n))
+
+    for k in args.top_k:
+        line = "top_k=%-3d recall %.3f  sentences kept %.3f" % (k, found[k] / n, kept[k] / n)
+
+        if qa is not None:
+            line += "  exact match %.3f" % (exact[k] / n)
+
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
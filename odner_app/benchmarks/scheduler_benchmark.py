@@ -0,0 +1,93 @@
+"""
+Benchmark of the micro-batching scheduler of the question-answering models.
+
+Simulates concurrent requests: each client thread asks one question over one sentence at a time, in a loop, through
+`myapp/qa/scheduler.py`. The throughput is measured with the previous behaviour (one pipeline call at a time behind
+a lock) and with the scheduler for several maximum batch sizes.
+
+Run from the odner_app/ folder:
+
+    python benchmarks/scheduler_benchmark.py --model ../fine-tuning/bert-finetuned-squad-accelerate --clients 16 --max-batch 1 8 32
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import django
+from django.conf import settings
+
+
+def load(clients, requests, call):
+    """
+    Run `requests` calls in each of `clients` threads, and return the number of calls per second.
+    """
+    def client(seed):
+        for _ in range(requests):
+            call(seed)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+
+    start = time.perf_counter()
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    return clients * requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', required=True, help="question-answering model (name or local path)")
+    parser.add_argument('--clients', type=int, default=16, help="concurrent client threads")
+    parser.add_argument('--requests', type=int, default=20, help="requests per client")
+    parser.add_argument('--words', type=int, default=30, help="words per sentence")
+    parser.add_argument('--max-batch', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    settings.configure()
+    django.setup()
+
+    from myapp.qa import scheduler
+    from myapp.qa.model_registry import get_qa_pipeline
+
+    qa = get_qa_pipeline(args.model)
+
+    random.seed(0)
+    vocabulary = [word for word in qa.tokenizer.get_vocab() if word.isalpha()]
+
+    def item(seed):
+        return {'question': ' '.join(random.choices(vocabulary, k=6)) + '?',
+                'context': ' '.join(random.choices(vocabulary, k=args.words))}
+
+    lock = threading.Lock()
+
+    def serialized(seed):
+        with lock:
+            qa([item(seed)], batch_size=16)
+
+    qa([item(0)], batch_size=16)  # Warm-up
+
+    print("%d clients x %d requests" % (args.clients, args.requests))
+    print("%-24s %.1f requests/s" % ("lock (previous)", load(args.clients, args.requests, serialized)))
+
+    for max_batch in args.max_batch:
+        queue = scheduler.Scheduler(max_batch=max_batch, max_wait_ms=args.max_wait_ms)
+
+        def scheduled(seed):
+            queue.run(args.model, [item(seed)], 16)
+
+        print("%-24s %.1f requests/s" % ("scheduler max_batch=%d" % max_batch, load(args.clients, args.requests, scheduled)))
+
+
+if __name__ == '__main__':
+    main()
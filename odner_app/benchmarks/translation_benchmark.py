@@ -0,0 +1,120 @@
+"""
+Benchmark of the concurrent translation of the uploads.
+
+Starts a local fake LibreTranslate-compatible server (it answers every request after a fixed latency, and fails a
+fraction of them to exercise the retries), then translates a synthetic Italian contract through
+`myapp.translation.translator.HTTPBackend`, first one batch at a time and then with several requests in flight.
+
+Run from the odner_app/ folder:
+
+    python benchmarks/translation_benchmark.py --sentences 300 --latency 0.5 --in-flight 8
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import django
+from django.conf import settings
+
+
+class FakeTranslationHandler(BaseHTTPRequestHandler):
+    """
+    POST /translate: returns the texts upper-cased after `latency` seconds, or a 503 with probability `failure_rate`.
+    """
+
+    latency = 0.5
+    failure_rate = 0.0
+    requests = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+
+        type(self).requests += 1
+        time.sleep(self.latency)
+
+        if random.random() < self.failure_rate:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        payload = json.dumps({'translatedText': [text.upper() for text in body['q']]}).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_contract(n_sentences, seed):
+    """
+    Build a random Italian-looking text of `n_sentences` sentences.
+    """
+    rng = random.Random(seed)
+
+    words = ['il', 'contraente', 'si', 'impegna', 'a', 'corrispondere', 'al', 'fornitore', 'entro', 'trenta',
+             'giorni', 'dalla', 'data', 'di', 'ricevimento', 'della', 'fattura', 'le', 'somme', 'dovute',
+             'per', 'servizi', 'resi', 'ai', 'sensi', 'del', 'presente', 'contratto', 'salvo', 'diverso', 'accordo']
+
+    return ' '.join(' '.join(rng.choice(words) for _ in range(rng.randint(15, 40))) + '.'
+                    for _ in range(n_sentences))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sentences', type=int, default=300, help="number of sentences of the contract")
+    parser.add_argument('--latency', type=float, default=0.5, help="latency of the fake server in seconds")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="fraction of the requests failing with 503")
+    parser.add_argument('--in-flight', type=int, default=8, help="requests in flight of the concurrent run")
+    parser.add_argument('--max-chars', type=int, default=4500, help="maximum characters of a batch")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    settings.configure(INSTALLED_APPS=['myapp'], TRANSLATION_BACKOFF=0.1, TRANSLATION_RETRIES=5,
+                       TRANSLATION_DEADLINE=600)
+    django.setup()
+
+    from myapp.translation.translator import HTTPBackend, pack, translate_batches
+
+    FakeTranslationHandler.latency = args.latency
+    FakeTranslationHandler.failure_rate = args.failure_rate
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTranslationHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    backend = HTTPBackend('http://127.0.0.1:%d' % server.server_address[1])
+    backend.max_chars = args.max_chars
+
+    fragments = [p for p in make_contract(args.sentences, args.seed).split('.') if len(p) > 5]
+    batches = pack(fragments, backend.max_chars)
+
+    print("contract: %d sentences, %d batches, server latency %.2f s" % (len(fragments), len(batches), args.latency))
+
+    for in_flight in (1, args.in_flight):
+        settings.TRANSLATION_MAX_IN_FLIGHT = in_flight
+        FakeTranslationHandler.requests = 0
+
+        start = time.perf_counter()
+        translations = translate_batches(batches, backend, 'it', 'en')
+        elapsed = time.perf_counter() - start
+
+        assert [t for batch in translations for t in batch] == [f.upper() for f in fragments]
+
+        print("%2d in flight: %7.3f s  (%d requests)" % (in_flight, elapsed, FakeTranslationHandler.requests))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -127,3 +127,125 @@ STATIC_ROOT = '/var/www/llm/frontend/dist/'
 FILE_UPLOAD_PERMISSIONS = 0o755
 
 MEDIA_ROOT = '/var/www/llm/'
+
+# Memory budget (in bytes) of the question-answering models kept loaded by each worker process (see myapp/qa/model_registry.py).
+# The least recently used models are evicted when the budget is exceeded, 0 disables the bound.
+QA_MODEL_CACHE_BYTES = 4 * 1024 ** 3
+
+# Number of sentences (or context windows) sent to a question-answering model in a single forward pass (see myapp/qa/qa_engine.py).
+QA_BATCH_SIZE = 16
+
+# spaCy pipelines loaded when the worker starts instead of on first use (see myapp/nlp/spacy_loader.py):
+# "sentences" (sentence splitting for /api/qa/), "ner-it" and "ner-en" (named entity recognition).
+SPACY_PRELOAD = []
+
+# Answer cache of the question-answering models (see myapp/qa/answer_cache.py): maximum number of answers stored in the database,
+# maximum number of answers kept in memory by each worker process, and revision of the hub models (local checkpoints use the modification time of their files).
+QA_ANSWER_CACHE_SIZE = 100000
+QA_ANSWER_CACHE_MEMORY_SIZE = 10000
+QA_MODEL_REVISIONS = {}
+
+# Parallel extraction of the pages of the uploaded PDFs (see myapp/upload_file/text_extraction.py): opt-in switch,
+# maximum number of worker processes (None uses all the cores) and minimum number of pages per worker (smaller files are extracted serially).
+PDF_PARALLEL_EXTRACTION = False
+PDF_EXTRACTION_WORKERS = None
+PDF_PAGES_PER_WORKER = 25
+
+# Backend used to translate the uploaded documents (see myapp/translation/translator.py):
+# 'myapp.translation.translator.GoogleBackend' (Google Translate) or 'myapp.translation.translator.IdentityBackend' (no translation, for tests and air-gapped deployments).
+TRANSLATION_BACKEND = 'myapp.translation.translator.GoogleBackend'
+
+# Concurrent translation (see myapp/translation/translator.py): requests in flight, retries of a failed request,
+# first backoff delay in seconds (doubled at each retry), deadline of a whole document in seconds,
+# and URL of the LibreTranslate-compatible server used by 'myapp.translation.translator.HTTPBackend'.
+TRANSLATION_MAX_IN_FLIGHT = 8
+TRANSLATION_RETRIES = 3
+TRANSLATION_BACKOFF = 0.5
+TRANSLATION_DEADLINE = 300
+TRANSLATION_SERVER_URL = 'http://127.0.0.1:5000'
+
+# Named entity recognition (see myapp/nlp/ner_engine.py): chunks per batch of nlp.pipe
+# and number of processes (1 runs in the web worker process), maximum characters of the chunks a text is split in.
+NER_BATCH_SIZE = 8
+NER_N_PROCESS = 1
+NER_CHUNK_SIZE = 100000
+
+# Incremental refresh of an edited text (see myapp/nlp/incremental.py): characters around an answer
+# that support it; an edit inside this window recomputes the answer.
+QA_SUPPORT_CHARS = 2000
+
+# Content-addressed cache of the named entities of the texts (see myapp/nlp/ner_cache.py):
+# whether it is used, and maximum number of texts kept in the database (least recently used evicted first, every 100 texts stored).
+NER_CACHE = True
+NER_CACHE_SIZE = 100000
+
+# Retrieval pre-filter of /api/qa/ (see myapp/qa/retrieval.py): number of sentences sent to the model
+# (0 disables the retrieval) and recall margin (sentences scoring within this fraction of the k-th best are kept too).
+QA_RETRIEVAL_TOP_K = 0
+QA_RETRIEVAL_MARGIN = 0.2
+
+# Question answering from the stored token index of the contexts (see myapp/qa/token_index.py and myapp/qa/window_qa.py):
+# whether it is used instead of the pipeline for the whole contexts (and whether the indexes are stored on disk at all),
+# folder of the indexes (None: myapp/upload_file/txt_files/index), tokens of a window and tokens shared by two windows
+# (also used by the 'windows' mode of /api/qa/), maximum tokens of an answer and of a question.
+QA_TOKEN_INDEX = False
+QA_INDEX_DIR = None
+QA_MAX_LENGTH = 384
+QA_STRIDE = 128
+QA_MAX_ANSWER_LENGTH = 15
+QA_MAX_QUESTION_LENGTH = 64
+
+# Mode of /api/qa/: 'sentences' (every sentence, then the whole context) or 'windows' (a single pass over the windows
+# of the context, see myapp/qa/window_qa.py; the windows have QA_MAX_LENGTH tokens, QA_STRIDE of them shared by two
+# windows, unless the request gives max_length and stride).
+QA_MODE = 'sentences'
+
+# Sentences of /api/qa-stream/ answered before their results are streamed (see myapp/qa/qa_stream.py); None: the
+# batch size of the model (QA_BATCH_SIZE), so that the first results arrive after one forward pass.
+QA_STREAM_CHUNK = None
+
+# Highlighting of the answers returned by /api/qa/ and /api/qa-stream/: 'html' (the sentences with their answer
+# wrapped in a span) or 'offsets' (the [start, end] offsets of the answers, rendered by the frontend).
+QA_HIGHLIGHT = 'html'
+
+# Dynamic int8 quantization of the question-answering models (see myapp/qa/quantization.py), selected per model by the
+# '@int8' suffix of its name (e.g. in the entity_model map of a Config): folder of the cached quantized weights (None: myapp/qa/quantized).
+QA_QUANTIZED_DIR = None
+
+# ONNX Runtime backend of the question-answering models (see myapp/qa/onnx_backend.py), used when the graph exported
+# by fine-tuning/export_onnx.py exists (model.onnx in the folder of a local checkpoint): whether it is used,
+# folder of the graphs of the hub models (None: myapp/qa/onnx), intra-op threads (None: chosen by ONNX Runtime).
+QA_ONNX = True
+QA_ONNX_DIR = None
+QA_ONNX_THREADS = None
+
+# Micro-batching of the question-answering work of concurrent requests (see myapp/qa/scheduler.py): whether it is used
+# (otherwise each request calls the model itself, one at a time per model), maximum items of a micro-batch and time a
+# micro-batch waits for more items, in milliseconds. A worker idle for QA_SCHEDULER_IDLE_SECONDS exits.
+QA_SCHEDULER = True
+QA_SCHEDULER_MAX_BATCH = 32
+QA_SCHEDULER_MAX_WAIT_MS = 5
+QA_SCHEDULER_IDLE_SECONDS = 60
+
+# Inference daemon holding the models once for all the web workers (see myapp/inference/, started with
+# `python manage.py inference_server`): path of its Unix socket (None: every worker loads its own models),
+# key authenticating the connections (None: the SECRET_KEY) and time to wait for a result, in seconds.
+INFERENCE_SOCKET = None
+INFERENCE_AUTHKEY = None
+INFERENCE_TIMEOUT = 600
+
+# Permissions of the socket of the inference daemon: mode (0o600: only the user running the daemon can connect) and
+# group owning the socket (None: the group of the daemon). When the web workers run as another user, set the group
+# shared by the two users and the mode 0o660.
+INFERENCE_SOCKET_MODE = 0o600
+INFERENCE_SOCKET_GROUP = None
+
+# Background jobs (see myapp/jobs/job_queue.py, workers started with `python manage.py run_jobs`): whether the uploads,
+# load-config and change-cnf run in the background by default (otherwise only with the async parameter), folder of the
+# spooled uploaded files (None: myapp/jobs/spool), seconds without heartbeat after which a running job is queued again,
+# number of times a job is started before it fails, and seconds between two looks of a worker at an empty queue.
+JOBS_ASYNC = False
+JOBS_SPOOL_DIR = None
+JOBS_STALE_AFTER = 600
+JOBS_MAX_ATTEMPTS = 3
+JOBS_POLL_INTERVAL = 1.0
@@ -14,9 +14,12 @@
     - /api/filter/: This URL is used for filtering named entities and is associated with the FilterView class.
     - /api/get-config/: This URL is used for getting the configuration and is associated with the GetConfig class.
     - /api/qa/: This URL is used for performing question-answering and is associated with the QA class.
+    - /api/qa-stream/: This URL is used for streaming the answers of question-answering sentence by sentence and is associated with the QAStream class.
     - /api/save-question/: This URL is used for saving a question and is associated with the Save class.
     - /api/change-cnf/: This URL is used for changing the configuration and is associated with the configChange class.
     - /api/delete-entities/: This URL is used for deleting named entities and is associated with the DeleteEntities class.
+    - /api/bulk-ner/: This URL is used for pre-computing the named entities of many documents and is associated with the BulkNER class.
+    - /api/job-status/: This URL is used for polling the status of a background job and is associated with the JobStatus class.
 
 """
 
@@ -29,9 +32,12 @@ from myapp.load_config import loadConfig  # Class for loading the configuration
 from myapp.filter import filterNER  # Class for filtering named entities
 from myapp.load_config import getConfig  # Class for getting the configuration
 from myapp.qa import question_answering  # Class for performing question-answering
+from myapp.qa import qa_stream  # Class for streaming the answers of question-answering
 from myapp.save_q import saveQuestion  # Class for saving a question
 from myapp.load_config import changeConfig  # Class for changing the configuration
 from myapp.load_config import deleteEn  # Class for deleting named entities
+from myapp.load_config import bulkNER  # Class for pre-computing the named entities of many documents
+from myapp.jobs import jobStatus  # Class for polling the status of a background job
 
 # Define the schema URLs for the application
 # Each URL is connected to a view class that handles requests
@@ -46,7 +52,10 @@ urlpatterns = [
     path('api/filter/', filterNER.FilterView.as_view(), name='filter'),  # URL for filtering named entities
     path('api/get-config/', getConfig.GetConfig.as_view(), name='get-config'),  # URL for getting the configuration
     path('api/qa/', question_answering.QA.as_view(), name='qa'),  # URL for performing question-answering
+    path('api/qa-stream/', qa_stream.QAStream.as_view(), name='qa-stream'),  # URL for streaming the answers of question-answering
     path('api/save-question/', saveQuestion.Save.as_view(), name='save-q'),  # URL for saving a question
     path('api/change-cnf/', changeConfig.configChange.as_view(), name='change-cnf'),  # URL for changing the configuration
     path('api/delete-entities/', deleteEn.DeleteEntities.as_view(), name='del-en'),  # URL for deleting named entities
+    path('api/bulk-ner/', bulkNER.BulkNER.as_view(), name='bulk-ner'),  # URL for pre-computing the named entities of many documents
+    path('api/job-status/', jobStatus.JobStatus.as_view(), name='job-status'),  # URL for polling the status of a background job
 ]
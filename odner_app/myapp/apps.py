@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class MyappConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "myapp"
+
+    def ready(self):
+        # Load the spaCy pipelines listed in SPACY_PRELOAD once, when the worker starts
+        if getattr(settings, 'SPACY_PRELOAD', []):
+            from myapp.nlp import spacy_loader
+
+            spacy_loader.preload()
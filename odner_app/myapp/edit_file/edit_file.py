@@ -1,7 +1,7 @@
 """
 The functions are defined as follows:
 
-    - ner(txt_to_ner, language): performs Named Entity Recognition (NER) on text using Spacy and returns the named entities as a dictionary.
+    - ner_spans(txt_to_ner, language): performs Named Entity Recognition (NER) on text using Spacy and returns the named entities with their offsets (see myapp/nlp/ner_engine.py).
 
     - JSONToDict(filename): converts a JSON file to a dictionary and returns the dictionary.
 
@@ -9,8 +9,12 @@ The functions are defined as follows:
 
     - DictToJSON(my_dict, filename): converts a dictionary to a JSON file and saves it to disk.
 
+    - document_json_files(path, name_file, language): returns the JSONDicts files (and their state files) of a document, one per configuration of its language.
+
 The class EditTXTView is a Django API endpoint that allows users to upload a text file, edit its contents, and perform NER on the edited text. The class includes a post method that processes the uploaded file and text, saves the edited text to disk, updates the relevant database record, performs NER on the edited text, and returns a JSON response containing the edited text. The post method uses the functions defined above to perform its tasks.
 
+The NER and the question answering are refreshed incrementally (see myapp/nlp/incremental.py): the entities and the answers computed on the previous version of the text are kept in a state file next to the base dictionary of the document; NER is re-run only on the paragraphs changed by the edit, and an answer is recomputed only when the edit touches the window supporting it.
+
 The class EditSerializer is used to serialize the EditText object, which is used to store the edited text in the database.
 
 """
@@ -19,46 +23,19 @@ The class EditSerializer is used to serialize the EditText object, which is used
 import json
 import re
 import os
-import spacy
+from myapp.nlp.ner_engine import ner_spans
+from myapp.nlp import incremental
+import copy
 from django.http import JsonResponse
 from rest_framework import generics
-from transformers import pipeline
-from myapp.models import DOC, EditText, NER, PDF, XLSX
+from myapp.qa import qa_engine, answer_cache, token_index
+from myapp.models import Config, DOC, EditText, NER, PDF, XLSX
 from myapp.serializers.edit_serializer import EditSerializer
 from django.db import transaction
 import threading
 from functools import wraps
 
 
-def ner(txt_to_ner, language):
-    """
-    Performs Named Entity Recognition (NER) on text.
-
-    :param
-        txt_to_ner (str): The text to perform NER on.
-        language (str): The language of the text to be processed. Supported languages are 'en' for English and 'it' for Italian.
-
-    :return
-        dict: A dictionary where keys are named entity labels and values are lists of named entities for each label.
-    """
-    if language == 'it':
-        nlp = spacy.load("it_core_news_lg")
-    else:
-        nlp = spacy.load("en_core_web_lg")
-
-    # perform NER on text
-    doc = nlp(txt_to_ner)
-
-    # create dictionary to store named entities by label
-    tmp = {label: [] for label in nlp.get_pipe('ner').labels}
-
-    # loop through named entities and store them in the dictionary by label
-    for ent in doc.ents:
-        tmp[ent.label_].append(ent.text)
-
-    return tmp
-
-
 def thread_safe(func):
     lock = threading.RLock()
 
@@ -113,6 +90,34 @@ def DictToJSON(my_dict, filename):
         json.dump(my_dict, json_file)
 
 
+def document_json_files(path, name_file, language):
+    """
+    Return the JSONDicts files that can exist for a document: `<name>-<config>-<language>.json` for the base
+    configuration and for every configuration of the language, with their state files.
+
+    :param path: The folder of the JSONDicts files (ending with '/').
+    :type path: str
+    :param name_file: The name of the text file of the document (`<name>-<language>.txt`).
+    :type name_file: str
+    :param language: The language of the document.
+    :type language: str
+    :return: The absolute paths of the files.
+    :rtype: set
+    """
+    # Name of a configuration from the path of its file (`<config>-<language>.json`), as in changeConfig.py
+    names = {'base'}
+    for title in Config.objects.filter(language=language).values_list('title', flat=True):
+        names.add(re.split(r'[\\/]', title)[-1][:-8])
+
+    files = set()
+    for name in names:
+        path_dict = path + name_file[:-7] + '-' + name + '-' + language + '.json'
+        files.add(os.path.abspath(path_dict))
+        files.add(os.path.abspath(incremental.state_path(path_dict)))
+
+    return files
+
+
 class EditTXTView(generics.CreateAPIView):
     
     """ 
@@ -144,6 +149,16 @@ class EditTXTView(generics.CreateAPIView):
         file_up = request.data.get('file_source')
 
         with self.lock:
+            old_text = None
+
+            if os.path.isfile(txt_file):
+                with open(txt_file, 'rb') as old:
+                    old_text = old.read().decode('utf-8', errors='replace')
+
+                # Forget the cached answers over the whole previous version of the text, and its token index
+                answer_cache.invalidate(old_text)
+                token_index.remove(old_text)
+
             # Write edited text to the .txt file
             with open(txt_file, 'wb') as out:
                 out.write(txt_edited.encode('utf-8'))
@@ -184,8 +199,34 @@ class EditTXTView(generics.CreateAPIView):
         ner_obj = NER.objects.filter(title=txt_file).first()
 
         if ner_obj is not None:
-            
-            dict = ner(txt_edited,l)
+
+            # Path of the base dictionary (only the entities) of the document, and of its state file
+            path_base = ner_obj.jsonDict.name.split('/')[:-1]
+            name_file = txt_file.split('/')[-1]
+            path = ""
+            for p in path_base:
+                path += p + '/'
+
+            path_dicts = path
+            path += name_file[:-7] + '-base-' + ner_obj.language + '.json'
+            path_state = incremental.state_path(path)
+
+            # Entities and answers computed on the previous version of the text, if still valid
+            state = None
+            if old_text is not None:
+                state = incremental.load_state(path_state, old_text, ner_obj.language)
+
+            if state is not None:
+                # Re-run NER only on the changed paragraphs
+                spans, region = incremental.update_spans(state['spans'], old_text, txt_edited, ner_obj.language)
+                previous_qa = state['qa']
+            else:
+                spans = ner_spans(txt_edited, ner_obj.language)
+                region = None
+                previous_qa = {}
+
+            dict_base = incremental.entities_dict(spans, ner_obj.language)
+            dict = copy.deepcopy(dict_base)
 
             # Convert JSON object to dictionary
             tmp = ner_obj.jsonDict.name
@@ -193,6 +234,9 @@ class EditTXTView(generics.CreateAPIView):
             
             model = json.loads(ner_obj.entity_model_current)
 
+            qa = {}
+            to_answer = []
+
             # Iterate through entity model keys
             for key in model.keys():
                 if model[key] != 'Spacy':
@@ -200,16 +244,26 @@ class EditTXTView(generics.CreateAPIView):
                     model_name = model[key]
                     question = ner_dict[key]
 
-                    # Perform question answering on edited text
-                    qa = pipeline("question-answering", model=model_name)
-                    result = qa(question=question, context=txt_edited)
+                    previous = previous_qa.get(key)
+
+                    if previous is not None and previous['model'] == model_name and previous['question'] == question \
+                            and not incremental.answer_touched(previous, region):
+                        # The edit does not touch the window supporting the answer: keep it
+                        qa[key] = incremental.shift_answer(previous, region)
+                    else:
+                        to_answer.append(key)
+
+            # Perform question answering on edited text, with one batched call per model
+            for key, result in qa_engine.answer_entities(model, ner_dict, txt_edited, to_answer).items():
+                qa[key] = incremental.answer_state(model[key], ner_dict[key], result)
 
-                    # Extract answer from result
-                    answer = result['answer']
+            for key in [key for key in model.keys() if key in qa]:
+                # Extract answer from result
+                answer = qa[key]['answer']
 
-                    # Add answer to dictionary
-                    dict[key] = []
-                    dict[key].append(answer)
+                # Add answer to dictionary
+                dict[key] = []
+                dict[key].append(answer)
 
             # Convert dictionary to JSON object
             DictToJSON(dict, tmp)
@@ -223,37 +277,24 @@ class EditTXTView(generics.CreateAPIView):
             with transaction.atomic():
                 queryset.update(jsondict_str=dict_str, jsonDict=tmp, entity_model_current = str_model)
 
-            # Update base configuration
-            
-            path_base = ner_obj.jsonDict.name.split('/')[:-1]
-            name_dict = ner_obj.jsonDict.name.spli('/')[-1]
-            path = ""
-            for p in path_base:
-                path +=p+'/'
-            
-            path+=name_dict+'-base-'+ner_obj.language+'.json'
-            
-            dict_base = JSONToDict(os.path.abspath(path))
-
-            dict_base = ner(txt_edited,ner_obj.language)
+            # Update base configuration and the state of the document
 
-            DictToJSON(dict_base)
+            if os.path.abspath(path) != os.path.abspath(tmp):
+                DictToJSON(dict_base, path)
 
-            # Delete the others jsonDict file that don't corresponde anymore to the extracted text (they will be reloaded when the user will change the configuration)
+            with self.lock:
+                incremental.save_state(path_state, txt_edited, ner_obj.language, spans, qa)
 
-            directory = os.path.dirname(os.path.abspath(__file__))+'\JSONDicts/'
+            # Delete the others jsonDict file of the document that don't corresponde anymore to the extracted text (they will be reloaded when the user will change the configuration)
 
-            # Iterate over all the files in the directory 'JSONDicts'
-            for root, dirs, files in os.walk(directory):
-                for filename in files:
-                    path_current = os.path.abspath(os.path.join(root, filename))
+            keep = {os.path.abspath(path), os.path.abspath(tmp), os.path.abspath(path_state)}
 
-                    
-                    if path_current != path & path_current!=ner_obj.jsonDict.name:
-                        with self.lock:
-                            # Delete file
-                            if os.path.isfile(path_current):
-                                os.remove(path_current)
+            # Iterate over the files of this document only (one per configuration), not the other documents' ones
+            for path_current in document_json_files(path_dicts, name_file, ner_obj.language) - keep:
+                with self.lock:
+                    # Delete file
+                    if os.path.isfile(path_current):
+                        os.remove(path_current)
 
         # Create EditText object to make data persistent
         with transaction.atomic():
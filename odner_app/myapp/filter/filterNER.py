@@ -2,9 +2,10 @@
 The script defines the following functions:
 
     - JSONToDict(): a function that converts a JSON file to a dictionary object.
-    - highlight_entities(): a function that takes the input text, entity dictionary, and number of entities as input, and returns a tuple containing the highlighted text, 
+    - highlight_entities(): (imported from highlighter.py) a function that takes the input text and the entity dictionary as input, and returns a tuple containing the highlighted text, 
                         color codes for each entity, and a list of the entities. 
-                        The function generates a unique inline style for each entity, creates a span tag with the inline style for each word in the entity's list, and returns the HTML string.
+                        The function builds a single Aho-Corasick automaton from the words of all the entities, scans the text once, and wraps each occurrence 
+                        (leftmost-longest, without overlaps) in a span tag with the inline style of its entity.
     
 The script defines the following class:
 
@@ -25,6 +26,7 @@ import re
 
 from django.http import JsonResponse
 from myapp.models import NER
+from myapp.filter.highlighter import highlight_entities
 from rest_framework import generics
 
 # function to convert JSON file to dictionary
@@ -41,41 +43,6 @@ def JSONToDict(filename):
         data_dict = json.load(json_file)
     return data_dict
 
-def highlight_entities(text, entity_dict):
-    """
-    Highlight the entities in the text with different colors
-
-    :param text: The input text to highlight
-    :param entity_dict: A dictionary containing the entities and their corresponding words
-    :return: A tuple containing the highlighted text, color codes for each entity, and a list of the entities
-    """
-    # Define colors for highlighting
-    html_colors = [
-        '#FFFFE0', '#90EE90', '#E0FFFF', '#FFE4E1', '#AFEEEE', '#E6E6FA', '#D3D3D3',
-        '#F0FFF0', '#F0E68C', '#B0E0E6', '#FFDAB9', '#ADD8E6', '#FFB6C1', '#C0C0C0',
-        '#FFF5EE', '#F5F5DC', '#FFF0F5', '#EEE8AA', '#FFA07A', '#87CEFA', '#98FB98',
-        '#F0F8FF', '#778899', '#FFFFF0', '#FFFACD', '#FFE4B5', '#FDF5E6', '#FFEFD5',
-        '#FFDAB9', '#D8BFD8', '#B0C4DE'
-    ]
-
-    colors = []
-    name_entities = []
-
-    # Loop through each entity in the dictionary
-    for i, (entity, words) in enumerate(entity_dict.items()):
-        # Generate a unique inline style for the entity
-        style = f"background-color: {html_colors[i % len(html_colors)]};"
-
-        colors.append(html_colors[i % len(html_colors)])
-        name_entities.append(entity)
-
-        # Create a span tag with the inline style for each word in the entity's list
-        for word in words:
-            text = text.replace(word, f"<span style='{style}'>{word}</span>")
-
-    # Return the HTML string
-    return text, colors, name_entities
-
 
 class FilterView(generics.CreateAPIView):
     """
@@ -0,0 +1,194 @@
+"""
+Single-pass highlighting of the entities of a text.
+
+Replacing every word of every entity with `str.replace` costs one scan of the whole text per word, and it also rewrites
+the words found inside the `<span>` tags inserted by the previous replacements. This module builds instead one
+Aho-Corasick automaton from all the entity words and scans the text once:
+
+    - `Automaton`: the multi-pattern automaton. `add(pattern, value)` registers a pattern, `build()` computes the failure
+      links, `iter_matches(text)` yields every occurrence and `find(text)` the non-overlapping occurrences chosen with
+      the leftmost-longest rule: scanning from left to right, the longest pattern starting at the first matching
+      position wins, and the scan resumes after it.
+    - `highlight_entities(text, entity_dict)`: wraps every selected occurrence in a `<span>` with the color of its
+      entity and assembles the HTML in a single join. A word listed under several entities takes the color of the first one.
+"""
+
+
+# Colors used for highlighting the entities
+HTML_COLORS = [
+    '#FFFFE0', '#90EE90', '#E0FFFF', '#FFE4E1', '#AFEEEE', '#E6E6FA', '#D3D3D3',
+    '#F0FFF0', '#F0E68C', '#B0E0E6', '#FFDAB9', '#ADD8E6', '#FFB6C1', '#C0C0C0',
+    '#FFF5EE', '#F5F5DC', '#FFF0F5', '#EEE8AA', '#FFA07A', '#87CEFA', '#98FB98',
+    '#F0F8FF', '#778899', '#FFFFF0', '#FFFACD', '#FFE4B5', '#FDF5E6', '#FFEFD5',
+    '#FFDAB9', '#D8BFD8', '#B0C4DE'
+]
+
+
+class Automaton:
+    """
+    Aho-Corasick automaton matching many patterns in a single scan of the text.
+    """
+
+    def __init__(self):
+        self._goto = [{}]  # node -> {character: child node}
+        self._fail = [0]  # node -> failure link
+        self._output = [0]  # node -> nearest node (itself or a failure ancestor) ending a pattern, 0 if none
+        self._length = [0]  # node -> length of the pattern ending at the node, 0 if none
+        self._value = [None]  # node -> value of the pattern ending at the node
+        self._built = True
+
+    def add(self, pattern, value=None):
+        """
+        Register a pattern. Registering the same pattern twice keeps the first value.
+
+        :param pattern: The pattern (empty patterns are ignored).
+        :type pattern: str
+        :param value: The value returned with the occurrences of the pattern.
+        """
+        if not pattern:
+            return
+
+        node = 0
+
+        for char in pattern:
+            child = self._goto[node].get(char)
+
+            if child is None:
+                child = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(0)
+                self._length.append(0)
+                self._value.append(None)
+                self._goto[node][char] = child
+
+            node = child
+
+        if not self._length[node]:
+            self._length[node] = len(pattern)
+            self._value[node] = value
+
+        self._built = False
+
+    def build(self):
+        """
+        Compute the failure and output links (breadth-first, so that the links of the parents are ready first).
+        """
+        queue = list(self._goto[0].values())
+
+        for child in queue:
+            self._fail[child] = 0
+            self._output[child] = child if self._length[child] else 0
+
+        i = 0
+
+        while i < len(queue):
+            node = queue[i]
+            i += 1
+
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] = child if self._length[child] else self._output[self._fail[child]]
+
+                queue.append(child)
+
+        self._built = True
+
+    def iter_matches(self, text):
+        """
+        Yield every occurrence of the patterns in the text.
+
+        :param text: The text to scan.
+        :type text: str
+        :return: Tuples (start, end, value) of the occurrences, ordered by end position.
+        :rtype: generator
+        """
+        if not self._built:
+            self.build()
+
+        goto, fail, output, length, value = self._goto, self._fail, self._output, self._length, self._value
+
+        node = 0
+
+        for i, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+
+            node = goto[node].get(char, 0)
+
+            match = output[node]
+
+            while match:
+                yield i + 1 - length[match], i + 1, value[match]
+                match = output[fail[match]]
+
+    def find(self, text):
+        """
+        Return the non-overlapping occurrences of the patterns, chosen with the leftmost-longest rule.
+
+        :param text: The text to scan.
+        :type text: str
+        :return: Tuples (start, end, value) of the chosen occurrences, ordered by position.
+        :rtype: list
+        """
+        longest = {}  # start position -> (end, value) of the longest pattern starting there
+
+        for start, end, value in self.iter_matches(text):
+            if start not in longest or end > longest[start][0]:
+                longest[start] = (end, value)
+
+        matches = []
+        position = 0
+
+        for start in sorted(longest):
+            if start >= position:
+                end, value = longest[start]
+                matches.append((start, end, value))
+                position = end
+
+        return matches
+
+
+def highlight_entities(text, entity_dict):
+    """
+    Highlight the entities in the text with different colors
+
+    :param text: The input text to highlight
+    :param entity_dict: A dictionary containing the entities and their corresponding words
+    :return: A tuple containing the highlighted text, color codes for each entity, and a list of the entities
+    """
+    colors = []
+    name_entities = []
+
+    automaton = Automaton()
+
+    # Loop through each entity in the dictionary
+    for i, (entity, words) in enumerate(entity_dict.items()):
+        # Generate a unique inline style for the entity
+        style = f"background-color: {HTML_COLORS[i % len(HTML_COLORS)]};"
+
+        colors.append(HTML_COLORS[i % len(HTML_COLORS)])
+        name_entities.append(entity)
+
+        # Register each word of the entity's list with the inline style of the entity
+        for word in words:
+            automaton.add(word, style)
+
+    # Scan the text once and wrap each chosen occurrence in a span tag
+    pieces = []
+    position = 0
+
+    for start, end, style in automaton.find(text):
+        pieces.append(text[position:start])
+        pieces.append(f"<span style='{style}'>{text[start:end]}</span>")
+        position = end
+
+    pieces.append(text[position:])
+
+    # Return the HTML string
+    return ''.join(pieces), colors, name_entities
@@ -0,0 +1,112 @@
+"""
+Client of the inference daemon of `server.py`.
+
+When `INFERENCE_SOCKET` is set in the settings, the web workers do not load the transformer and spaCy models: the
+question answering (`qa_engine.py`, `scheduler.py`) and the named entity recognition (`ner_engine.py`) send their
+work to the daemon listening on that Unix socket, and get the results back. The caches of the answers and of the
+entities stay in the web workers, so only the work that really needs a model leaves the process.
+
+Each thread of a worker keeps its own connection to the daemon, opened on first use and opened again if the daemon
+was restarted. The connections are authenticated with `INFERENCE_AUTHKEY` (default: the `SECRET_KEY`).
+
+    - `enabled()`: whether the work is sent to the daemon.
+    - `call(name, *args)`: runs a function of the daemon and returns its result, or raises `InferenceError`.
+"""
+
+import threading
+from multiprocessing.connection import Client
+
+from django.conf import settings
+
+
+# Default time to wait for the result of a call, in seconds
+DEFAULT_TIMEOUT = 600
+
+# Set by the daemon itself, which must run the models instead of calling itself
+serving = False
+
+_local = threading.local()
+
+
+class InferenceError(Exception):
+    """
+    Error raised by the daemon, or failure to reach it.
+    """
+
+
+def address():
+    """
+    Return the path of the Unix socket of the daemon (`INFERENCE_SOCKET` in the settings, None when there is no daemon).
+    """
+    return getattr(settings, 'INFERENCE_SOCKET', None)
+
+
+def authkey():
+    """
+    Return the key authenticating the connections (`INFERENCE_AUTHKEY` in the settings, default: the `SECRET_KEY`).
+    """
+    return (getattr(settings, 'INFERENCE_AUTHKEY', None) or settings.SECRET_KEY).encode('utf-8')
+
+
+def enabled():
+    """
+    Tell whether the work is sent to the inference daemon.
+    """
+    return bool(address()) and not serving
+
+
+def _connection():
+    connection = getattr(_local, 'connection', None)
+
+    if connection is None:
+        connection = _local.connection = Client(address(), family='AF_UNIX', authkey=authkey())
+
+    return connection
+
+
+def _close():
+    connection = getattr(_local, 'connection', None)
+    _local.connection = None
+
+    if connection is not None:
+        try:
+            connection.close()
+        except OSError:
+            pass
+
+
+def call(name, *args):
+    """
+    Run a function of the daemon.
+
+    :param name: The name of the function (see `server.HANDLERS`).
+    :type name: str
+    :param args: The arguments of the function.
+    :return: The result of the function.
+    :raises InferenceError: If the daemon cannot be reached, does not answer in `INFERENCE_TIMEOUT` seconds, or
+        fails to run the function.
+    """
+    timeout = getattr(settings, 'INFERENCE_TIMEOUT', DEFAULT_TIMEOUT)
+
+    # A connection broken by a restart of the daemon is opened again once
+    for attempt in range(2):
+        try:
+            connection = _connection()
+            connection.send((name, args))
+
+            if not connection.poll(timeout):
+                _close()
+                raise InferenceError("The inference daemon did not answer %s in %s seconds" % (name, timeout))
+
+            status, result = connection.recv()
+            break
+        except (EOFError, OSError) as e:
+            _close()
+
+            if attempt:
+                raise InferenceError("Cannot reach the inference daemon at %s: %s" % (address(), e)) from e
+
+    if status == 'error':
+        raise InferenceError(result)
+
+    return result
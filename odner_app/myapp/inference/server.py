@@ -0,0 +1,143 @@
+"""
+Inference daemon holding the transformer and spaCy models once for all the web workers.
+
+Every WSGI worker used to load its own copies of the question-answering and NER models, so the resident memory grew
+with the number of workers. With the daemon, the models live in a single process, started with:
+
+    python manage.py inference_server
+
+and the workers (with `INFERENCE_SOCKET` set to the same path) send it their work over a local Unix socket, with
+`client.py`. Each connection is served by its own thread, so the work of all the workers reaches the same
+micro-batching scheduler of `scheduler.py` and shares its forward passes; the daemon can use every core for the
+models (torch intra-op threads, `NER_N_PROCESS` processes for spaCy) without multiplying their memory.
+
+The functions served (`HANDLERS`) are the parts of the engines that need a model:
+
+    - `qa(model_name, inputs, batch_size)`: the question-answering pipeline over {'question', 'context'} items.
+    - `windows(model_name, items, max_length, stride, batch_size)`: the best answer of each window of the contexts
+      of (question, context) pairs (see `window_qa.answer_items`).
+    - `ner(text, language, chunk_size, batch_size, n_process)`: the entities of a text (see `ner_engine.ner_spans`).
+    - `ner_info(language)`: the name, version, labels and maximum length of the NER model of a language.
+    - `sentences(text, question)`: the sentence boundaries of a text, and the terms of its sentences and of the
+      question for the retrieval (see `spacy_loader.sentences`).
+    - `ping()`: checks that the daemon is up.
+
+The socket is created with the permissions `INFERENCE_SOCKET_MODE` (default 0o600: only the user running the daemon
+can connect). When the web workers run as another user, put both users in a group and set `INFERENCE_SOCKET_GROUP`
+to it with `INFERENCE_SOCKET_MODE = 0o660`; otherwise the calls of the workers fail with `InferenceError`
+("Permission denied"). The connections are authenticated with the key of `client.py` in any case.
+"""
+
+import grp
+import logging
+import os
+import threading
+from multiprocessing.connection import Listener
+
+from django.conf import settings
+
+from myapp.inference import client
+from myapp.nlp import ner_engine, spacy_loader
+from myapp.qa import scheduler, window_qa
+from myapp.qa.model_registry import get_qa_pipeline
+
+
+logger = logging.getLogger('appLog')
+
+# Default permissions of the socket: only the user running the daemon can connect
+DEFAULT_SOCKET_MODE = 0o600
+
+
+def qa(model_name, inputs, batch_size):
+    return scheduler.run(model_name, inputs, batch_size)
+
+
+def windows(model_name, items, max_length, stride, batch_size):
+    with scheduler.model_lock(model_name):
+        return window_qa.answer_items(get_qa_pipeline(model_name), items, max_length, stride, batch_size)
+
+
+def ner(text, language, chunk_size, batch_size, n_process):
+    # The entities are cached by the web workers
+    return ner_engine.ner_spans(text, language, chunk_size, batch_size, n_process, use_cache=False)
+
+
+def ner_info(language):
+    return spacy_loader.ner_info(language)
+
+
+def sentences(text, question):
+    return spacy_loader.sentences(text, question)
+
+
+def ping():
+    return 'pong'
+
+
+# Functions that the clients can call, by name
+HANDLERS = {'qa': qa, 'windows': windows, 'ner': ner, 'ner_info': ner_info, 'sentences': sentences,
+            'ping': ping}
+
+
+def serve_connection(connection):
+    """
+    Answer the calls of a client until it disconnects.
+
+    :param connection: The connection with the client.
+    :type connection: multiprocessing.connection.Connection
+    """
+    with connection:
+        while True:
+            try:
+                name, args = connection.recv()
+            except (EOFError, OSError):
+                return
+
+            try:
+                result = ('ok', HANDLERS[name](*args))
+            except Exception as e:
+                logger.exception("Inference call %s failed", name)
+                result = ('error', "%s: %s" % (type(e).__name__, e))
+
+            try:
+                connection.send(result)
+            except (EOFError, OSError):
+                return
+
+
+def serve(address=None):
+    """
+    Listen on the Unix socket and serve every client in its own thread, until the process is stopped.
+
+    :param address: The path of the socket (None reads `INFERENCE_SOCKET` from the settings).
+    :type address: str
+    """
+    # The daemon runs the models itself
+    client.serving = True
+
+    address = address or client.address()
+
+    # A socket left behind by a previous daemon prevents binding
+    if os.path.exists(address):
+        os.remove(address)
+
+    with Listener(address, family='AF_UNIX', authkey=client.authkey()) as listener:
+        # Only the user running the daemon, and the group of the web workers if configured, may connect
+        group = getattr(settings, 'INFERENCE_SOCKET_GROUP', None)
+
+        if group:
+            os.chown(address, -1, grp.getgrnam(group).gr_gid)
+
+        os.chmod(address, getattr(settings, 'INFERENCE_SOCKET_MODE', DEFAULT_SOCKET_MODE))
+
+        logger.info("Inference daemon listening on %s", address)
+
+        while True:
+            try:
+                connection = listener.accept()
+            except Exception as e:
+                # A client with a wrong key, or one that disconnected during the handshake
+                logger.warning("Inference connection refused: %s", e)
+                continue
+
+            threading.Thread(target=serve_connection, args=(connection,), daemon=True).start()
@@ -0,0 +1,51 @@
+"""
+This is a Django REST Framework view that returns the status of a background job (see myapp/jobs/job_queue.py).
+
+The upload, load-config and change-cnf endpoints return a job id instead of their result when they are called with
+async set (or when JOBS_ASYNC is set in the settings). The client polls this endpoint with the job id (parameter job)
+until the status is done or failed. The response contains the status (queued, running, done or failed), the current
+stage (extraction, translation, ner, qa) and its progress between 0 and 1, the result (the response the endpoint would
+have returned) or the error, the number of attempts and the times the job was created, started and finished.
+"""
+
+from django.http import JsonResponse
+from rest_framework import generics
+
+from myapp.jobs import job_queue
+
+
+class JobStatus(generics.CreateAPIView):
+
+    def get(self, request, *args, **kwargs):
+        """
+        Endpoint to poll the status of a job, with the job id in the query string.
+        """
+        return self.status(request.query_params.get('job', None))
+
+    def post(self, request, *args, **kwargs):
+        """
+        Endpoint to poll the status of a job.
+
+        :param request: HTTP request object.
+        :type request: HttpRequest object.
+
+        :returns: JSON response object.
+        :rtype: JsonResponse object.
+        """
+        return self.status(request.data.get('job', None))
+
+    def status(self, job_id):
+        """
+        Return the status of a job as a JSON response.
+        """
+        try:
+            job_id = int(job_id)
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'No job given'}, status=400)
+
+        result = job_queue.status(job_id)
+
+        if result is None:
+            return JsonResponse({'error': 'No such job'}, status=404)
+
+        return JsonResponse(result)
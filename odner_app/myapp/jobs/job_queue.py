@@ -0,0 +1,320 @@
+"""
+Database-backed queue of background jobs.
+
+The upload views (`PDFUploadView`, `DOCUploadView`, `XLSXUploadView`, `TXTUploadView`), `LoadConfig` and
+`configChange` do the extraction, translation, NER and QA of a document inside the HTTP request. With the `async`
+parameter (or `JOBS_ASYNC = True` in the settings) they return a job id at once instead, and the work is done by
+worker processes started with (`BulkNER`, which processes a whole archive, always runs in the background unless
+`async` is false):
+
+    python manage.py run_jobs --workers 2
+
+A job replays the request of the view in a worker: its data is stored as JSON in the `Job` model, its uploaded files
+are spooled to `JOBS_SPOOL_DIR`, and the JSON response of the view becomes the result of the job. The queue lives in
+the database, so it survives the restarts of the web and worker processes, and the workers are scaled independently
+of the web workers:
+
+    - a worker claims the oldest queued job with a conditional update, so that two workers never run the same job;
+    - a running job reports its stage and progress (`report`, called by the extraction, translation, NER and QA
+      engines), and its worker updates its heartbeat; a job whose heartbeat is older than `JOBS_STALE_AFTER` seconds
+      (e.g. its worker was killed) is queued again, up to `JOBS_MAX_ATTEMPTS` times;
+    - the status, stage, progress and result of a job are read with /api/job-status/.
+
+    - `defer(view, request, default)`: called at the start of the views, queues the request when it asks to run in the
+      background.
+    - `claim(worker)` / `run(job)`: take the next job and run it.
+    - `report(stage, done, total)`: reports the progress of the current job (no-op outside a job).
+"""
+
+import importlib
+import json
+import os
+import shutil
+import threading
+import time
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connection, transaction
+from django.db.models import F
+from django.http import JsonResponse
+from django.utils import timezone
+
+from myapp.models import Job
+
+
+# Default folder of the spooled uploaded files
+DEFAULT_SPOOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spool')
+
+# Default number of seconds without report after which a running job is considered abandoned
+DEFAULT_STALE_AFTER = 600
+
+# Default number of times a job is started before it is marked as failed
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Minimum number of seconds between two progress updates of the same stage
+PROGRESS_INTERVAL = 1.0
+
+# Values of the `async` parameter that ask for a background job
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+_local = threading.local()  # job run by the current thread, and time of its last progress update
+
+
+def spool_dir():
+    """
+    Return the folder of the spooled uploaded files (`JOBS_SPOOL_DIR` in the settings).
+    """
+    return getattr(settings, 'JOBS_SPOOL_DIR', None) or DEFAULT_SPOOL_DIR
+
+
+def current_job():
+    """
+    Return the id of the job run by the current thread (None outside a job).
+    """
+    return getattr(_local, 'job', None)
+
+
+def requested(request, default=None):
+    """
+    Tell whether a request asks to run in the background (`async` parameter, default `default`, or `JOBS_ASYNC` in the
+    settings when None).
+    """
+    value = request.data.get('async', None)
+
+    if value is None or value == '':
+        return getattr(settings, 'JOBS_ASYNC', False) if default is None else default
+
+    return str(value).lower() in TRUE_VALUES
+
+
+def defer(view, request, default=None):
+    """
+    Queue the request of a view as a background job, if it asks to.
+
+    :param view: The view handling the request.
+    :type view: rest_framework.views.APIView
+    :param request: The request.
+    :type request: rest_framework.request.Request
+    :param default: Whether to run in the background when the request does not say (None reads `JOBS_ASYNC`).
+    :type default: bool
+    :return: The response with the id of the job, or None when the request must be handled now (it does not ask to
+        run in the background, or it is already run by a worker).
+    :rtype: JsonResponse
+    """
+    if current_job() is not None or not requested(request, default):
+        return None
+
+    # The uploaded files are copied to the spool folder, where the worker finds them
+    folder = os.path.join(spool_dir(), uuid.uuid4().hex)
+    files = {}
+
+    for name, uploaded_file in request.FILES.items():
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, os.path.basename(uploaded_file.name))
+
+        with open(path, 'wb') as out:
+            for chunk in uploaded_file.chunks():
+                out.write(chunk)
+
+        files[name] = path
+
+    payload = {key: request.data.get(key) for key in request.data.keys()
+               if key not in request.FILES and key != 'async'}
+
+    view_path = '%s.%s' % (type(view).__module__, type(view).__name__)
+
+    with transaction.atomic():
+        job = Job.objects.create(view=view_path, payload=json.dumps(payload), files=json.dumps(files))
+
+    return JsonResponse({'job': job.id, 'status': job.status}, status=202)
+
+
+class JobRequest:
+    """
+    The request of a job, as seen by the view: its data and its uploaded files.
+    """
+
+    def __init__(self, data, files):
+        self.data = data
+        self.FILES = files
+        self.query_params = {}
+
+
+def worker_name():
+    """
+    Return the name of the current worker process.
+    """
+    return '%s:%d' % (os.uname().nodename, os.getpid())
+
+
+def requeue_stale():
+    """
+    Queue again the running jobs whose worker stopped reporting, or mark them as failed after too many attempts.
+
+    :return: The number of jobs queued again.
+    :rtype: int
+    """
+    stale_after = getattr(settings, 'JOBS_STALE_AFTER', DEFAULT_STALE_AFTER)
+    max_attempts = getattr(settings, 'JOBS_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+
+    limit = timezone.now() - timedelta(seconds=stale_after)
+    stale = Job.objects.filter(status=Job.RUNNING, heartbeat__lt=limit)
+
+    with transaction.atomic():
+        stale.filter(attempts__gte=max_attempts).update(
+            status=Job.FAILED, error="The worker stopped %d times while running the job" % max_attempts,
+            finished=timezone.now())
+
+        return stale.filter(attempts__lt=max_attempts).update(status=Job.QUEUED, worker='')
+
+
+def claim(worker=None):
+    """
+    Take the oldest queued job.
+
+    :param worker: The name of the worker (None: the current process).
+    :type worker: str
+    :return: The job, now running, or None when the queue is empty.
+    :rtype: Job
+    """
+    worker = worker or worker_name()
+
+    for job_id in Job.objects.filter(status=Job.QUEUED).order_by('created', 'id').values_list('id', flat=True)[:10]:
+        now = timezone.now()
+
+        # Only one worker succeeds in moving the job out of the queued status
+        with transaction.atomic():
+            claimed = Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+                status=Job.RUNNING, worker=worker, started=now, heartbeat=now, stage='', progress=0.0,
+                attempts=F('attempts') + 1)
+
+        if claimed:
+            return Job.objects.get(id=job_id)
+
+    return None
+
+
+def load_view(path):
+    """
+    Return the view class from its dotted path.
+    """
+    module, name = path.rsplit('.', 1)
+
+    return getattr(importlib.import_module(module), name)
+
+
+def heartbeat(job_id, stop):
+    """
+    Update the heartbeat of a running job until `stop` is set, so that a long stage without progress reports is not
+    taken for an abandoned job.
+    """
+    interval = getattr(settings, 'JOBS_STALE_AFTER', DEFAULT_STALE_AFTER) / 4
+
+    try:
+        while not stop.wait(interval):
+            Job.objects.filter(id=job_id, status=Job.RUNNING).update(heartbeat=timezone.now())
+    finally:
+        connection.close()
+
+
+def run(job):
+    """
+    Run a claimed job: replay its request in its view, and store the response or the error.
+
+    :param job: The job.
+    :type job: Job
+    :return: Whether the job succeeded.
+    :rtype: bool
+    """
+    files = json.loads(job.files or '{}')
+    opened = {name: open(path, 'rb') for name, path in files.items()}
+
+    _local.job = job.id
+    _local.last = (None, 0.0)
+
+    stop = threading.Event()
+    threading.Thread(target=heartbeat, args=(job.id, stop), daemon=True).start()
+
+    try:
+        request = JobRequest(json.loads(job.payload),
+                             {name: File(f, name=os.path.basename(files[name])) for name, f in opened.items()})
+
+        response = load_view(job.view)().post(request)
+
+        result = response.content.decode('utf-8')
+        status = Job.DONE if response.status_code < 400 else Job.FAILED
+
+        with transaction.atomic():
+            Job.objects.filter(id=job.id).update(status=status, result=result, progress=1.0, finished=timezone.now())
+
+        return status == Job.DONE
+
+    except Exception:
+        with transaction.atomic():
+            Job.objects.filter(id=job.id).update(status=Job.FAILED, error=traceback.format_exc(),
+                                                 finished=timezone.now())
+        return False
+
+    finally:
+        stop.set()
+        _local.job = None
+
+        for f in opened.values():
+            f.close()
+
+        for path in files.values():
+            shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+
+def report(stage, done=None, total=None):
+    """
+    Report the progress of the job run by the current thread (no-op outside a job).
+
+    The updates of the same stage are sent at most once per second.
+
+    :param stage: The current stage (e.g. 'extraction', 'translation', 'ner', 'qa').
+    :type stage: str
+    :param done: The number of steps of the stage done.
+    :type done: int
+    :param total: The number of steps of the stage.
+    :type total: int
+    """
+    job_id = current_job()
+
+    if job_id is None:
+        return
+
+    last_stage, last_time = getattr(_local, 'last', (None, 0.0))
+    now = time.monotonic()
+
+    if stage == last_stage and now - last_time < PROGRESS_INTERVAL and done != total:
+        return
+
+    _local.last = (stage, now)
+
+    progress = min(1.0, done / total) if done is not None and total else 0.0
+
+    Job.objects.filter(id=job_id).update(stage=stage, progress=progress, heartbeat=timezone.now())
+
+
+def status(job_id):
+    """
+    Return the status of a job, as returned by /api/job-status/.
+
+    :param job_id: The id of the job.
+    :type job_id: int
+    :return: The status, stage, progress, result and error of the job, or None if there is no such job.
+    :rtype: dict
+    """
+    job = Job.objects.filter(id=job_id).first()
+
+    if job is None:
+        return None
+
+    return {'job': job.id, 'status': job.status, 'stage': job.stage, 'progress': job.progress,
+            'result': json.loads(job.result) if job.result else None, 'error': job.error,
+            'attempts': job.attempts, 'created': job.created, 'started': job.started, 'finished': job.finished}
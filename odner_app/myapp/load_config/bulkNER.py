@@ -0,0 +1,173 @@
+"""
+This is a Django REST Framework view that pre-computes the Named Entity Recognition (NER) of many documents at once,
+e.g. a whole contract archive overnight, so that loading their configuration later does not run NER anymore.
+
+The endpoint receives a POST request with the following parameters: file_txt_paths (the list of the .txt files of the
+documents, or its JSON string), language, and overwrite (optional, recompute the documents that already have an NER object).
+A whole archive takes far longer than an HTTP request may last, so the request is queued as a background job (see
+myapp/jobs/job_queue.py) and the view returns its id at once; its progress and result are read with /api/job-status/.
+With async set to false, the documents are processed inside the request instead.
+The job performs the following steps:
+
+The documents that already have an NER object are skipped, unless overwrite is set, and the missing files are reported.
+The texts of the other documents are read lazily and streamed through `nlp.pipe` (see myapp/nlp/ner_engine.py), in
+batches and optionally over several processes (`NER_BATCH_SIZE` and `NER_N_PROCESS` settings).
+For each document, the dictionary of the named entities is saved in the JSONDicts directory and the NER object is
+created (or updated) exactly as the load-config endpoint does with the base configuration of the language, with the
+uploaded document the text was extracted from as its raw file; the
+entities are also kept in the state of the document, so that its first edit is refreshed incrementally
+(see myapp/nlp/incremental.py).
+The result is the lists of the processed, skipped and missing documents.
+"""
+
+import json
+import os
+import re
+
+from django.db import transaction
+from django.http import JsonResponse
+from rest_framework import generics
+
+from myapp.jobs import job_queue
+from myapp.load_config.loadConfig import DictToJSON, json_to_string
+from myapp.models import DOC, NER, PDF, XLSX, Config
+from myapp.nlp import incremental
+from myapp.nlp.ner_engine import iter_ner_spans
+
+
+def read_text(txt_file_path):
+    """
+    Read the text of a document.
+
+    :param txt_file_path: The path of the .txt file of the document.
+    :type txt_file_path: str
+    :return: The text of the document.
+    :rtype: str
+    """
+    with open(txt_file_path, "r") as f:
+        return f.read()
+
+
+def uploaded_title(txt_file_path):
+    """
+    Return the title of the uploaded document whose text is in a .txt file, as the frontend sends it to the load-config
+    endpoint (`f_up`).
+
+    :param txt_file_path: The path of the .txt file of the document.
+    :type txt_file_path: str
+    :return: The title of the PDF, DOCX or XLSX document, '' if the text was not extracted from an uploaded document.
+    :rtype: str
+    """
+    for model, field in ((PDF, 'txt_file_pdf'), (DOC, 'txt_file_docx'), (XLSX, 'txt_file_xlsx')):
+        for language in ('it', 'en'):
+            documents = model.objects.filter(**{field + '_' + language: txt_file_path})
+            title = documents.values_list('title', flat=True).first()
+
+            if title:
+                return title
+
+    return ''
+
+
+class BulkNER(generics.CreateAPIView):
+
+    def post(self, request, *args, **kwargs):
+        """
+        Endpoint to pre-compute the NER of many documents.
+
+        :param request: HTTP request object.
+        :type request: HttpRequest object.
+
+        :returns: JSON response object with the id of the job, or the processed, skipped and missing documents.
+        :rtype: JsonResponse object.
+        """
+
+        # Get input data from the request.
+        txt_file_paths = request.data.get('file_txt_paths', None)
+        language = request.data.get('language', None)
+        overwrite = str(request.data.get('overwrite', '')).lower() in ('1', 'true', 'yes')
+
+        if not txt_file_paths:
+            return JsonResponse({'error': 'No file_txt_paths given'})
+
+        # Run in the background unless the request asks not to (see myapp/jobs/job_queue.py)
+        deferred = job_queue.defer(self, request, default=True)
+
+        if deferred is not None:
+            return deferred
+
+        if isinstance(txt_file_paths, str):
+            txt_file_paths = json.loads(txt_file_paths)
+
+        # Base configuration of the language, as in LoadConfig.
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+
+        if language == 'en':
+            file_config = base_dir + '/json_configs' + '/base-en.json'
+            suffix = 'base-en'
+        else:
+            file_config = base_dir + '/json_configs' + '/base-it.json'
+            suffix = 'base-it'
+
+        ner_str = json_to_string(file_config)
+        current_model = Config.objects.filter(title=file_config).first().entity_model
+
+        to_process = []
+        skipped = []
+        missing = []
+
+        for txt_file_path in txt_file_paths:
+            # Fix file path format for Windows.
+            txt_file_path = re.sub("/C%3A", "C:", txt_file_path)
+
+            if not os.path.exists(txt_file_path):
+                missing.append(txt_file_path)
+            elif not overwrite and NER.objects.filter(title=txt_file_path).exists():
+                skipped.append(txt_file_path)
+            else:
+                to_process.append(txt_file_path)
+
+        processed = []
+
+        # The texts are read one at a time, while nlp.pipe consumes them; each one is kept until its entities are back
+        read = {}
+
+        def texts():
+            for txt_file_path in to_process:
+                read[txt_file_path] = read_text(txt_file_path)
+                yield read[txt_file_path]
+
+        for txt_file_path, spans in zip(to_process, iter_ner_spans(texts(), language)):
+            path = txt_file_path.split('/')[-1]
+            path = path[:-6]
+
+            file_path_json_dict = base_dir + '/JSONDicts/' + path + suffix + '.json'
+
+            # Convert dict to JSON and write to file.
+            DictToJSON(incremental.entities_dict(spans, language), file_path_json_dict)
+
+            # Keep the entities, so that the first edit of the document is refreshed incrementally
+            incremental.record(incremental.state_path(file_path_json_dict), read.pop(txt_file_path), language, spans)
+
+            fields = {
+                'jsonDict': file_path_json_dict,
+                'jsonNER': file_config,
+                'language': language,
+                'jsonner_str': ner_str,
+                'jsondict_str': json_to_string(file_path_json_dict),
+                'entity_model_current': current_model,
+            }
+
+            ner_to_update = NER.objects.select_for_update().filter(title=txt_file_path)
+
+            with transaction.atomic():
+                if ner_to_update.exists():
+                    ner_to_update.update(**fields)
+                else:
+                    NER.objects.create(title=txt_file_path, raw_file=uploaded_title(txt_file_path), **fields)
+
+            processed.append(txt_file_path)
+
+            job_queue.report('ner', len(processed), len(to_process))
+
+        return JsonResponse({'processed': processed, 'skipped': skipped, 'missing': missing})
@@ -1,6 +1,5 @@
 """
 The utility functions in this script are:
-    - ner(txt_to_ner, language): performs Named Entity Recognition (NER) on text using Spacy and returns the named entities as a dictionary.
     - DictToJSON: a function that takes a dictionary and a filename, and writes the contents of the dictionary to a JSON file with the given filename.
     - JSONToDict: a function that takes a filename and returns a dictionary containing the contents of the JSON file with the given filename.
     - json_to_string: a function that takes a file path and returns a string representation of the JSON data in the file.
@@ -22,46 +21,18 @@ configChange: a class-based view that handles POST requests for configuration ch
 
 from django.http import JsonResponse
 from rest_framework import generics
+from myapp.jobs import job_queue
 from myapp.models import NER, Config
+from myapp.nlp import incremental
 import json
 import os
-from transformers import pipeline
+from myapp.qa import qa_engine
 import re
 from django.db import transaction
-import spacy
 import threading
 from functools import wraps
 
 
-def ner(txt_to_ner, language):
-    """
-    Performs Named Entity Recognition (NER) on text.
-
-    :param
-        txt_to_ner (str): The text to perform NER on.
-        language (str): The language of the text to be processed. Supported languages are 'en' for English and 'it' for Italian.
-
-    :return
-        dict: A dictionary where keys are named entity labels and values are lists of named entities for each label.
-    """
-    if language == 'it':
-        nlp = spacy.load("it_core_news_lg")
-    else:
-        nlp = spacy.load("en_core_web_lg")
-
-    # perform NER on text
-    doc = nlp(txt_to_ner)
-
-    # create dictionary to store named entities by label
-    tmp = {label: [] for label in nlp.get_pipe('ner').labels}
-
-    # loop through named entities and store them in the dictionary by label
-    for ent in doc.ents:
-        tmp[ent.label_].append(ent.text)
-
-    return tmp
-
-
 def thread_safe(func):
     lock = threading.RLock()
 
@@ -137,6 +108,12 @@ class configChange(generics.CreateAPIView):
         :rtype: JsonResponse
         """
 
+        # Run in the background when the request asks to (see myapp/jobs/job_queue.py)
+        deferred = job_queue.defer(self, request)
+
+        if deferred is not None:
+            return deferred
+
         # Get text file, text to perform qa and extract the NER, filename of the configuration and the language
         txt_file_path = request.data.get('txt', None)
 
@@ -206,28 +183,29 @@ class configChange(generics.CreateAPIView):
             # Retrieve config-base dictionary
             dict_b = JSONToDict(path_base_dict)
 
-            for key in em.keys():
-                if em[key] != 'Spacy':
-                    if key not in dict_b.keys():
+            # Answer the entities missing from the base dictionary, with one batched call per model
+            keys = [key for key in em.keys() if key not in dict_b.keys()]
 
-                        question = dict_question[key] 
+            # Not serialized: the work of concurrent requests is micro-batched per model by the QA scheduler
+            results = qa_engine.answer_entities(em, dict_question, context, keys)
 
+            for key, result in results.items():
 
-                        with self.lock:
+                answer = result['answer']
 
-                            qa = pipeline("question-answering", model=em[key])
+                dict_b[key] = []
 
-                            result = qa(question=question, context=context)
-
-                        answer = result['answer']
-
-                        dict_b[key] = []
-
-                        dict_b[key].append(answer)
+                dict_b[key].append(answer)
             
             # Write the modified dictionary back to the JSON file
             DictToJSON(dict_b, path_final)
 
+            # Keep the answers with the entities of the document, for the incremental refresh of the next edit
+            with self.lock:
+                incremental.record(incremental.state_path(path_base_dict), context, language,
+                                   qa={key: incremental.answer_state(em[key], dict_question[key], result)
+                                       for key, result in results.items()})
+
             str_dict = json_to_string(path_final)
 
             str_em = json.dumps(em)
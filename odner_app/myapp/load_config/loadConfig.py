@@ -19,16 +19,18 @@ that there are directories named json_configs and JSONDicts in the same director
 
 from django.http import JsonResponse
 from rest_framework import generics
+from myapp.jobs import job_queue
 from myapp.models import NER, Config
 from myapp.serializers.config_serializer import NERserializer
 import json
 import os
-import spacy
+from myapp.nlp import incremental
+from myapp.nlp.ner_engine import ner_spans
 import re
 from django.db import transaction
 import threading
 from functools import wraps
-from transformers import pipeline
+from myapp.qa import qa_engine
 
 def thread_safe(func):
     lock = threading.RLock()
@@ -86,34 +88,6 @@ def DictToJSON(my_dict, filename):
         json.dump(my_dict, json_file)
 
  
-def ner(txt_to_ner, language):
-    """
-    Performs Named Entity Recognition (NER) on text.
-
-    :param
-        txt_to_ner (str): The text to perform NER on.
-        language (str): The language of the text to be processed. Supported languages are 'en' for English and 'it' for Italian.
-
-    :return
-        dict: A dictionary where keys are named entity labels and values are lists of named entities for each label.
-    """
-    if language == 'it':
-        nlp = spacy.load("it_core_news_lg")
-    else:
-        nlp = spacy.load("en_core_web_lg")
-
-    # perform NER on text
-    doc = nlp(txt_to_ner)
-
-    # create dictionary to store named entities by label
-    tmp = {label: [] for label in nlp.get_pipe('ner').labels}
-
-    # loop through named entities and store them in the dictionary by label
-    for ent in doc.ents:
-        tmp[ent.label_].append(ent.text)
-
-    return tmp
-
 class LoadConfig(generics.CreateAPIView):
 
     lock = threading.RLock()
@@ -129,6 +103,12 @@ class LoadConfig(generics.CreateAPIView):
         :rtype: JsonResponse object.
         """
 
+        # Run in the background when the request asks to (see myapp/jobs/job_queue.py)
+        deferred = job_queue.defer(self, request)
+
+        if deferred is not None:
+            return deferred
+
         
 
         # Get input data from the request.
@@ -161,11 +141,16 @@ class LoadConfig(generics.CreateAPIView):
 
         if ner_obj is None:
             # Run NER and create JSON file.
-            dict = ner(text, language)
+            spans = ner_spans(text, language)
+            dict = incremental.entities_dict(spans, language)
 
             # Convert dict to JSON and write to file.
             DictToJSON(dict, file_path_json_dict)
 
+            # Keep the entities, so that the first edit of the document is refreshed incrementally
+            with self.lock:
+                incremental.record(incremental.state_path(file_path_json_dict), text, language, spans)
+
             # Convert config and JSON dictionary files to strings.
             ner_str = json_to_string(file_config)
             dict_str = json_to_string(file_path_json_dict)
@@ -213,23 +198,25 @@ class LoadConfig(generics.CreateAPIView):
                             text = out.read()
                     
 
-                    for key in em.keys():
-                        if (key not in dict_json.keys()) & (em[key] != "Spacy"):
-
-                            question = dict_question[key]
+                    # Answer the missing entities, with one batched call per model
+                    keys = [key for key in em.keys() if key not in dict_json.keys()]
 
+                    # Not serialized: the work of concurrent requests is micro-batched per model by the QA scheduler
+                    results = qa_engine.answer_entities(em, dict_question, text, keys)
 
-                            with self.lock:
+                    for key, result in results.items():
 
-                                qa = pipeline("question-answering", model=em[key])
+                        answer = result['answer']
 
-                                result = qa(question=question, context=text)
+                        dict_json[key] = []
 
-                            answer = result['answer']
+                        dict_json[key].append(answer)
 
-                            dict_json[key] = []
-
-                            dict_json[key].append(answer)
+                    # Keep the answers with the entities of the document, for the incremental refresh of the next edit
+                    with self.lock:
+                        incremental.record(incremental.state_path(file_path_json_dict), text, language,
+                                           qa={key: incremental.answer_state(em[key], dict_question[key], result)
+                                               for key, result in results.items()})
 
                     # Write the modified dictionary back to the JSON file
                     DictToJSON(dict_json, ner_obj.jsonDict.name)
@@ -255,11 +242,16 @@ class LoadConfig(generics.CreateAPIView):
 
                 else:
                     # Run NER and create JSON file.
-                    dict = ner(text, language)
+                    spans = ner_spans(text, language)
+                    dict = incremental.entities_dict(spans, language)
 
                     # Convert dict to JSON and write to file.
                     DictToJSON(dict, file_path_json_dict)
 
+                    # Keep the entities, so that the first edit of the document is refreshed incrementally
+                    with self.lock:
+                        incremental.record(incremental.state_path(file_path_json_dict), text, language, spans)
+
                     # Convert config and JSON dictionary files to strings.
                     ner_str = json_to_string(file_config)
                     dict_str = json_to_string(file_path_json_dict)
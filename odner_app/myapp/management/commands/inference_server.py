@@ -0,0 +1,42 @@
+"""
+Start the inference daemon of myapp/inference/server.py:
+
+    python manage.py inference_server --qa ../fine-tuning/bert-finetuned-squad-accelerate --ner it en
+
+The web workers send it their question-answering and NER work when `INFERENCE_SOCKET` is set to the same socket.
+They must run as the same user as the daemon, or share the group set by `INFERENCE_SOCKET_GROUP` (with
+`INFERENCE_SOCKET_MODE = 0o660`).
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.inference import server
+from myapp.nlp import spacy_loader
+from myapp.qa.model_registry import get_qa_pipeline
+
+
+class Command(BaseCommand):
+    help = "Serve the question-answering and NER models to the web workers over a Unix socket."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=None, help="path of the socket (default: INFERENCE_SOCKET)")
+        parser.add_argument('--qa', nargs='*', default=[], help="question-answering models to load at start-up")
+        parser.add_argument('--ner', nargs='*', default=[], help="languages whose NER model is loaded at start-up")
+
+    def handle(self, *args, **options):
+        address = options['socket'] or getattr(settings, 'INFERENCE_SOCKET', None)
+
+        if not address:
+            raise CommandError("No socket: set INFERENCE_SOCKET in the settings or pass --socket")
+
+        # The models loaded now do not delay the first requests
+        for model_name in options['qa']:
+            get_qa_pipeline(model_name)
+
+        for language in options['ner']:
+            spacy_loader.ner_nlp(language)
+
+        self.stdout.write("Inference daemon listening on %s" % address)
+
+        server.serve(address)
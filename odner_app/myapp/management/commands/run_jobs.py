@@ -0,0 +1,66 @@
+"""
+Run the workers of the background job queue of myapp/jobs/job_queue.py:
+
+    python manage.py run_jobs --workers 2
+
+Each worker takes the oldest queued job, runs it and starts again; it sleeps for `JOBS_POLL_INTERVAL` seconds when the
+queue is empty. The workers can be started on several machines sharing the same database.
+"""
+
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from myapp.jobs import job_queue
+
+
+# Default number of seconds between two looks at an empty queue
+DEFAULT_POLL_INTERVAL = 1.0
+
+
+def work(once=False):
+    """
+    Run the queued jobs, forever (or until the queue is empty with `once`).
+    """
+    interval = getattr(settings, 'JOBS_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+
+    while True:
+        job_queue.requeue_stale()
+
+        job = job_queue.claim()
+
+        if job is None:
+            if once:
+                return
+            time.sleep(interval)
+            continue
+
+        job_queue.run(job)
+
+
+class Command(BaseCommand):
+    help = "Run the workers of the background job queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help="number of worker processes")
+        parser.add_argument('--once', action='store_true', help="exit when the queue is empty")
+
+    def handle(self, *args, **options):
+        if options['workers'] <= 1:
+            work(options['once'])
+            return
+
+        # The database connections must not be shared with the child processes
+        connections.close_all()
+
+        processes = [multiprocessing.Process(target=work, args=(options['once'],))
+                     for _ in range(options['workers'])]
+
+        for process in processes:
+            process.start()
+
+        for process in processes:
+            process.join()
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.1 on 2026-10-18 15:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("myapp", "0021_remove_config_entity_question"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QAAnswer",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=64, unique=True)),
+                ("model_name", models.CharField(max_length=200)),
+                ("model_revision", models.CharField(blank=True, max_length=200)),
+                ("question", models.TextField()),
+                ("context_hash", models.CharField(db_index=True, max_length=64)),
+                ("answer", models.TextField(blank=True)),
+                ("score", models.FloatField()),
+                ("start", models.IntegerField()),
+                ("end", models.IntegerField()),
+                ("last_used", models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+    ]
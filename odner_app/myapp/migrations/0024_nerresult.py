@@ -0,0 +1,33 @@
+# Generated by Django 4.2.1 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("myapp", "0023_translationmemory"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NERResult",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=64, unique=True)),
+                ("model_name", models.CharField(max_length=200)),
+                ("model_version", models.CharField(blank=True, max_length=50)),
+                ("text_hash", models.CharField(db_index=True, max_length=64)),
+                ("spans", models.TextField()),
+                ("last_used", models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -1,5 +1,5 @@
 """
-The code defines six Django models to store different types of data:
+The code defines ten Django models to store different types of data:
 
 1. `PDF`: A model for PDF files. It has fields for storing the title of the document, the PDF file itself, and the extracted and translated text in Italian and English. It also has fields for storing the processed Italian and English text in `.txt` format.
 
@@ -13,6 +13,14 @@ The code defines six Django models to store different types of data:
 
 6. `Config`: A model for storing information about a configuration file. It has fields for storing the title/path of the configuration file, the configuration JSON file, the current configuration's `json_str`, the language of the configuration file, and the entity model JSON string.
 
+7. `QAAnswer`: A model caching the answers of the question-answering models. It has fields for storing the model name and revision, the normalized question, the SHA-256 hash of the context, the answer with its score and offsets, and the last time the answer was used.
+
+8. `TranslationMemory`: A model for storing the sentences already translated. It has fields for storing the source and target languages, the sentence, and its translation, keyed by the SHA-256 hash of the three.
+
+9. `NERResult`: A model caching the named entities of the texts. It has fields for storing the spaCy model name and version, the SHA-256 hash of the text, the entities with their offsets as a JSON string, and the last time the entities were used.
+
+10. `Job`: A model for the background jobs (uploads, NER and configuration processing run outside the HTTP request). It has fields for storing the view that runs the job, its request data and uploaded files, its status, current stage and progress, its result or error, and the times it was created, started, last reported and finished.
+
 """
 
 from django.db import models
@@ -159,3 +167,101 @@ class Config(models.Model):
         Returns a string representation of the Config object.
         """
         return self.title
+
+
+class QAAnswer(models.Model):
+    """
+    A Django model to cache the answers of the question-answering models.
+    """
+    key = models.CharField(
+        max_length=64, unique=True)  # SHA-256 of (model, revision, normalized question, context hash)
+    model_name = models.CharField(max_length=200)  # Name (or path) of the question-answering model
+    model_revision = models.CharField(max_length=200, blank=True)  # Revision of the model
+    question = models.TextField()  # Normalized question
+    context_hash = models.CharField(
+        max_length=64, db_index=True)  # SHA-256 of the context
+    answer = models.TextField(blank=True)  # Answer extracted from the context
+    score = models.FloatField()  # Score of the answer
+    start = models.IntegerField()  # Start offset of the answer in the context
+    end = models.IntegerField()  # End offset of the answer in the context
+    last_used = models.DateTimeField(
+        auto_now=True, db_index=True)  # Last time the answer was stored or read (for the eviction)
+
+    def __str__(self):
+        """
+        Returns a string representation of the cached answer.
+        """
+        return self.question
+
+
+class TranslationMemory(models.Model):
+    """
+    A Django model to store the sentences already translated (translation memory).
+    """
+    key = models.CharField(
+        max_length=64, unique=True)  # SHA-256 of (source language, target language, sentence)
+    source = models.CharField(max_length=10)  # Language of the sentence
+    target = models.CharField(max_length=10)  # Language of the translation
+    text = models.TextField()  # Sentence to translate
+    translation = models.TextField(blank=True)  # Translated sentence
+
+    def __str__(self):
+        """
+        Returns a string representation of the translated sentence.
+        """
+        return self.text
+
+
+class NERResult(models.Model):
+    """
+    A Django model to cache the named entities of the texts.
+    """
+    key = models.CharField(
+        max_length=64, unique=True)  # SHA-256 of (model, model version, chunk size, text hash)
+    model_name = models.CharField(max_length=200)  # Name of the spaCy model
+    model_version = models.CharField(max_length=50, blank=True)  # Version of the spaCy model
+    text_hash = models.CharField(
+        max_length=64, db_index=True)  # SHA-256 of the text
+    spans = models.TextField()  # JSON list of the [start, end, label, text] entities
+    last_used = models.DateTimeField(
+        auto_now=True, db_index=True)  # Last time the entities were stored or read (for the eviction)
+
+    def __str__(self):
+        """
+        Returns a string representation of the cached entities.
+        """
+        return self.text_hash
+
+
+class Job(models.Model):
+    """
+    A Django model for the background jobs of the job queue (see myapp/jobs/job_queue.py).
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    view = models.CharField(max_length=200)  # Dotted path of the view that runs the job
+    payload = models.TextField()  # JSON of the request data
+    files = models.TextField(blank=True)  # JSON of the spooled uploaded files: name -> path
+    status = models.CharField(
+        max_length=10, choices=STATUSES, default=QUEUED, db_index=True)  # Status of the job
+    stage = models.CharField(max_length=50, blank=True)  # Current stage (extraction, translation, ner, qa, ...)
+    progress = models.FloatField(default=0.0)  # Progress of the current stage, between 0 and 1
+    result = models.TextField(blank=True)  # JSON response of the view
+    error = models.TextField(blank=True)  # Error of a failed job
+    attempts = models.IntegerField(default=0)  # Number of times the job was started
+    worker = models.CharField(max_length=100, blank=True)  # Worker process running the job
+    created = models.DateTimeField(auto_now_add=True)  # Time the job was queued
+    started = models.DateTimeField(null=True, blank=True)  # Time the job was last started
+    heartbeat = models.DateTimeField(null=True, blank=True)  # Last time the worker reported on the job
+    finished = models.DateTimeField(null=True, blank=True)  # Time the job finished
+
+    def __str__(self):
+        """
+        Returns a string representation of the job.
+        """
+        return '%s %s' % (self.view, self.status)
@@ -0,0 +1,325 @@
+"""
+Incremental refresh of the entities and of the answers of a document after an edit.
+
+Fixing a typo in a long contract must not re-run NER and every question-answering model over the whole text. The
+entities of the text (with their offsets, see `ner_engine.ner_spans`) and the answers of the configured questions are
+kept in a state file next to the JSONDicts of the document, together with the hash of the text they were computed on.
+When the text is edited:
+
+    - `changed_region(old, new)`: the common prefix and suffix of the two versions delimit the changed region, which is
+      then widened to whole paragraphs/sentences (and to any entity it cuts);
+    - `update_spans(old_spans, old, new, language)`: NER runs only on the changed paragraphs; the entities before them
+      are kept as they are, the ones after them are shifted by the change of length;
+    - `answer_touched(result, region)`: an answer is recomputed only when the edit touches its supporting window, i.e.
+      the answer span widened by `QA_SUPPORT_CHARS` characters on each side (about one window of the model); the
+      other answers are kept, with their offsets shifted.
+
+Several edits sent at once are handled as a single region, from the first to the last change.
+
+The state is written wherever the entities or the answers of a document are first computed, not only by the edits:
+`record(path, text, language, spans, qa)` is called when a document is loaded (LoadConfig, bulk NER) and when its
+configuration changes, so that the first edit of a document is already refreshed incrementally.
+"""
+
+import hashlib
+import json
+import os
+
+from django.conf import settings
+
+from myapp.nlp import ner_engine, spacy_loader
+
+
+# Default number of characters around an answer that support it
+DEFAULT_SUPPORT_CHARS = 2000
+
+# Paragraph and sentence boundaries the changed region is widened to
+SEPARATORS = ('\n', '. ')
+
+
+def text_hash(text):
+    """
+    Return the hexadecimal SHA-256 digest of a text.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def common_prefix(a, b):
+    """
+    Return the length of the common prefix of two strings.
+
+    The prefix is found by bisection, comparing slices (in C) instead of characters.
+    """
+    lo, hi = 0, min(len(a), len(b))
+
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+
+    return lo
+
+
+def common_suffix(a, b, limit):
+    """
+    Return the length of the common suffix of two strings, at most `limit`.
+    """
+    lo, hi = 0, limit
+
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+
+        if a[len(a) - mid:len(a) - lo] == b[len(b) - mid:len(b) - lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+
+    return lo
+
+
+def paragraph_start(text, position):
+    """
+    Return the start of the sentence or paragraph containing `position`.
+    """
+    starts = [text.rfind(sep, 0, position) for sep in SEPARATORS]
+    starts = [start + len(sep) for start, sep in zip(starts, SEPARATORS) if start != -1]
+
+    return max(starts) if starts else 0
+
+
+def paragraph_end(text, position):
+    """
+    Return the end of the sentence or paragraph containing `position` (separator included).
+    """
+    ends = [text.find(sep, position) for sep in SEPARATORS]
+    ends = [end + len(sep) for end, sep in zip(ends, SEPARATORS) if end != -1]
+
+    return min(ends) if ends else len(text)
+
+
+def changed_region(old, new, old_spans=()):
+    """
+    Return the region of the text changed by an edit, widened to whole sentences/paragraphs.
+
+    :param old: The previous version of the text.
+    :type old: str
+    :param new: The edited text.
+    :type new: str
+    :param old_spans: The entities of the previous version: the region is widened to those it cuts.
+    :type old_spans: list
+    :return: (start, old_end, new_end): the region is [start, old_end) in the previous version and [start, new_end)
+        in the edited one, the text after it is the same; None if the two versions are equal.
+    :rtype: tuple
+    """
+    if old == new:
+        return None
+
+    prefix = common_prefix(old, new)
+    suffix = common_suffix(old, new, min(len(old), len(new)) - prefix)
+
+    delta = len(new) - len(old)
+
+    start = paragraph_start(new, prefix)
+    new_end = paragraph_end(new, len(new) - suffix)
+    old_end = new_end - delta
+
+    # An entity cut by the region is recomputed as a whole
+    changed = True
+
+    while changed:
+        changed = False
+
+        for span_start, span_end, _, _ in old_spans:
+            if span_start < start < span_end:
+                start = span_start
+                changed = True
+            if span_start < old_end < span_end:
+                old_end = span_end
+                new_end = span_end + delta
+                changed = True
+
+    return start, old_end, new_end
+
+
+def shift(position, region):
+    """
+    Map a position of the previous version of the text outside of the changed region to the edited text.
+    """
+    start, old_end, new_end = region
+
+    return position + new_end - old_end if position >= old_end else position
+
+
+def update_spans(old_spans, old, new, language):
+    """
+    Update the entities of a text after an edit, running NER only on the changed paragraphs.
+
+    :param old_spans: The (start, end, label, text) entities of the previous version.
+    :type old_spans: list
+    :param old: The previous version of the text.
+    :type old: str
+    :param new: The edited text.
+    :type new: str
+    :param language: The language of the text ('en' or 'it').
+    :type language: str
+    :return: The entities of the edited text and the changed region (see `changed_region`).
+    :rtype: tuple
+    """
+    region = changed_region(old, new, old_spans)
+
+    if region is None:
+        return [tuple(span) for span in old_spans], None
+
+    start, old_end, new_end = region
+
+    spans = [tuple(span) for span in old_spans if span[1] <= start]
+
+    spans.extend((start + s, start + e, label, text)
+                 for s, e, label, text in ner_engine.ner_spans(new[start:new_end], language, use_cache=False))
+
+    spans.extend((shift(s, region), shift(e, region), label, text)
+                 for s, e, label, text in old_spans if s >= old_end)
+
+    return spans, region
+
+
+def entities_dict(spans, language):
+    """
+    Group the entities by label, in the shape of the JSONDicts files.
+    """
+    return ner_engine.spans_to_dict(spacy_loader.ner_info(language)['labels'], spans)
+
+
+def answer_touched(result, region):
+    """
+    Tell whether an edit touches the window supporting an answer.
+
+    :param result: The previous answer, with its `start` and `end` offsets.
+    :type result: dict
+    :param region: The changed region (see `changed_region`), None if the text did not change.
+    :type region: tuple
+    :rtype: bool
+    """
+    if region is None:
+        return False
+
+    # An empty answer is not supported by any window: the edit may have added one
+    if not result.get('answer'):
+        return True
+
+    support = getattr(settings, 'QA_SUPPORT_CHARS', DEFAULT_SUPPORT_CHARS)
+
+    start, old_end, _ = region
+
+    return result['start'] - support < old_end and start < result['end'] + support
+
+
+def shift_answer(result, region):
+    """
+    Map the offsets of an answer not touched by an edit to the edited text.
+    """
+    if region is None:
+        return dict(result)
+
+    return dict(result, start=shift(result['start'], region), end=shift(result['end'], region))
+
+
+def state_path(json_dict_path):
+    """
+    Return the path of the state file kept next to a JSONDicts file.
+    """
+    return json_dict_path[:-len('.json')] + '.state.json' if json_dict_path.endswith('.json') \
+        else json_dict_path + '.state.json'
+
+
+def load_state(path, text, language):
+    """
+    Load the state of a document, if it was computed on the given text.
+
+    :param path: The path of the state file.
+    :type path: str
+    :param text: The text the state must correspond to.
+    :type text: str
+    :param language: The language the state must correspond to.
+    :type language: str
+    :return: The state ({'text_hash', 'language', 'spans', 'qa'}), None if missing or stale.
+    :rtype: dict
+    """
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        with open(path) as state_file:
+            state = json.load(state_file)
+    except ValueError:
+        return None
+
+    if state.get('text_hash') != text_hash(text) or state.get('language') != language:
+        return None
+
+    return state
+
+
+def answer_state(model_name, question, result):
+    """
+    Return the entry of an answer in the state of a document.
+
+    :param model_name: The question-answering model that gave the answer.
+    :type model_name: str
+    :param question: The question.
+    :type question: str
+    :param result: The answer, with its `score` and its `start` and `end` offsets.
+    :type result: dict
+    :rtype: dict
+    """
+    return {'model': model_name, 'question': question, 'answer': result['answer'], 'score': result['score'],
+            'start': result['start'], 'end': result['end']}
+
+
+def record(path, text, language, spans=None, qa=None):
+    """
+    Record in the state of a document the entities or the answers just computed on its text.
+
+    The entities (and the answers) of a state computed on the same text are kept when none are given; the answers are
+    merged by key. Without any entities there is no state to record.
+
+    :param path: The path of the state file.
+    :type path: str
+    :param text: The text the entities and the answers were computed on.
+    :type text: str
+    :param language: The language of the text.
+    :type language: str
+    :param spans: The (start, end, label, text) entities of the text (None keeps the ones of the state).
+    :type spans: list
+    :param qa: The answers, by key (see `answer_state`).
+    :type qa: dict
+    """
+    state = load_state(path, text, language)
+
+    if spans is None:
+        if state is None:
+            return
+
+        spans = state['spans']
+
+    answers = dict(state['qa']) if state is not None else {}
+    answers.update(qa or {})
+
+    save_state(path, text, language, spans, answers)
+
+
+def save_state(path, text, language, spans, qa):
+    """
+    Save the entities and the answers computed on a text.
+
+    :param spans: The (start, end, label, text) entities of the text.
+    :type spans: list
+    :param qa: The answers, by key: {'model', 'question', 'answer', 'score', 'start', 'end'}.
+    :type qa: dict
+    """
+    with open(path, "w") as state_file:
+        json.dump({'text_hash': text_hash(text), 'language': language, 'spans': [list(span) for span in spans],
+                   'qa': qa}, state_file)
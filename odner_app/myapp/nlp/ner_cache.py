@@ -0,0 +1,143 @@
+"""
+Persistent, content-addressed cache of the named entities of the texts.
+
+The entities of a text only depend on the text, on the spaCy model (name and version) and on the size of the chunks
+the text is split in, so they are cached under the SHA-256 of:
+
+    (model name, model version, chunk size, SHA-256 of the text)
+
+The same contract uploaded under another file name, or uploaded again after its records were deleted, finds its
+entities in the cache and skips the inference. Installing a new version of the model changes the keys, so the
+entities it would find differently are never reused.
+
+The entities are stored in the `NERResult` model as a JSON list of [start, end, label, text], and the table is bounded
+by `NER_CACHE_SIZE` rows: every `EVICT_INTERVAL` texts stored by the process, the least recently used are evicted. The
+cache can be turned off with `NER_CACHE = False`.
+
+    - `model_id(language)`: the (name, version) of the NER model of a language.
+    - `make_key(model_name, model_version, chunk_size, text_hash)`: the key of a text.
+    - `lookup(key)` / `store(key, ...)`: read and store the entities of a text.
+"""
+
+import hashlib
+import json
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from myapp.models import NERResult
+from myapp.nlp import spacy_loader
+
+
+# Default maximum number of texts whose entities are stored in the database
+DEFAULT_CACHE_SIZE = 100000
+
+# Number of texts stored by the process between two evictions (counting the rows of the table costs a full scan)
+EVICT_INTERVAL = 100
+
+# Number of rows deleted per query, to stay below the limit of query parameters of the database
+DELETE_CHUNK = 500
+
+_lock = threading.Lock()
+_stored = 0  # texts stored since the last eviction
+
+
+def enabled():
+    """
+    Tell whether the cache is enabled (`NER_CACHE` in the settings).
+    """
+    return getattr(settings, 'NER_CACHE', True)
+
+
+def text_hash(text):
+    """
+    Return the hexadecimal SHA-256 digest of a text.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def model_id(language):
+    """
+    Return the name and the version of the NER model of a language.
+
+    :param language: The language ('en' or 'it').
+    :type language: str
+    :return: The (model name, model version) pair.
+    :rtype: tuple
+    """
+    info = spacy_loader.ner_info(language)
+
+    return info['name'], info['version']
+
+
+def make_key(model_name, model_version, chunk_size, hash_text):
+    """
+    Return the key of the entities of a text.
+
+    :return: The hexadecimal SHA-256 digest of (model name, model version, chunk size, text hash).
+    :rtype: str
+    """
+    return hashlib.sha256('\x00'.join([model_name, model_version, str(chunk_size), hash_text]).encode('utf-8')).hexdigest()
+
+
+def lookup(key):
+    """
+    Return the cached entities of a text.
+
+    :param key: The key of the text (see `make_key`).
+    :type key: str
+    :return: The (start, end, label, text) entities, or None if the text is not cached.
+    :rtype: list
+    """
+    row = NERResult.objects.filter(key=key).values_list('id', 'spans').first()
+
+    if row is None:
+        return None
+
+    NERResult.objects.filter(id=row[0]).update(last_used=timezone.now())
+
+    return [tuple(span) for span in json.loads(row[1])]
+
+
+def store(key, model_name, model_version, hash_text, spans):
+    """
+    Store the entities of a text; every `EVICT_INTERVAL` texts, the least recently used ones beyond `NER_CACHE_SIZE`
+    rows are evicted.
+
+    :param spans: The (start, end, label, text) entities of the text.
+    :type spans: list
+    """
+    with transaction.atomic():
+        NERResult.objects.bulk_create([NERResult(key=key, model_name=model_name, model_version=model_version,
+                                                 text_hash=hash_text, spans=json.dumps([list(span) for span in spans]))],
+                                      ignore_conflicts=True)
+
+    global _stored
+
+    with _lock:
+        _stored += 1
+        due = _stored >= EVICT_INTERVAL
+
+        if due:
+            _stored = 0
+
+    if due:
+        evict()
+
+
+def evict():
+    """
+    Delete the least recently used entities beyond `NER_CACHE_SIZE` rows.
+    """
+    max_rows = getattr(settings, 'NER_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+
+    excess = NERResult.objects.count() - max_rows
+
+    if excess > 0:
+        oldest = list(NERResult.objects.order_by('last_used').values_list('id', flat=True)[:excess])
+
+        with transaction.atomic():
+            for start in range(0, len(oldest), DELETE_CHUNK):
+                NERResult.objects.filter(id__in=oldest[start:start + DELETE_CHUNK]).delete()
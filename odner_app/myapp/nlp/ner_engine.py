@@ -0,0 +1,289 @@
+"""
+Named entity recognition of the documents.
+
+The entities of a text are returned as a dictionary label -> list of the entity texts, in order of occurrence
+(an entity found several times is listed several times), with every label of the model present, even when empty.
+This is the shape of the JSONDicts files.
+
+A text is never fed to spaCy whole: it is split in chunks of at most `NER_CHUNK_SIZE` characters, cut preferably at
+a paragraph boundary, then at a sentence boundary, then at a space, so that a large contract neither exceeds the
+`max_length` of the model nor needs memory proportional to its size. The entities found in each chunk are shifted
+back to their position in the whole text and merged in order.
+
+Many texts (the documents of an archive, or the chunks of a large document) are not processed one `nlp(text)` call
+at a time: they are streamed through `nlp.pipe`, which batches them (`NER_BATCH_SIZE` chunks per batch) and can spread
+them over several worker processes (`NER_N_PROCESS`). The entities of the texts already processed are read from the
+content-addressed NER cache of `ner_cache.py` instead. When the models are served by the inference daemon
+(`INFERENCE_SOCKET`, see myapp/inference/), the texts missing from the cache are sent to it.
+
+    - `split_chunks(text, chunk_size)`: the chunks of a text, with their offsets.
+    - `ner_spans(text, language)`: the entities of one text as (start, end, label, text) tuples, with global offsets.
+    - `ner(text, language)`: the entities of one text, grouped by label.
+    - `iter_ner_spans(texts, language, ...)` / `iter_ner(texts, language, ...)`: the same for a stream of texts,
+      yielded one text at a time.
+    - `ner_many(texts, language, ...)`: the entities of many texts grouped by label, in the same order.
+"""
+
+from django.conf import settings
+
+from myapp.inference import client as inference_client
+from myapp.jobs import job_queue
+from myapp.nlp import ner_cache, spacy_loader
+
+
+# Default number of chunks per batch of nlp.pipe
+DEFAULT_BATCH_SIZE = 8
+
+# Default number of processes of nlp.pipe (1: in the calling process)
+DEFAULT_N_PROCESS = 1
+
+# Default maximum number of characters of a chunk
+DEFAULT_CHUNK_SIZE = 100000
+
+# Where a chunk is preferably cut, in order of preference: paragraphs, lines, sentences, words
+BOUNDARIES = ('\n\n', '\n', '. ', '; ', ' ')
+
+
+def get_chunk_size():
+    """
+    Return the maximum number of characters of a chunk (`NER_CHUNK_SIZE` in the settings).
+    """
+    return max(1, getattr(settings, 'NER_CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+
+
+def split_chunks(text, chunk_size=None):
+    """
+    Split a text in chunks of at most `chunk_size` characters, on paragraph or sentence boundaries when possible.
+
+    A chunk is cut at the last boundary found in its second half, trying the boundaries in order of preference;
+    it is cut at exactly `chunk_size` characters only when there is no boundary at all.
+
+    :param text: The text to split.
+    :type text: str
+    :param chunk_size: The maximum number of characters of a chunk (None reads `NER_CHUNK_SIZE` from the settings).
+    :type chunk_size: int
+    :return: The (offset, chunk) pairs, in order; the chunks joined give back the text.
+    :rtype: list
+    """
+    if chunk_size is None:
+        chunk_size = get_chunk_size()
+
+    chunks = []
+    start = 0
+
+    while len(text) - start > chunk_size:
+        end = start + chunk_size
+        cut = end
+
+        for boundary in BOUNDARIES:
+            i = text.rfind(boundary, start + chunk_size // 2, end)
+
+            if i != -1:
+                cut = i + len(boundary)
+                break
+
+        chunks.append((start, text[start:cut]))
+        start = cut
+
+    chunks.append((start, text[start:]))
+
+    return chunks
+
+
+def empty_dict(labels):
+    """
+    Return a dictionary with an empty list for every label of the entity recognizer.
+
+    :param labels: The labels of the entity recognizer (see `spacy_loader.ner_info`).
+    :type labels: list
+    :return: The dictionary label -> [].
+    :rtype: dict
+    """
+    return {label: [] for label in labels}
+
+
+def spans_to_dict(labels, spans):
+    """
+    Group the entities of a text by label.
+
+    :param labels: The labels of the entity recognizer that found the entities.
+    :type labels: list
+    :param spans: The (start, end, label, text) tuples of the entities, in order.
+    :type spans: list
+    :return: The dictionary label -> list of the entity texts.
+    :rtype: dict
+    """
+    tmp = empty_dict(labels)
+
+    for _, _, label, text in spans:
+        tmp.setdefault(label, []).append(text)
+
+    return tmp
+
+
+def iter_ner_spans(texts, language, chunk_size=None, batch_size=None, n_process=None, use_cache=True):
+    """
+    Performs Named Entity Recognition (NER) on a stream of texts, yielding the entities of each text as it is processed.
+
+    The texts are consumed lazily and split in chunks, and all the chunks go through a single `nlp.pipe` stream, so an
+    archive of documents can be processed without holding all of them in memory. The texts found in the NER cache
+    (see `ner_cache.py`) do not reach the model.
+
+    :param texts: The texts to perform NER on.
+    :type texts: iterable
+    :param language: The language of the texts ('en' or 'it').
+    :type language: str
+    :param chunk_size: The maximum number of characters of a chunk (None reads `NER_CHUNK_SIZE` from the settings).
+    :type chunk_size: int
+    :param batch_size: The number of chunks per batch (None reads `NER_BATCH_SIZE` from the settings).
+    :type batch_size: int
+    :param n_process: The number of processes (None reads `NER_N_PROCESS` from the settings).
+    :type n_process: int
+    :param use_cache: Whether to look up and store the entities in the NER cache.
+    :type use_cache: bool
+    :return: The (start, end, label, text) tuples of the entities of each text, with offsets in the whole text.
+    :rtype: generator
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, 'NER_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+    if n_process is None:
+        n_process = getattr(settings, 'NER_N_PROCESS', DEFAULT_N_PROCESS)
+
+    job_queue.report('ner')
+
+    # A chunk must stay below the limit of the model
+    chunk_size = min(chunk_size or get_chunk_size(), spacy_loader.ner_info(language)['max_length'])
+
+    use_cache = use_cache and ner_cache.enabled()
+
+    if use_cache:
+        model_name, model_version = ner_cache.model_id(language)
+
+    if inference_client.enabled():
+        # The model is held by the inference daemon: the texts missing from the cache are sent to it one by one
+        for text in texts:
+            if use_cache:
+                hash_text = ner_cache.text_hash(text)
+                key = ner_cache.make_key(model_name, model_version, chunk_size, hash_text)
+                spans = ner_cache.lookup(key)
+
+                if spans is not None:
+                    yield spans
+                    continue
+
+            spans = [tuple(span) for span in
+                     inference_client.call('ner', text, language, chunk_size, batch_size, n_process)]
+
+            if use_cache:
+                ner_cache.store(key, model_name, model_version, hash_text, spans)
+
+            yield spans
+
+        return
+
+    # Pipeline with only the entity recognizer enabled, shared by all the requests of the process
+    nlp = spacy_loader.ner_nlp(language)
+
+    cached = {}  # index of a text -> its cached entities
+    keys = {}  # index of a text to compute -> (key, text hash)
+
+    def chunk_stream():
+        for index, text in enumerate(texts):
+            if use_cache:
+                hash_text = ner_cache.text_hash(text)
+                key = ner_cache.make_key(model_name, model_version, chunk_size, hash_text)
+                spans = ner_cache.lookup(key)
+
+                if spans is not None:
+                    # An empty placeholder keeps the text in its place in the stream
+                    cached[index] = spans
+                    yield '', (index, 0)
+                    continue
+
+                keys[index] = (key, hash_text)
+
+            for offset, chunk in split_chunks(text, chunk_size):
+                yield chunk, (index, offset)
+
+    def finish(index, spans):
+        if index in cached:
+            return cached.pop(index)
+
+        if index in keys:
+            key, hash_text = keys.pop(index)
+            ner_cache.store(key, model_name, model_version, hash_text, spans)
+
+        return spans
+
+    current = None
+    spans = []
+
+    for doc, (index, offset) in nlp.pipe(chunk_stream(), as_tuples=True, batch_size=batch_size,
+                                         n_process=max(1, n_process)):
+        if index != current:
+            if current is not None:
+                yield finish(current, spans)
+
+            current = index
+            spans = []
+
+        spans.extend((offset + ent.start_char, offset + ent.end_char, ent.label_, ent.text) for ent in doc.ents)
+
+    if current is not None:
+        yield finish(current, spans)
+
+
+def iter_ner(texts, language, chunk_size=None, batch_size=None, n_process=None, use_cache=True):
+    """
+    Performs Named Entity Recognition (NER) on a stream of texts, yielding the entities of each text grouped by label.
+
+    :return: A dictionary label -> list of named entities for each text, in the same order.
+    :rtype: generator
+    """
+    labels = spacy_loader.ner_info(language)['labels']
+
+    for spans in iter_ner_spans(texts, language, chunk_size, batch_size, n_process, use_cache):
+        yield spans_to_dict(labels, spans)
+
+
+def ner_many(texts, language, chunk_size=None, batch_size=None, n_process=None, use_cache=True):
+    """
+    Performs Named Entity Recognition (NER) on many texts at once.
+
+    :param texts: The texts to perform NER on.
+    :type texts: list
+    :param language: The language of the texts ('en' or 'it').
+    :type language: str
+    :return: A dictionary label -> list of named entities for each text, in the same order.
+    :rtype: list
+    """
+    return list(iter_ner(texts, language, chunk_size, batch_size, n_process, use_cache))
+
+
+def ner_spans(text, language, chunk_size=None, batch_size=None, n_process=None, use_cache=True):
+    """
+    Performs Named Entity Recognition (NER) on text, chunk by chunk.
+
+    :param text: The text to perform NER on.
+    :type text: str
+    :param language: The language of the text ('en' or 'it').
+    :type language: str
+    :return: The (start, end, label, text) tuples of the entities, in order, with offsets in the whole text.
+    :rtype: list
+    """
+    return next(iter_ner_spans([text], language, chunk_size, batch_size, n_process, use_cache))
+
+
+def ner(txt_to_ner, language):
+    """
+    Performs Named Entity Recognition (NER) on text.
+
+    :param
+        txt_to_ner (str): The text to perform NER on.
+        language (str): The language of the text to be processed. Supported languages are 'en' for English and 'it' for Italian.
+
+    :return
+        dict: A dictionary where keys are named entity labels and values are lists of named entities for each label.
+    """
+    return spans_to_dict(spacy_loader.ner_info(language)['labels'], ner_spans(txt_to_ner, language))
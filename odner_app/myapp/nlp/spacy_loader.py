@@ -0,0 +1,172 @@
+"""
+Process-wide cache of the spaCy language pipelines.
+
+`spacy.load()` reads the whole model from disk and allocates its vectors and weights, which takes seconds for the
+`*_lg` models. The views ask this module for a pipeline instead, and each (model name, enabled components) pair is
+loaded only once per worker process:
+
+    - `load(model_name, enable)`: returns the cached pipeline, loading it lazily on first use. Only the components
+      listed in `enable` are run, the others are disabled (None keeps the default pipeline of the model).
+    - `sentence_nlp()`: the pipeline used to split a text in sentences (only the `senter` component).
+    - `sentences(text, question)`: the sentence boundaries of a text (and the terms of its sentences and of a question
+      for the retrieval of `retrieval.py`), computed by the inference daemon when there is one.
+    - `ner_nlp(language)`: the pipeline used to extract the named entities of a text (only `tok2vec` and `ner`).
+    - `ner_info(language)`: the name, version, labels and maximum length of the NER model, asked to the inference
+      daemon when there is one.
+    - `preload()`: loads eagerly the pipelines listed in the `SPACY_PRELOAD` setting, called when the app starts
+      (nothing is loaded by the web workers of an inference daemon).
+"""
+
+import threading
+
+import spacy
+from django.conf import settings
+
+from myapp.inference import client as inference_client
+from myapp.qa import retrieval
+
+
+# Model used to split the texts in sentences
+SENTENCE_MODEL = "en_core_web_md"
+
+# Models used for the named entity recognition, by language
+NER_MODELS = {'it': "it_core_news_lg", 'en': "en_core_web_lg"}
+
+# Components needed by each task
+SENTENCE_COMPONENTS = ("senter",)
+NER_COMPONENTS = ("tok2vec", "ner")
+
+_pipelines = {}
+_info = {}  # language -> description of its NER model
+_lock = threading.RLock()
+
+
+def load(model_name, enable=None):
+    """
+    Return the cached spaCy pipeline with the given components enabled, loading it on first use.
+
+    :param model_name: The name of the spaCy model (e.g. "it_core_news_lg").
+    :type model_name: str
+    :param enable: The components to run, the others are disabled (None keeps the default pipeline).
+    :type enable: tuple
+    :return: The spaCy pipeline.
+    :rtype: spacy.language.Language
+    """
+    key = (model_name, tuple(enable) if enable is not None else None)
+
+    with _lock:
+        nlp = _pipelines.get(key)
+
+        if nlp is None:
+            if enable is None:
+                nlp = spacy.load(model_name)
+            else:
+                nlp = spacy.load(model_name, enable=list(enable))
+
+            _pipelines[key] = nlp
+
+    return nlp
+
+
+def sentence_nlp():
+    """
+    Return the pipeline used to split a text in sentences.
+
+    :return: The spaCy pipeline with only the sentence recognizer enabled.
+    :rtype: spacy.language.Language
+    """
+    return load(SENTENCE_MODEL, SENTENCE_COMPONENTS)
+
+
+def sentences(text, question=None):
+    """
+    Split a text in sentences, without loading the pipeline when the models are served by the inference daemon (see
+    myapp/inference/client.py).
+
+    :param text: The text to split.
+    :type text: str
+    :param question: A question to index with the sentences (see `retrieval.terms`), None to only split the text.
+    :type question: str
+    :return: A dictionary with the (start, end) characters of each sentence (`bounds`) and, when a question is given,
+        the terms of each sentence (`terms`) and of the question (`question`).
+    :rtype: dict
+    """
+    if inference_client.enabled():
+        return inference_client.call('sentences', text, question)
+
+    nlp = sentence_nlp()
+    spans = list(nlp(text).sents)
+
+    data = {'bounds': [(span.start_char, span.end_char) for span in spans]}
+
+    if question is not None:
+        data['terms'] = [retrieval.terms(span) for span in spans]
+        data['question'] = retrieval.terms(nlp.tokenizer(question))
+
+    return data
+
+
+def ner_model_name(language):
+    """
+    Return the name of the spaCy model used for the named entity recognition in the given language.
+
+    :param language: The language of the text ('it' or 'en', any other value falls back to English).
+    :type language: str
+    :return: The name of the spaCy model.
+    :rtype: str
+    """
+    return NER_MODELS['it'] if language == 'it' else NER_MODELS['en']
+
+
+def ner_nlp(language):
+    """
+    Return the pipeline used to extract the named entities of a text.
+
+    :param language: The language of the text ('it' or 'en', any other value falls back to English).
+    :type language: str
+    :return: The spaCy pipeline with only the entity recognizer (and its token-to-vector layer) enabled.
+    :rtype: spacy.language.Language
+    """
+    return load(ner_model_name(language), NER_COMPONENTS)
+
+
+def ner_info(language):
+    """
+    Return the description of the NER model of a language, without loading the model when the models are served by
+    the inference daemon (see myapp/inference/client.py).
+
+    :param language: The language of the text ('it' or 'en', any other value falls back to English).
+    :type language: str
+    :return: A dictionary with the `name`, `version`, `labels` and `max_length` of the model.
+    :rtype: dict
+    """
+    with _lock:
+        info = _info.get(language)
+
+    if info is None:
+        if inference_client.enabled():
+            info = inference_client.call('ner_info', language)
+        else:
+            nlp = ner_nlp(language)
+            info = {'name': ner_model_name(language), 'version': nlp.meta.get('version', ''),
+                    'labels': list(nlp.get_pipe('ner').labels), 'max_length': nlp.max_length}
+
+        with _lock:
+            _info[language] = info
+
+    return info
+
+
+def preload():
+    """
+    Load eagerly the pipelines listed in the `SPACY_PRELOAD` setting ("sentences", "ner-it", "ner-en").
+    """
+    # The pipelines live in the inference daemon
+    if inference_client.enabled():
+        return
+
+    for name in getattr(settings, 'SPACY_PRELOAD', []):
+        if name == 'sentences':
+            sentence_nlp()
+        elif name.startswith('ner-'):
+            ner_nlp(name[4:])
@@ -0,0 +1,298 @@
+"""
+Persistent cache of the answers of the question-answering models.
+
+The same contracts are queried again and again with the same configured questions, from /api/qa/ and from the
+configuration views. An answer only depends on the model, its revision, the question and the context, so it is
+cached under the SHA-256 of:
+
+    (model name, model revision, normalized question, SHA-256 of the context)
+
+The answers are stored in the `QAAnswer` model, with their score and offsets, and the most recent ones are also kept in
+an in-process LRU dictionary so that repeated lookups do not touch the database at all.
+
+    - `get_many(model_name, question, contexts)`: returns the cached result of each context, or None.
+    - `get_items(model_name, items)` / `set_items(model_name, items, results)`: the same for (question, context) pairs,
+      e.g. the questions of a configuration over the same text, in a single lookup.
+    - `set_many(model_name, question, contexts, results)`: stores the results; every `EVICT_INTERVAL` answers stored
+      by the process, the least recently used answers beyond `QA_ANSWER_CACHE_SIZE` rows are evicted.
+    - `invalidate(context)`: forgets the answers computed over the given context as a whole (used when a text is
+      edited); the answers over its sentences are left to the eviction.
+
+The revision of a model stored on disk is the modification time of its files, so retraining a model in place
+invalidates its answers; the revision of a hub model is read from `QA_MODEL_REVISIONS` (default "main").
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from myapp.models import QAAnswer
+from myapp.qa.quantization import split_name
+
+
+# Default maximum number of answers stored in the database
+DEFAULT_CACHE_SIZE = 100000
+
+# Default maximum number of answers kept in memory by each worker process
+DEFAULT_MEMORY_SIZE = 10000
+
+# Number of keys per query, to stay below the limit of query parameters of the database
+LOOKUP_CHUNK = 500
+
+# Number of answers stored by the process between two evictions (counting the rows of the table costs a full scan)
+EVICT_INTERVAL = 1000
+
+_memory = OrderedDict()  # key -> (context hash, result), least recently used first
+_lock = threading.RLock()
+_stored = 0  # answers stored since the last eviction
+
+
+def context_hash(context):
+    """
+    Return the SHA-256 hash of a context.
+
+    :param context: The context.
+    :type context: str
+    :return: The hexadecimal digest.
+    :rtype: str
+    """
+    return hashlib.sha256(context.encode('utf-8')).hexdigest()
+
+
+def normalize_question(question):
+    """
+    Normalize a question so that differences in whitespace do not produce different keys.
+
+    :param question: The question.
+    :type question: str
+    :return: The normalized question.
+    :rtype: str
+    """
+    return ' '.join(question.split())
+
+
+def model_revision(model_name):
+    """
+    Return the revision of a question-answering model.
+
+    :param model_name: The name (or local path) of the model.
+    :type model_name: str
+    :return: The revision of the model.
+    :rtype: str
+    """
+    # A quantized model has the revision of the model it is built from
+    model_name, _ = split_name(model_name)
+
+    if os.path.isdir(model_name):
+        # Local checkpoint: the most recent modification of its files
+        mtimes = [os.path.getmtime(os.path.join(model_name, name)) for name in os.listdir(model_name)]
+        return str(max(mtimes, default=0))
+
+    return getattr(settings, 'QA_MODEL_REVISIONS', {}).get(model_name, 'main')
+
+
+def make_key(model_name, revision, question, hash_context):
+    """
+    Return the cache key of an answer.
+
+    :return: The hexadecimal SHA-256 digest of the key fields.
+    :rtype: str
+    """
+    fields = '\x00'.join([model_name, revision, normalize_question(question), hash_context])
+    return hashlib.sha256(fields.encode('utf-8')).hexdigest()
+
+
+def _remember(key, hash_context, result):
+    """
+    Keep a result in the in-process LRU dictionary.
+    """
+    with _lock:
+        _memory[key] = (hash_context, result)
+        _memory.move_to_end(key)
+
+        max_items = getattr(settings, 'QA_ANSWER_CACHE_MEMORY_SIZE', DEFAULT_MEMORY_SIZE)
+
+        while len(_memory) > max_items:
+            _memory.popitem(last=False)
+
+
+def get_many(model_name, question, contexts):
+    """
+    Return the cached results of a question over many contexts.
+
+    :param model_name: The name (or local path) of the question-answering model.
+    :type model_name: str
+    :param question: The question.
+    :type question: str
+    :param contexts: The contexts.
+    :type contexts: list
+    :return: One result (or None when it is not cached) per context, in the same order.
+    :rtype: list
+    """
+    return get_items(model_name, [(question, context) for context in contexts])
+
+
+def get_items(model_name, items):
+    """
+    Return the cached results of many (question, context) pairs.
+
+    :param model_name: The name (or local path) of the question-answering model.
+    :type model_name: str
+    :param items: The (question, context) pairs.
+    :type items: list
+    :return: One result (or None when it is not cached) per pair, in the same order.
+    :rtype: list
+    """
+    revision = model_revision(model_name)
+
+    hashes = {}  # context -> hash, computed once for a context shared by many questions
+    keys = []
+
+    for question, context in items:
+        if context not in hashes:
+            hashes[context] = context_hash(context)
+
+        keys.append(make_key(model_name, revision, question, hashes[context]))
+
+    results = [None] * len(keys)
+    missing = {}
+
+    with _lock:
+        for i, key in enumerate(keys):
+            if key in _memory:
+                _memory.move_to_end(key)
+                results[i] = dict(_memory[key][1])
+            else:
+                missing.setdefault(key, []).append(i)
+
+    if not missing:
+        return results
+
+    missing_keys = list(missing.keys())
+    found = []
+
+    # Look up the table in chunks (a long contract has thousands of sentences)
+    for start in range(0, len(missing_keys), LOOKUP_CHUNK):
+        for row in QAAnswer.objects.filter(key__in=missing_keys[start:start + LOOKUP_CHUNK]):
+            result = {'answer': row.answer, 'score': row.score, 'start': row.start, 'end': row.end}
+            _remember(row.key, row.context_hash, result)
+            found.append(row.key)
+
+            for i in missing[row.key]:
+                results[i] = dict(result)
+
+    # Refresh the rows that were read, so that they are evicted last
+    now = timezone.now()
+
+    for start in range(0, len(found), LOOKUP_CHUNK):
+        QAAnswer.objects.filter(key__in=found[start:start + LOOKUP_CHUNK]).update(last_used=now)
+
+    return results
+
+
+def set_many(model_name, question, contexts, results):
+    """
+    Store the results of a question over many contexts.
+
+    :param model_name: The name (or local path) of the question-answering model.
+    :type model_name: str
+    :param question: The question.
+    :type question: str
+    :param contexts: The contexts.
+    :type contexts: list
+    :param results: The results, one per context.
+    :type results: list
+    """
+    set_items(model_name, [(question, context) for context in contexts], results)
+
+
+def set_items(model_name, items, results):
+    """
+    Store the results of many (question, context) pairs.
+
+    :param model_name: The name (or local path) of the question-answering model.
+    :type model_name: str
+    :param items: The (question, context) pairs.
+    :type items: list
+    :param results: The results, one per pair.
+    :type results: list
+    """
+    revision = model_revision(model_name)
+    rows = {}
+    hashes = {}  # context -> hash, computed once for a context shared by many questions
+
+    for (question, context), result in zip(items, results):
+        if context not in hashes:
+            hashes[context] = context_hash(context)
+
+        hash_context = hashes[context]
+        key = make_key(model_name, revision, question, hash_context)
+
+        _remember(key, hash_context, {'answer': result['answer'], 'score': result['score'],
+                                      'start': result['start'], 'end': result['end']})
+
+        rows[key] = QAAnswer(key=key, model_name=model_name, model_revision=revision,
+                             question=normalize_question(question), context_hash=hash_context,
+                             answer=result['answer'], score=result['score'],
+                             start=result['start'], end=result['end'])
+
+    if not rows:
+        return
+
+    with transaction.atomic():
+        QAAnswer.objects.bulk_create(list(rows.values()), ignore_conflicts=True, batch_size=LOOKUP_CHUNK)
+
+    global _stored
+
+    with _lock:
+        _stored += len(rows)
+        due = _stored >= EVICT_INTERVAL
+
+        if due:
+            _stored = 0
+
+    if due:
+        evict()
+
+
+def evict():
+    """
+    Delete the least recently used answers beyond `QA_ANSWER_CACHE_SIZE` rows.
+    """
+    max_rows = getattr(settings, 'QA_ANSWER_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+
+    excess = QAAnswer.objects.count() - max_rows
+
+    if excess > 0:
+        oldest = list(QAAnswer.objects.order_by('last_used').values_list('id', flat=True)[:excess])
+
+        with transaction.atomic():
+            for start in range(0, len(oldest), LOOKUP_CHUNK):
+                QAAnswer.objects.filter(id__in=oldest[start:start + LOOKUP_CHUNK]).delete()
+
+
+def invalidate(context):
+    """
+    Forget the answers computed over the given context as a whole.
+
+    Since the keys contain the hash of the context, an edited text never gets the answers of its previous version:
+    this only reclaims the space of the answers that cannot be used anymore. The answers computed over the sentences
+    of the context (`answer_batch`) are keyed by the hash of each sentence and are not removed: the sentences left
+    unchanged by an edit still use them, and the others are evicted as the least recently used answers.
+
+    :param context: The context (e.g. the previous version of an edited text).
+    :type context: str
+    """
+    hash_context = context_hash(context)
+
+    with _lock:
+        for key in [key for key, (hash_key, _) in _memory.items() if hash_key == hash_context]:
+            del _memory[key]
+
+    with transaction.atomic():
+        QAAnswer.objects.filter(context_hash=hash_context).delete()
@@ -0,0 +1,187 @@
+"""
+Process-wide registry of question-answering pipelines.
+
+Building a `transformers.pipeline("question-answering", ...)` reads the weights from disk (or from the Hugging Face hub)
+and allocates the whole model, so it must not happen once per request or, worse, once per sentence.
+The registry keeps every pipeline loaded by the worker process warm across requests:
+
+    - `get_qa_pipeline(model_name)` returns the cached pipeline for the model, loading it on first use.
+    - Each model is loaded at most once, even when several threads ask for it at the same time.
+    - The registry is bounded by a memory budget (`QA_MODEL_CACHE_BYTES` in the settings, in bytes). When a new model
+      does not fit, the least recently used models are evicted until it does. A budget of 0 disables the bound.
+    - A model name ending with `@int8` loads the model with dynamic int8 quantization (see `quantization.py`).
+    - A model whose graph was exported to ONNX is served by ONNX Runtime (see `onnx_backend.py`).
+
+The size of a model is estimated from its parameters and buffers, which is what dominates the resident memory of a pipeline.
+"""
+
+import threading
+from collections import OrderedDict
+
+import torch
+from django.conf import settings
+from transformers import pipeline
+
+from myapp.qa import onnx_backend
+from myapp.qa.quantization import load_quantized_pipeline, split_name
+
+
+# Default memory budget for the loaded models: 4 GiB
+DEFAULT_CACHE_BYTES = 4 * 1024 ** 3
+
+
+def model_size(model):
+    """
+    Estimate the memory used by a model.
+
+    :param model: The model to measure.
+    :type model: torch.nn.Module
+    :return: The number of bytes used by the parameters and buffers of the model.
+    :rtype: int
+    """
+    if not isinstance(model, torch.nn.Module):
+        # An ONNX Runtime session: the size of its graph
+        return model.size
+
+    size = 0
+
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        size += tensor.nelement() * tensor.element_size()
+
+    # The int8 weights of the quantized linear layers are packed outside the parameters
+    for value in model.state_dict().values():
+        if isinstance(value, tuple):
+            size += sum(tensor.nelement() * tensor.element_size() for tensor in value if isinstance(tensor, torch.Tensor))
+
+    return size
+
+
+class ModelRegistry:
+    """
+    Thread-safe LRU cache of question-answering pipelines, bounded by bytes.
+    """
+
+    def __init__(self, max_bytes=None):
+        """
+        :param max_bytes: The memory budget in bytes (None reads `QA_MODEL_CACHE_BYTES` from the settings, 0 means unbounded).
+        :type max_bytes: int
+        """
+        self._max_bytes = max_bytes
+        self._pipelines = OrderedDict()  # model name -> (pipeline, size in bytes), least recently used first
+        self._loading = {}  # model name -> lock held while the model is being loaded
+        self._lock = threading.RLock()
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return getattr(settings, 'QA_MODEL_CACHE_BYTES', DEFAULT_CACHE_BYTES)
+
+    @property
+    def used_bytes(self):
+        with self._lock:
+            return sum(size for _, size in self._pipelines.values())
+
+    def get(self, model_name):
+        """
+        Return the question-answering pipeline for the given model, loading it if needed.
+
+        :param model_name: The name (or local path) of the model.
+        :type model_name: str
+        :return: The question-answering pipeline.
+        :rtype: transformers.QuestionAnsweringPipeline
+        """
+        with self._lock:
+            if model_name in self._pipelines:
+                self._pipelines.move_to_end(model_name)
+                return self._pipelines[model_name][0]
+
+            load_lock = self._loading.setdefault(model_name, threading.Lock())
+
+        # Only one thread loads a given model, the others wait for it and then find it in the cache
+        with load_lock:
+            with self._lock:
+                if model_name in self._pipelines:
+                    self._pipelines.move_to_end(model_name)
+                    return self._pipelines[model_name][0]
+
+            try:
+                qa = self.load(model_name)
+                size = model_size(qa.model)
+
+                with self._lock:
+                    self._evict(size)
+                    self._pipelines[model_name] = (qa, size)
+            finally:
+                # Also when the model cannot be loaded, so that unknown names do not pile up
+                with self._lock:
+                    self._loading.pop(model_name, None)
+
+        return qa
+
+    def load(self, model_name):
+        """
+        Build the question-answering pipeline for the given model.
+
+        :param model_name: The name (or local path) of the model.
+        :type model_name: str
+        :return: The question-answering pipeline.
+        :rtype: transformers.QuestionAnsweringPipeline
+        """
+        base_name, quantized = split_name(model_name)
+
+        if quantized:
+            return load_quantized_pipeline(base_name)
+
+        if onnx_backend.available(model_name):
+            return onnx_backend.ORTPipeline(model_name)
+
+        return pipeline("question-answering", model=model_name)
+
+    def evict(self, model_name):
+        """
+        Remove a model from the registry.
+
+        :param model_name: The name (or local path) of the model.
+        :type model_name: str
+        """
+        with self._lock:
+            self._pipelines.pop(model_name, None)
+
+    def clear(self):
+        """
+        Remove every model from the registry.
+        """
+        with self._lock:
+            self._pipelines.clear()
+
+    def _evict(self, needed):
+        """
+        Evict the least recently used models until `needed` more bytes fit in the budget.
+        """
+        max_bytes = self.max_bytes
+
+        if not max_bytes:
+            return
+
+        used = sum(size for _, size in self._pipelines.values())
+
+        while self._pipelines and used + needed > max_bytes:
+            _, (_, size) = self._pipelines.popitem(last=False)
+            used -= size
+
+
+# Registry shared by all the views of the worker process
+registry = ModelRegistry()
+
+
+def get_qa_pipeline(model_name):
+    """
+    Return the shared question-answering pipeline for the given model.
+
+    :param model_name: The name (or local path) of the model.
+    :type model_name: str
+    :return: The question-answering pipeline.
+    :rtype: transformers.QuestionAnsweringPipeline
+    """
+    return registry.get(model_name)
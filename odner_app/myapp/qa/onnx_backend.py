@@ -0,0 +1,162 @@
+"""
+ONNX Runtime backend of the question-answering models.
+
+The checkpoints trained in `fine-tuning/` can be exported to ONNX with `fine-tuning/export_onnx.py`, with dynamic
+batch and sequence axes. When the exported graph of a model exists, the registry of `model_registry.py` serves the
+model with ONNX Runtime instead of the PyTorch pipeline, without any change to the views or to the `entity_model` map
+of the configurations:
+
+    - the graph runs on the CPU execution provider, with all the graph optimizations enabled (node fusions, constant
+      folding) and `QA_ONNX_THREADS` intra-op threads (None lets ONNX Runtime choose);
+    - the features of the windows are built directly from the token ids by `window_qa.py`, and the best span of each
+      window is chosen and scored as the pipeline does (the [CLS] token takes part in the normalization of the
+      probabilities), so the answers and their scores are the same as with the PyTorch pipeline (up to the rounding
+      of the logits).
+
+The exported graph of a local checkpoint is `model.onnx` in the folder of the checkpoint; the graph of a hub model is
+`QA_ONNX_DIR/<name of the model, with '/' replaced by '--'>/model.onnx`. The backend can be turned off with
+`QA_ONNX = False`, and it is skipped when `onnxruntime` is not installed.
+
+    - `onnx_path(model_name)`: the path of the exported graph of a model.
+    - `available(model_name)`: whether the model can be served by ONNX Runtime.
+    - `ORTPipeline(model_name)`: a callable with the interface of the question-answering pipeline.
+"""
+
+import os
+
+from django.conf import settings
+from transformers import AutoTokenizer
+
+from myapp.qa import window_qa
+
+
+# Default folder of the exported graphs of the hub models
+DEFAULT_ONNX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'onnx')
+
+# File name of an exported graph
+ONNX_FILE = 'model.onnx'
+
+
+def onnx_path(model_name):
+    """
+    Return the path of the exported graph of a model.
+
+    :param model_name: The name (or local path) of the model.
+    :type model_name: str
+    :return: The path of the graph (it may not exist).
+    :rtype: str
+    """
+    if os.path.isdir(model_name):
+        return os.path.join(model_name, ONNX_FILE)
+
+    folder = getattr(settings, 'QA_ONNX_DIR', None) or DEFAULT_ONNX_DIR
+
+    return os.path.join(folder, model_name.replace('/', '--'), ONNX_FILE)
+
+
+def available(model_name):
+    """
+    Tell whether a model is served by ONNX Runtime: the backend is enabled (`QA_ONNX` in the settings), `onnxruntime`
+    is installed and the exported graph of the model exists.
+    """
+    if not getattr(settings, 'QA_ONNX', True) or not os.path.exists(onnx_path(model_name)):
+        return False
+
+    try:
+        import onnxruntime  # noqa: F401
+    except ImportError:
+        return False
+
+    return True
+
+
+class ORTModel:
+    """
+    ONNX Runtime session of an exported question-answering model.
+    """
+
+    def __init__(self, path, threads=None):
+        """
+        :param path: The path of the exported graph.
+        :type path: str
+        :param threads: The number of intra-op threads (None reads `QA_ONNX_THREADS` from the settings).
+        :type threads: int
+        """
+        import onnxruntime
+
+        if threads is None:
+            threads = getattr(settings, 'QA_ONNX_THREADS', None)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        if threads:
+            options.intra_op_num_threads = int(threads)
+
+        self.path = path
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+    @property
+    def size(self):
+        """
+        The size of the graph and of its external weights, in bytes.
+        """
+        folder = os.path.dirname(self.path)
+
+        return sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder)
+                   if name.startswith(ONNX_FILE))
+
+    def logits(self, input_ids, attention_mask, token_type_ids=None):
+        """
+        Run the model on a batch of windows.
+
+        :return: The (start logits, end logits) arrays, shape (windows, tokens).
+        :rtype: tuple
+        """
+        inputs = {'input_ids': input_ids, 'attention_mask': attention_mask}
+
+        if 'token_type_ids' in self.input_names:
+            inputs['token_type_ids'] = token_type_ids if token_type_ids is not None else 0 * input_ids
+
+        start_logits, end_logits = self.session.run(['start_logits', 'end_logits'], inputs)
+
+        return start_logits, end_logits
+
+
+class ORTPipeline:
+    """
+    Question answering with ONNX Runtime, called as the question-answering pipeline:
+    `qa(question=..., context=...)` or `qa([{'question': ..., 'context': ...}, ...], batch_size=...)`.
+    """
+
+    def __init__(self, model_name):
+        """
+        :param model_name: The name (or local path) of the model, whose exported graph exists.
+        :type model_name: str
+        """
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = ORTModel(onnx_path(model_name))
+
+    def __call__(self, inputs=None, batch_size=None, question=None, context=None):
+        """
+        Answer the questions, with the best span of the windows of each context.
+
+        :return: A result (dictionary with the `answer`, `score`, `start` and `end` keys) for a single input,
+            a list of results otherwise.
+        """
+        single = inputs is None or isinstance(inputs, dict)
+
+        if inputs is None:
+            inputs = {'question': question, 'context': context}
+
+        if isinstance(inputs, dict):
+            inputs = [inputs]
+
+        items = [(item['question'], item['context']) for item in inputs]
+
+        # The contexts given to the pipeline are short-lived: their tokens are not stored
+        results = [window_qa.best(windows) or {'answer': '', 'score': 0.0, 'start': 0, 'end': 0}
+                   for windows in window_qa.answer_items(self, items, batch_size=batch_size, persist=False)]
+
+        return results[0] if single else results
@@ -0,0 +1,276 @@
+"""
+Batched question answering on top of the shared pipelines of `model_registry.py`.
+
+Running the pipeline on one sentence at a time makes one tiny forward pass per sentence. The functions of this module
+hand all the (question, context) pairs to the pipeline at once: the pipeline tokenizes them, splits long contexts in
+windows and runs the model on batches of `QA_BATCH_SIZE` items, each batch padded to its longest item.
+
+    - `answer_batch(model_name, question, contexts)`: answers one question over many contexts (e.g. the sentences of a document).
+    - `answer(model_name, question, context)`: answers one question over a single context; the windows of a long context are batched too.
+    - `answer_questions(model_name, questions, context)`: answers many questions over the same context in one batched call.
+    - `answer_windows(model_name, question, context, max_length, stride)`: the best answer of each window of the context
+      (see `window_qa.py`), for the sliding-window mode of /api/qa/.
+    - `answer_items(model_name, items)`: the same for many (question, context) pairs, whose windows share the batches.
+    - `answer_entities(entity_models, questions, context, keys)`: answers the questions of a configuration, grouped by
+      model, so that switching configuration costs one batched call per distinct model instead of one call per entity.
+
+The models are extractive cross-encoders: the question and the context are encoded together, so the windows of the
+context cannot be shared across questions, but all the (question, window) pairs of a model go through the same batches.
+
+With `QA_TOKEN_INDEX` enabled, `answer` and `answer_questions` do not go through the pipeline: the context is
+tokenized once and kept on disk (`token_index.py`), and the windows of each question are built from it (`window_qa.py`).
+
+The pipeline is called through the micro-batching scheduler of `scheduler.py`, so the items of concurrent requests for
+the same model share their forward passes; the models run directly (token index, windows) hold the lock of the model.
+With `INFERENCE_SOCKET` set, the work that needs a model is sent to the inference daemon instead (see myapp/inference/).
+
+Every result is a dictionary with the `answer`, `score`, `start` and `end` keys, as returned by the pipeline.
+The results are looked up in the answer cache of `answer_cache.py` first, and only the missing ones reach the model.
+"""
+
+from collections import OrderedDict
+
+from django.conf import settings
+
+from myapp.inference import client as inference_client
+from myapp.jobs import job_queue
+from myapp.qa import answer_cache, scheduler, window_qa
+from myapp.qa.model_registry import get_qa_pipeline
+
+
+# Default number of items (sentences or windows) sent to the model in a single forward pass
+DEFAULT_BATCH_SIZE = 16
+
+
+def get_batch_size(batch_size=None):
+    """
+    Return the batch size to use for the forward passes.
+
+    :param batch_size: The requested batch size (None reads `QA_BATCH_SIZE` from the settings).
+    :type batch_size: int
+    :return: The batch size.
+    :rtype: int
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, 'QA_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+    return max(1, int(batch_size))
+
+
+def use_token_index():
+    """
+    Tell whether the whole contexts are answered from their token index (`QA_TOKEN_INDEX` in the settings).
+    """
+    return getattr(settings, 'QA_TOKEN_INDEX', False)
+
+
+def empty_result():
+    """
+    Result returned for an empty context, which the pipeline refuses to process.
+    """
+    return {'answer': '', 'score': 0.0, 'start': 0, 'end': 0}
+
+
+def answer_batch(model_name, question, contexts, batch_size=None, use_cache=True):
+    """
+    Answer the same question over many contexts in batched forward passes.
+
+    :param model_name: The name (or local path) of the question-answering model.
+    :type model_name: str
+    :param question: The question to answer.
+    :type question: str
+    :param contexts: The contexts (e.g. the sentences of a document).
+    :type contexts: list
+    :param batch_size: The number of items per forward pass (None reads `QA_BATCH_SIZE` from the settings).
+    :type batch_size: int
+    :param use_cache: Whether to look up and store the results in the answer cache.
+    :type use_cache: bool
+    :return: One result per context, in the same order.
+    :rtype: list
+    """
+    results = [empty_result() for _ in contexts]
+
+    # The pipeline rejects empty contexts: they keep the empty result
+    indexes = [i for i, context in enumerate(contexts) if context.strip()]
+
+    if use_cache and indexes:
+        cached = answer_cache.get_many(model_name, question, [contexts[i] for i in indexes])
+
+        for i, result in zip(indexes, cached):
+            if result is not None:
+                results[i] = result
+
+        indexes = [i for i, result in zip(indexes, cached) if result is None]
+
+    if not indexes:
+        return results
+
+    inputs = [{'question': question, 'context': contexts[i]} for i in indexes]
+
+    outputs = scheduler.run(model_name, inputs, get_batch_size(batch_size))
+
+    for i, output in zip(indexes, outputs):
+        results[i] = output
+
+    if use_cache:
+        answer_cache.set_many(model_name, question, [contexts[i] for i in indexes], [results[i] for i in indexes])
+
+    return results
+
+
+def answer(model_name, question, context, batch_size=None, use_cache=True):
+    """
+    Answer a question over a single context, batching the windows of long contexts.
+
+    :param model_name: The name (or local path) of the question-answering model.
+    :type model_name: str
+    :param question: The question to answer.
+    :type question: str
+    :param context: The context.
+    :type context: str
+    :param batch_size: The number of windows per forward pass (None reads `QA_BATCH_SIZE` from the settings).
+    :type batch_size: int
+    :param use_cache: Whether to look up and store the result in the answer cache.
+    :type use_cache: bool
+    :return: The result for the context.
+    :rtype: dict
+    """
+    if use_token_index():
+        return answer_questions(model_name, [question], context, batch_size, use_cache)[0]
+
+    return answer_batch(model_name, question, [context], batch_size, use_cache)[0]
+
+
+def answer_questions(model_name, questions, context, batch_size=None, use_cache=True):
+    """
+    Answer many questions over the same context in batched forward passes.
+
+    :param model_name: The name (or local path) of the question-answering model.
+    :type model_name: str
+    :param questions: The questions to answer.
+    :type questions: list
+    :param context: The context.
+    :type context: str
+    :param batch_size: The number of items per forward pass (None reads `QA_BATCH_SIZE` from the settings).
+    :type batch_size: int
+    :param use_cache: Whether to look up and store the results in the answer cache.
+    :type use_cache: bool
+    :return: One result per question, in the same order.
+    :rtype: list
+    """
+    results = [empty_result() for _ in questions]
+
+    # The pipeline rejects empty contexts: every question keeps the empty result
+    if not context.strip():
+        return results
+
+    indexes = list(range(len(questions)))
+
+    if use_cache:
+        # A single lookup for all the questions
+        cached = answer_cache.get_items(model_name, [(question, context) for question in questions])
+
+        for i, result in enumerate(cached):
+            if result is not None:
+                results[i] = result
+
+        indexes = [i for i, result in enumerate(cached) if result is None]
+
+    if not indexes:
+        return results
+
+    if use_token_index():
+        # The windows are built from the stored tokens of the context, without tokenizing it again
+        outputs = [window_qa.best(windows) or empty_result()
+                   for windows in answer_items(model_name, [(questions[i], context) for i in indexes],
+                                               batch_size=get_batch_size(batch_size))]
+    else:
+        inputs = [{'question': questions[i], 'context': context} for i in indexes]
+
+        outputs = scheduler.run(model_name, inputs, get_batch_size(batch_size))
+
+    for i, output in zip(indexes, outputs):
+        results[i] = output
+
+    if use_cache:
+        answer_cache.set_items(model_name, [(questions[i], context) for i in indexes], [results[i] for i in indexes])
+
+    return results
+
+
+def answer_entities(entity_models, questions, context, keys=None, batch_size=None, use_cache=True):
+    """
+    Answer the questions of a configuration over a context, with one batched call per model.
+
+    :param entity_models: The model of each entity ("Spacy" for the entities found by NER, which are skipped).
+    :type entity_models: dict
+    :param questions: The question of each entity.
+    :type questions: dict
+    :param context: The context.
+    :type context: str
+    :param keys: The entities to answer (None answers all the entities with a question-answering model).
+    :type keys: iterable
+    :return: The result of each answered entity.
+    :rtype: dict
+    """
+    if keys is None:
+        keys = entity_models.keys()
+
+    by_model = OrderedDict()  # model name -> entities answered by the model
+
+    for key in keys:
+        if entity_models[key] != 'Spacy':
+            by_model.setdefault(entity_models[key], []).append(key)
+
+    results = {}
+
+    for i, (model_name, model_keys) in enumerate(by_model.items()):
+        job_queue.report('qa', i, len(by_model))
+
+        model_results = answer_questions(model_name, [questions[key] for key in model_keys], context,
+                                         batch_size, use_cache)
+
+        results.update(zip(model_keys, model_results))
+
+    return results
+
+
+def answer_windows(model_name, question, context, max_length=None, stride=None, batch_size=None):
+    """
+    Answer a question over every window of a context, built from the token index of the context.
+
+    :param model_name: The name (or local path) of the question-answering model.
+    :type model_name: str
+    :param question: The question to answer.
+    :type question: str
+    :param context: The context.
+    :type context: str
+    :param max_length: The number of tokens of a window (None reads `QA_MAX_LENGTH` from the settings).
+    :type max_length: int
+    :param stride: The number of tokens shared by two windows (None reads `QA_STRIDE` from the settings).
+    :type stride: int
+    :return: The best answer of each window, in order, with its `window` (see `window_qa.answer_windows`).
+    :rtype: list
+    """
+    if not context.strip():
+        return []
+
+    return answer_items(model_name, [(question, context)], max_length, stride, get_batch_size(batch_size))[0]
+
+
+def answer_items(model_name, items, max_length=None, stride=None, batch_size=None):
+    """
+    Answer (question, context) pairs over the windows of their contexts, built from the token index of the contexts.
+
+    The model is run directly (see `window_qa.answer_items`), holding its lock, or by the inference daemon when there
+    is one.
+
+    :return: For each pair, in order, the best answer of each window of its context.
+    :rtype: list
+    """
+    if inference_client.enabled():
+        return inference_client.call('windows', model_name, items, max_length, stride, batch_size)
+
+    with scheduler.model_lock(model_name):
+        return window_qa.answer_items(get_qa_pipeline(model_name), items, max_length, stride, batch_size)
+
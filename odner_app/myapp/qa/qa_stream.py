@@ -0,0 +1,148 @@
+"""
+Streaming variant of /api/qa/ (see `question_answering.py`), at /api/qa-stream/.
+
+The `QA` view answers every sentence of the context before returning anything, so on a long contract the user waits
+for the whole document. `QAStream` takes the same parameters (`question`, `model`, `text`, `mode`, `top_k`, `margin`,
+`max_length`, `stride`, `highlight`) and sends the results as server-sent events (`text/event-stream`) as soon as
+they are computed:
+
+    - `start`: {"sentences": number of sentences}, once the context is split;
+    - `sentence`: {"index", "sentence", "answer", "score", "high"} for each sentence, in order, `high` being the
+      sentence with its answer highlighted (with `highlight` set to "offsets", `start` and `end` replace `high`);
+    - `result`: {"answer", "score", "high"}, the best answer over the whole context, once all the sentences are sent;
+    - `error`: {"error"}, if the processing fails after the stream has started.
+
+The sentences are answered in chunks of `chunk` sentences (default `QA_STREAM_CHUNK`, or the batch size of the model),
+so the first events arrive after one batch instead of the whole document. In the "windows" mode the model runs once
+over the windows of the whole context, so the sentences are sent together when that pass is done.
+
+The response is a POST, so the clients read it with `fetch` and a stream reader rather than `EventSource`.
+"""
+
+import json
+import logging
+
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework import generics
+
+from myapp.qa import qa_engine
+from myapp.qa.question_answering import answer_sentences, highlight_entities, number_param, qa_params
+
+
+def event(name, data):
+    """
+    Format a server-sent event.
+
+    :param name: The name of the event.
+    :type name: str
+    :param data: The data of the event, sent as JSON.
+    :type data: dict
+    :return: The event, ready to be written to the stream.
+    :rtype: str
+    """
+    return "event: %s\ndata: %s\n\n" % (name, json.dumps(data))
+
+
+def get_chunk(chunk=None):
+    """
+    Return the number of sentences answered before their results are sent (`QA_STREAM_CHUNK` in the settings,
+    default: the batch size of the model).
+    """
+    chunk = chunk or getattr(settings, 'QA_STREAM_CHUNK', None) or qa_engine.get_batch_size()
+
+    return max(1, int(chunk))
+
+
+def answer_data(text, result, highlight):
+    """
+    Return the answer and score of a result, with the text highlighted ('html') or the offsets of the answer ('offsets').
+    """
+    data = {'answer': result['answer'], 'score': result['score']}
+
+    if highlight == 'offsets':
+        data['start'] = result['start']
+        data['end'] = result['end']
+    else:
+        data['high'] = highlight_entities(text, result['start'], result['end'])
+
+    return data
+
+
+def sentence_event(index, text, result, highlight):
+    return event('sentence', dict(answer_data(text, result, highlight), index=index, sentence=text))
+
+
+class QAStream(generics.CreateAPIView):
+    """
+        Class-based view to perform question - answering task, streaming the answer of each sentence
+    """
+
+    def post(self, request, *args, **kwargs):
+        """
+        :param request: The HTTP request object.
+        :type request: HttpRequest
+        :return: A stream of server-sent events with the answer of each sentence, then the best answer.
+        :rtype: StreamingHttpResponse
+        """
+        question = request.data.get('question', None)
+        model_name = request.data.get('model', None)
+        context = request.data.get('text', None)
+
+        # If no question was provided, return an error message.
+        if question == None:
+            return JsonResponse({'high': "Nessuna domanda inviata", })
+
+        # Bad answering parameters are a client error.
+        try:
+            params = dict(qa_params(request),
+                          chunk=get_chunk(number_param(request, 'chunk')),
+                          highlight=request.data.get('highlight', None) or getattr(settings, 'QA_HIGHLIGHT', 'html'))
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        response = StreamingHttpResponse(self.stream(model_name, question, context, **params),
+                                         content_type='text/event-stream')
+
+        # Deliver every event at once, through the proxies too
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+
+        return response
+
+    def stream(self, model_name, question, context, mode, top_k, margin, max_length, stride, chunk, highlight):
+        """
+        Generate the events of the answer of a question over a context.
+
+        :param model_name: The name (or local path) of the question-answering model.
+        :type model_name: str
+        :param question: The question to answer.
+        :type question: str
+        :param context: The context.
+        :type context: str
+        :return: The server-sent events (see the module docstring).
+        :rtype: generator
+        """
+        logger = logging.getLogger('appLog')
+
+        try:
+            # The same answering as /api/qa/, sent a chunk of sentences at a time
+            for step in answer_sentences(model_name, question, context, mode, top_k, margin, max_length, stride, chunk):
+                if step[0] == 'sentences':
+                    sentes = step[1]
+                    yield event('start', {'sentences': len(sentes)})
+
+                elif step[0] == 'answers':
+                    _, first, results = step
+
+                    for i, result in enumerate(results, first):
+                        yield sentence_event(i, sentes[i], result, highlight)
+
+                else:
+                    _, result, context_qa = step
+                    yield event('result', answer_data(context_qa, result, highlight))
+
+        except Exception as e:
+            # The status of the response is already sent: the error becomes the last event
+            logger.exception("Streaming question answering failed")
+            yield event('error', {'error': "%s: %s" % (type(e).__name__, e)})
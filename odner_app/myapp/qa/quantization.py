@@ -0,0 +1,139 @@
+"""
+Dynamic int8 quantization of the question-answering models, for CPU-only nodes.
+
+The fine-tuned checkpoints (`bert-finetuned-squad-accelerate`, `legal-bert-finetuned-squad-it`) spend almost all their
+CPU time in the linear layers of the encoder. `torch.quantization.quantize_dynamic` stores the weights of these layers
+as int8 and quantizes the activations on the fly, which makes the model about 4 times smaller and the forward pass
+faster on CPU, at the cost of a small loss of accuracy (measured by `benchmarks/quantization_benchmark.py`).
+
+The quantized backend is opt-in and chosen per model: a model name ending with `@int8` (e.g. in the `entity_model`
+map of a configuration, or in the `model` parameter of /api/qa/) is loaded quantized, the same name without the suffix
+is loaded as usual. Both can be used at the same time, and they get different entries in the answer cache.
+
+Quantizing a model takes a few seconds, so the quantized weights are cached on disk under `QA_QUANTIZED_DIR`
+(default: `myapp/qa/quantized/`), in a folder named after the model, its revision and the version of torch:
+retraining a local checkpoint or upgrading torch quantizes it again.
+
+    - `split_name(model_name)`: the name of the underlying model and whether it is quantized.
+    - `load_quantized_pipeline(model_name)`: the question-answering pipeline of the quantized model.
+"""
+
+import hashlib
+import os
+import tempfile
+
+import torch
+from django.conf import settings
+from transformers import AutoConfig, AutoModelForQuestionAnswering, AutoTokenizer, pipeline
+
+
+# Suffix of the model names loaded with int8 quantization
+INT8_SUFFIX = '@int8'
+
+# Default folder of the quantized weights
+DEFAULT_QUANTIZED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'quantized')
+
+
+def split_name(model_name):
+    """
+    Split the quantization suffix from a model name.
+
+    :param model_name: The name (or local path) of the model, possibly ending with `@int8`.
+    :type model_name: str
+    :return: The (name of the underlying model, whether it is quantized) pair.
+    :rtype: tuple
+    """
+    if model_name.endswith(INT8_SUFFIX):
+        return model_name[:-len(INT8_SUFFIX)], True
+
+    return model_name, False
+
+
+def quantized_dir():
+    """
+    Return the folder of the quantized weights (`QA_QUANTIZED_DIR` in the settings).
+    """
+    return getattr(settings, 'QA_QUANTIZED_DIR', None) or DEFAULT_QUANTIZED_DIR
+
+
+def weights_path(model_name):
+    """
+    Return the file of the quantized weights of a model.
+
+    :param model_name: The name (or local path) of the underlying model.
+    :type model_name: str
+    :return: The path of the file (it may not exist yet).
+    :rtype: str
+    """
+    if os.path.isdir(model_name):
+        # Local checkpoint: its absolute path and the most recent modification of its files
+        mtimes = [os.path.getmtime(os.path.join(model_name, name)) for name in os.listdir(model_name)]
+        name, revision = os.path.abspath(model_name), str(max(mtimes, default=0))
+    else:
+        name, revision = model_name, getattr(settings, 'QA_MODEL_REVISIONS', {}).get(model_name, 'main')
+
+    key = '\x00'.join([name, revision, torch.__version__])
+
+    return os.path.join(quantized_dir(), hashlib.sha256(key.encode('utf-8')).hexdigest()[:16], 'int8.pt')
+
+
+def quantize(model):
+    """
+    Quantize the linear layers of a model to int8.
+
+    :param model: The model, in float32.
+    :type model: torch.nn.Module
+    :return: The quantized model.
+    :rtype: torch.nn.Module
+    """
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_quantized_model(model_name):
+    """
+    Load a question-answering model quantized to int8, from the cached weights if there are any.
+
+    :param model_name: The name (or local path) of the underlying model.
+    :type model_name: str
+    :return: The quantized model, in evaluation mode.
+    :rtype: torch.nn.Module
+    """
+    path = weights_path(model_name)
+
+    if os.path.exists(path):
+        # The structure of the quantized model is rebuilt from the configuration, without reading the float32 weights
+        model = quantize(AutoModelForQuestionAnswering.from_config(AutoConfig.from_pretrained(model_name)).eval())
+        model.load_state_dict(torch.load(path, map_location='cpu'))
+
+        return model.eval()
+
+    model = quantize(AutoModelForQuestionAnswering.from_pretrained(model_name).eval())
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Written atomically, so that another worker never loads a partial file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.pt')
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            torch.save(model.state_dict(), f)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    return model.eval()
+
+
+def load_quantized_pipeline(model_name):
+    """
+    Build the question-answering pipeline of a model quantized to int8.
+
+    :param model_name: The name (or local path) of the underlying model, without the `@int8` suffix.
+    :type model_name: str
+    :return: The question-answering pipeline, on CPU.
+    :rtype: transformers.QuestionAnsweringPipeline
+    """
+    return pipeline("question-answering", model=load_quantized_model(model_name),
+                    tokenizer=AutoTokenizer.from_pretrained(model_name), device=-1)
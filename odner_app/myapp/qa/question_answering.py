@@ -10,15 +10,34 @@ The `highlight_entities` function takes a text and a dictionary of entities as i
 tuple containing the highlighted text, color codes for each entity, and a list of the entities. 
 The function loops through each entity in the dictionary, generates a unique inline style for the entity, 
 and creates a span tag with the inline style for each word in the entity's list. The resulting HTML string is returned as the highlighted text.
+It is a pure function, so it takes no lock and concurrent requests do not wait for each other.
+
+The `build_response` function assembles the response from the answers of the sentences: the highlighted sentences are
+collected and joined once (`high_qa`), so the cost grows linearly with the number of sentences. With `highlight` set
+to "offsets" (or `QA_HIGHLIGHT` in the settings) no HTML is built at all: each sentence gets the [start, end] offsets
+of its answer (`offsets`) and the frontend renders them.
+
+The `answer_sentences` generator holds the answering logic shared by `QA` and the streaming view of `qa_stream.py`
+(with their parameters read by `qa_params`): it splits the context in sentences, answers them a chunk at a time and
+then answers the whole context. The sentences are split by `spacy_loader.sentences`, so with an inference daemon
+(`INFERENCE_SOCKET`) the web workers load no spaCy model at all.
 
 The `QA` class-based view is a subclass of `generics.CreateAPIView` that overrides the `post` method. 
 The `post` method reads the question, model name, and context from the request data, 
-creates a question-answering pipeline using the specified model, uses the pipeline to answer the question, highlights any entities 
+answers the question over every sentence of the context in batched forward passes and then over the whole context, highlights any entities 
 in the context that match the answer using the `highlight_entities` 
 function, and returns a JSON response containing the highlighted text and answer.
-
-The `qa` pipeline is created using the `pipeline` function from the Hugging Face Transformers library, 
-which creates a question-answering pipeline using the specified model. The `result` variable is a 
+When `top_k` is given (or `QA_RETRIEVAL_TOP_K` is set), a BM25 index of the sentences (see `retrieval.py`) shortlists
+the sentences closest to the question first: only those, and their concatenation instead of the whole context, are
+sent to the model; the other sentences get an empty answer.
+With `mode` set to "windows" (or `QA_MODE` in the settings), the two passes are replaced by a single one: the model
+runs over the overlapping windows of the context (`max_length` and `stride` tokens, default `QA_MAX_LENGTH` and
+`QA_STRIDE`, see `window_qa.py`), the best
+answer of each window is mapped to the sentence where it starts for `high_qa`, and the best answer overall is `answer`.
+The requests are not serialized: the work of concurrent requests is micro-batched per model by `scheduler.py`.
+
+The `qa` pipeline is taken from the process-wide registry in `model_registry.py`, which builds it with the `pipeline` 
+function from the Hugging Face Transformers library the first time the model is used and keeps it loaded across requests. The `result` variable is a 
 dictionary containing the answer, start and end indices of the answer in the context, 
 and a score representing the confidence of the answer. 
 The answer is extracted from the `result` dictionary and returned in the JSON response along with the 
@@ -27,12 +46,12 @@ highlighted text.
 
 
 import json
-import spacy
 from django.http import JsonResponse
 from rest_framework import generics
-from transformers import pipeline
+from myapp.qa import qa_engine, retrieval, window_qa
+from django.conf import settings
+from myapp.nlp import spacy_loader
 import os
-import logging
 import re
 import threading
 from functools import wraps
@@ -67,7 +86,6 @@ def JSONToDict(filename):
     return data_dict
 
 
-@thread_safe
 def highlight_entities(text, start_pos, end_pos):
     """
     Highlight the specified range of the entity in the text with a different color
@@ -89,14 +107,169 @@ def highlight_entities(text, start_pos, end_pos):
     return highlighted_text
 
 
+def build_response(sentes, results, result, context_qa, context, highlight='html'):
+    """
+    Build the response of /api/qa/ from the answers of the sentences and the answer over the whole context.
+
+    :param sentes: The sentences of the context.
+    :type sentes: list
+    :param results: The answer of each sentence, with the `start` and `end` offsets relative to the sentence.
+    :type results: list
+    :param result: The answer over the whole context (or the selected sentences).
+    :type result: dict
+    :param context_qa: The text the answer over the whole context refers to.
+    :type context_qa: str
+    :param context: The context of the request.
+    :type context: str
+    :param highlight: 'html' returns the sentences with their answer highlighted (`high_qa`), 'offsets' returns the
+        [start, end] offsets of the answer of each sentence (`offsets`) and of the answer (`start`, `end`) instead.
+    :type highlight: str
+    :return: The data of the response.
+    :rtype: dict
+    """
+    answers = [result1['answer'] for result1 in results]
+    scores = [result1['score'] for result1 in results]
+
+    data = {'answer': result['answer'], 'score': result['score'], 'answers': answers, 'scores': scores, 'sentes': sentes}
+
+    if highlight == 'offsets':
+        data['offsets'] = [[result1['start'], result1['end']] for result1 in results]
+        data['start'] = result['start']
+        data['end'] = result['end']
+
+        # The offsets of the answer refer to the selected sentences when the retrieval left some out
+        if context_qa != context:
+            data['context_qa'] = context_qa
+
+    else:
+        # Highlight the answer of every sentence, and join the pieces once.
+        data['high_qa'] = ''.join(highlight_entities(textx, result1['start'], result1['end'])
+                                  for textx, result1 in zip(sentes, results))
+
+    return data
+
+
+
+def number_param(request, name, parse=int):
+    """
+    Read a numeric parameter of a request (None when it is missing or empty).
+
+    :raises ValueError: If the parameter is not a number.
+    """
+    value = request.data.get(name, None)
+
+    if value is None or value == '':
+        return None
+
+    try:
+        return parse(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Parametro {name} non valido: {value!r}")
+
+
+def qa_params(request):
+    """
+    Read the answering parameters of a request to /api/qa/ or /api/qa-stream/ (see `answer_sentences`).
+
+    The size of the windows is clamped to the limit of the tokenizer later, in `window_qa.window_params`.
+
+    :param request: The HTTP request object.
+    :type request: HttpRequest
+    :return: The `mode`, `top_k`, `margin`, `max_length` and `stride` parameters.
+    :rtype: dict
+    :raises ValueError: If a parameter is not a number, or the windows are not 0 <= stride < max_length.
+    """
+    max_length, stride = window_qa.window_params(number_param(request, 'max_length'), number_param(request, 'stride'),
+                                                 check=True)
+
+    return {
+        # 'sentences' answers every sentence and then the whole context, 'windows' runs the model once over the
+        # windows of the context (max_length/stride tokens) and maps their answers back to the sentences.
+        'mode': request.data.get('mode', None) or getattr(settings, 'QA_MODE', 'sentences'),
+
+        # Optional retrieval stage: only the top_k sentences closest to the question (BM25) reach the model.
+        'top_k': retrieval.get_top_k(number_param(request, 'top_k')),
+        'margin': retrieval.get_margin(number_param(request, 'margin', float)),
+
+        # Missing values are read from QA_MAX_LENGTH and QA_STRIDE in the settings
+        'max_length': max_length,
+        'stride': stride,
+    }
+
+
+def answer_sentences(model_name, question, context, mode='sentences', top_k=None, margin=None, max_length=None,
+                     stride=None, chunk=None):
+    """
+    Answer a question over every sentence of a context, then over the whole context.
+
+    :param model_name: The name (or local path) of the question-answering model.
+    :type model_name: str
+    :param question: The question to answer.
+    :type question: str
+    :param context: The context.
+    :type context: str
+    :param mode: 'sentences' or 'windows' (see the module docstring).
+    :type mode: str
+    :param top_k: The number of sentences shortlisted by the retrieval ('sentences' mode, None or 0: all of them).
+    :type top_k: int
+    :param chunk: The number of sentences answered at a time ('sentences' mode, None: all of them at once).
+    :type chunk: int
+    :return: In order: ('sentences', sentences); ('answers', first, results) with the answers of the sentences from
+        `first` on, one chunk at a time; ('result', result, context_qa) with the answer over the whole context and the
+        text it refers to (the selected sentences when the retrieval left some out).
+    :rtype: generator
+    """
+    # Sentence boundaries (and the terms of the retrieval), from the inference daemon when there is one
+    split = spacy_loader.sentences(context, question if top_k and mode != 'windows' else None)
+    bounds = split['bounds']
+    sentes = [context[start:end] for start, end in bounds]
+
+    yield 'sentences', sentes
+
+    if mode == 'windows':
+        # Answer the question once over the windows of the context.
+        windows = qa_engine.answer_windows(model_name, question, context, max_length, stride)
+
+        # Best answer inside each sentence, and best answer overall.
+        yield 'answers', 0, window_qa.per_sentence(windows, bounds)
+        yield 'result', window_qa.best(windows) or qa_engine.empty_result(), context
+        return
+
+    selected = list(range(len(sentes)))
+
+    if top_k:
+        # Score the sentences against the question and shortlist the candidates.
+        index = retrieval.BM25(split['terms'])
+        selected = retrieval.shortlist(index.scores(split['question']), top_k, margin)
+
+    chosen = set(selected)
+    chunk = chunk or max(1, len(sentes))
+
+    # Answer the (selected) sentences in document order, a chunk at a time, in batched forward passes; the sentences
+    # left out by the retrieval keep an empty answer.
+    for first in range(0, len(sentes), chunk):
+        indexes = range(first, min(first + chunk, len(sentes)))
+        asked = [i for i in indexes if i in chosen]
+
+        answered = dict(zip(asked, qa_engine.answer_batch(model_name, question, [sentes[i] for i in asked])))
+
+        yield 'answers', first, [answered.get(i) or qa_engine.empty_result() for i in indexes]
+
+    if len(selected) < len(sentes):
+        # Answer the question over the selected sentences only.
+        context_qa = ' '.join(sentes[i] for i in selected)
+    else:
+        context_qa = context
+
+    # Answer the question over the whole context (its windows are batched too).
+    yield 'result', qa_engine.answer(model_name, question, context_qa), context_qa
+
 
 class QA(generics.CreateAPIView):
     """
         Class-based view to perform question - answering task
     """
 
-    lock = threading.RLock()
-
     def post(self, request, *args, **kwargs):
         """
         :param request: The HTTP request object.
@@ -104,13 +277,19 @@ class QA(generics.CreateAPIView):
         :return: A JSON response containing the highlighted text and answer.
         :rtype: JsonResponse
         """
-        logger = logging.getLogger('appLog')
-        highlight_text = ''  # Initialize highlight text to an empty string.
-
         # Get the question, model name, and context from the request data.
         question = request.data.get('question', None)
         model_name = request.data.get('model', None)
         context = request.data.get('text', None)
+
+        # Bad answering parameters are a client error.
+        try:
+            params = qa_params(request)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        # 'html' returns the highlighted sentences, 'offsets' the offsets of the answers for the frontend to render.
+        highlight = request.data.get('highlight', None) or getattr(settings, 'QA_HIGHLIGHT', 'html')
         #context = context.replace("b\'","").replace("\'","")
         
         #style = "background-color: red;"
@@ -118,78 +297,17 @@ class QA(generics.CreateAPIView):
         # If no question was provided, return an error message.
         if question == None:
             return JsonResponse({'high': "Nessuna domanda inviata", })
-        
-        nlp = spacy.load("en_core_web_md")
-        doc = nlp(context)
-        highlight_texts = ""
-        answers = []
-        scores = []
-        sentes = []
-        for element in doc.sents:
-            logger.error(element)
-            text = str(element)
-            sentes.append(text)
-
-        for textx in sentes:  
-            with self.lock:
-            # Create a question-answering pipeline using the specified model.
-             qa1 = pipeline("question-answering", model=model_name, n_process=-1 , disable=[ 'parser', 'lemmatizer', 'tagger','tok2vec'])
-
-            # Use the pipeline to answer the question.
-             result1 = qa1(question=question, context=textx)
-            #logger.error(result1)
-             logger.error("CIAONE")
-            # Extract the answer from the result.
-             answer = result1['answer']
-
-             score = result1['score']
-
-             start_pos = result1['start']
-             end_pos = result1['end']
-            # Highlight any entities in the context that match the answer.
-             #logger.error(type(text))
-             #logger.error(len(text))
-             logger.error(textx)
-
-             #highlighted_text = text[:start_pos]+"<span style=\'"+style+"\'>"+text[start_pos:end_pos]+"</span>"+text[end_pos:]
-
-             highlight_text2 = highlight_entities(textx, start_pos, end_pos)
-             #logger.error(highlight_text2)
-             #logger.error(start_pos)
-             #logger.error(end_pos)
-             answers.append(answer)
-             scores.append(score)
-             highlight_texts = highlight_texts + highlight_text2
-            #break
-            #logger.error(highlight_texts)
-
-
-	
-
-        logger.error("CIAO555")
-        with self.lock:
-            # Create a question-answering pipeline using the specified model.
-            qa = pipeline("question-answering", model=model_name)
-
-            # Use the pipeline to answer the question.
-            result = qa(question=question, context=context)
-
-        # Extract the answer from the result.
-        answer = result['answer']
-
-        score = result['score']
-
-        start_pos = result['start']
-        end_pos = result['end']
-        logger.error(start_pos)
-        logger.error(end_pos)
-        logger.error("end")
-        # Highlight any entities in the context that match the answer.
-        highlight_text = highlight_entities(context, start_pos, end_pos)
-
-        # Return a JSON response containing the highlighted text and answer.
-        return JsonResponse({'high_qa': highlight_texts, 'answer': answer, 'score': score, 'answers': answers, 'scores': scores, 'sentes' : sentes})
-
 
+        # Answer every sentence (all at once), then the whole context.
+        results = []
 
+        for step in answer_sentences(model_name, question, context, **params):
+            if step[0] == 'sentences':
+                sentes = step[1]
+            elif step[0] == 'answers':
+                results.extend(step[2])
+            else:
+                _, result, context_qa = step
 
+        # Return a JSON response containing the highlighted text (or the offsets) and answer.
+        return JsonResponse(build_response(sentes, results, result, context_qa, context, highlight))
@@ -0,0 +1,141 @@
+"""
+Lexical pre-filter of the passages sent to the question-answering models.
+
+Most of the sentences of a contract have nothing to do with a given question, yet running the transformer over them
+costs as much as over the relevant ones. A BM25 index over the tokens of the sentences scores them against the
+question for almost nothing, and only the best candidates reach the model:
+
+    - `terms(tokens)`: the indexed terms of a spaCy span or doc (lower-cased tokens, punctuation and spaces removed).
+    - `BM25(documents)`: the Okapi BM25 index of a list of tokenized passages; `scores(query)` scores all of them.
+    - `shortlist(scores, top_k, margin)`: the passages to send to the model: the `top_k` best ones, plus, as a recall
+      safety margin, every passage whose score is within `margin` (a fraction) of the k-th best score. The passages
+      are returned in document order. When no passage shares a term with the question, all of them are kept.
+
+The retrieval is opt-in: `QA_RETRIEVAL_TOP_K` (0 disables it) and `QA_RETRIEVAL_MARGIN` in the settings, or the
+`top_k` and `margin` parameters of /api/qa/. Its effect on recall can be measured with `benchmarks/retrieval_benchmark.py`.
+"""
+
+import math
+from collections import Counter
+
+from django.conf import settings
+
+
+# Default number of passages kept (0: retrieval disabled)
+DEFAULT_TOP_K = 0
+
+# Default recall margin: passages scoring at least (1 - margin) times the k-th best score are kept too
+DEFAULT_MARGIN = 0.2
+
+
+def get_top_k(top_k=None):
+    """
+    Return the number of passages to keep (None reads `QA_RETRIEVAL_TOP_K` from the settings, 0 disables the retrieval).
+    """
+    if top_k is None or top_k == '':
+        top_k = getattr(settings, 'QA_RETRIEVAL_TOP_K', DEFAULT_TOP_K)
+
+    return max(0, int(top_k))
+
+
+def get_margin(margin=None):
+    """
+    Return the recall margin (None reads `QA_RETRIEVAL_MARGIN` from the settings).
+    """
+    if margin is None or margin == '':
+        margin = getattr(settings, 'QA_RETRIEVAL_MARGIN', DEFAULT_MARGIN)
+
+    return min(1.0, max(0.0, float(margin)))
+
+
+def terms(tokens):
+    """
+    Return the indexed terms of a sequence of spaCy tokens.
+
+    :param tokens: A spaCy span or doc.
+    :return: The lower-cased tokens, without punctuation and spaces.
+    :rtype: list
+    """
+    return [token.lower_ for token in tokens if not (token.is_punct or token.is_space)]
+
+
+class BM25:
+    """
+    Okapi BM25 index of a list of tokenized passages.
+    """
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        """
+        :param documents: The terms of each passage.
+        :type documents: list
+        :param k1: The saturation of the term frequencies.
+        :type k1: float
+        :param b: The normalization by the length of the passages.
+        :type b: float
+        """
+        self.k1 = k1
+        self.b = b
+        self.frequencies = [Counter(document) for document in documents]
+        self.lengths = [len(document) for document in documents]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+        document_frequency = Counter()
+
+        for frequencies in self.frequencies:
+            document_frequency.update(frequencies.keys())
+
+        n = len(documents)
+
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+
+    def scores(self, query):
+        """
+        Score every passage against a query.
+
+        :param query: The terms of the query.
+        :type query: list
+        :return: The score of each passage, in order.
+        :rtype: list
+        """
+        query = [term for term in set(query) if term in self.idf]
+
+        scores = []
+
+        for frequencies, length in zip(self.frequencies, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / self.average_length) if self.average_length else self.k1
+            score = 0.0
+
+            for term in query:
+                tf = frequencies.get(term)
+
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+
+            scores.append(score)
+
+        return scores
+
+
+def shortlist(scores, top_k, margin=None):
+    """
+    Select the passages to send to the question-answering model.
+
+    :param scores: The BM25 score of each passage.
+    :type scores: list
+    :param top_k: The number of best passages to keep.
+    :type top_k: int
+    :param margin: The recall margin (None reads `QA_RETRIEVAL_MARGIN` from the settings).
+    :type margin: float
+    :return: The indexes of the selected passages, in document order.
+    :rtype: list
+    """
+    margin = get_margin(margin)
+
+    if top_k <= 0 or top_k >= len(scores) or not any(scores):
+        return list(range(len(scores)))
+
+    threshold = sorted(scores, reverse=True)[top_k - 1] * (1 - margin)
+
+    best = set(sorted(range(len(scores)), key=lambda i: -scores[i])[:top_k])
+
+    return [i for i, score in enumerate(scores) if i in best or (score > 0 and score >= threshold)]
@@ -0,0 +1,241 @@
+"""
+Micro-batching of the question-answering work of concurrent requests.
+
+The views used to serialize every call to the pipeline behind a lock, so concurrent users of /api/qa/ each ran their
+own tiny forward passes, one after the other. The scheduler queues the (question, context) items of all the requests
+instead, and one worker thread per model answers them in micro-batches:
+
+    - a batch starts with the oldest waiting item, and collects the items that arrive in the next `QA_SCHEDULER_MAX_WAIT_MS`
+      milliseconds, up to `QA_SCHEDULER_MAX_BATCH` items;
+    - the batch goes through the pipeline in a single call (which splits it in forward passes of `QA_BATCH_SIZE` windows),
+      and each result is handed back to the request that is waiting for it;
+    - the items of different models never share a batch, and the pipeline of a model is only ever used by one thread
+      at a time, which it requires.
+
+A worker with nothing to do for `QA_SCHEDULER_IDLE_SECONDS` exits and drops its queue, and the next item for its
+model starts a new one: the threads do not pile up with the model names of the requests, even unknown ones (whose
+items fail when the pipeline cannot be loaded).
+
+When the server is idle a request waits at most `QA_SCHEDULER_MAX_WAIT_MS` milliseconds more than before; under load
+the forward passes are full and the throughput grows with the batch size. The scheduler can be turned off with
+`QA_SCHEDULER = False`: each request then calls the pipeline itself, one at a time per model.
+
+    - `run(model_name, inputs, batch_size)`: answers the {'question', 'context'} inputs, returns one result per input.
+    - `model_lock(model_name)`: the lock held while the model is in use, for the code that runs the model directly
+      (e.g. the windows of `window_qa.py`).
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+
+from myapp.inference import client as inference_client
+from myapp.qa.model_registry import get_qa_pipeline
+
+
+# Default maximum number of items of a micro-batch
+DEFAULT_MAX_BATCH = 32
+
+# Default time a micro-batch waits for more items, in milliseconds
+DEFAULT_MAX_WAIT_MS = 5
+
+# Default time an idle worker waits for items before it exits, in seconds
+DEFAULT_IDLE_SECONDS = 60
+
+
+def enabled():
+    """
+    Tell whether the work is micro-batched (`QA_SCHEDULER` in the settings).
+    """
+    return getattr(settings, 'QA_SCHEDULER', True)
+
+
+class Scheduler:
+    """
+    One queue and one worker thread per model, answering the queued items in micro-batches.
+    """
+
+    def __init__(self, max_batch=None, max_wait_ms=None, idle_seconds=None):
+        """
+        :param max_batch: The maximum number of items of a batch (None reads `QA_SCHEDULER_MAX_BATCH` from the settings).
+        :type max_batch: int
+        :param max_wait_ms: The time a batch waits for more items (None reads `QA_SCHEDULER_MAX_WAIT_MS` from the settings).
+        :type max_wait_ms: float
+        :param idle_seconds: The time an idle worker waits before it exits (None reads `QA_SCHEDULER_IDLE_SECONDS` from
+            the settings).
+        :type idle_seconds: float
+        """
+        self._max_batch = max_batch
+        self._max_wait_ms = max_wait_ms
+        self._idle_seconds = idle_seconds
+        self._queues = {}  # model name -> queue of (input, batch size, future)
+        self._locks = {}  # model name -> lock held while the model is in use
+        self._lock = threading.Lock()
+
+    @property
+    def max_batch(self):
+        if self._max_batch is not None:
+            return self._max_batch
+        return max(1, int(getattr(settings, 'QA_SCHEDULER_MAX_BATCH', DEFAULT_MAX_BATCH)))
+
+    @property
+    def max_wait(self):
+        if self._max_wait_ms is not None:
+            return self._max_wait_ms / 1000
+        return max(0.0, float(getattr(settings, 'QA_SCHEDULER_MAX_WAIT_MS', DEFAULT_MAX_WAIT_MS))) / 1000
+
+    @property
+    def idle_seconds(self):
+        if self._idle_seconds is not None:
+            return self._idle_seconds
+        return max(0.0, float(getattr(settings, 'QA_SCHEDULER_IDLE_SECONDS', DEFAULT_IDLE_SECONDS)))
+
+    def model_lock(self, model_name):
+        """
+        Return the lock held while a model is in use.
+
+        :param model_name: The name (or local path) of the model.
+        :type model_name: str
+        :rtype: threading.RLock
+        """
+        with self._lock:
+            return self._locks.setdefault(model_name, threading.RLock())
+
+    def submit(self, model_name, inputs, batch_size):
+        """
+        Queue items for a model.
+
+        :param model_name: The name (or local path) of the model.
+        :type model_name: str
+        :param inputs: The {'question', 'context'} items.
+        :type inputs: list
+        :param batch_size: The number of windows per forward pass.
+        :type batch_size: int
+        :return: One future per item, in the same order, resolved with the result of the item.
+        :rtype: list
+        """
+        futures = [Future() for _ in inputs]
+
+        # The items are queued under the lock, so that an idle worker never exits with items left in its queue
+        with self._lock:
+            items = self._queues.get(model_name)
+
+            if items is None:
+                items = self._queues[model_name] = queue.Queue()
+                threading.Thread(target=self._work, args=(model_name, items), daemon=True,
+                                 name='qa-scheduler-%s' % model_name).start()
+
+            for item, future in zip(inputs, futures):
+                items.put((item, batch_size, future))
+
+        return futures
+
+    def run(self, model_name, inputs, batch_size):
+        """
+        Answer items for a model and wait for the results.
+
+        :return: One result per item, in the same order.
+        :rtype: list
+        """
+        return [future.result() for future in self.submit(model_name, inputs, batch_size)]
+
+    def _collect(self, items):
+        """
+        Wait for the next item, then collect the items arriving within the maximum wait, up to the maximum batch size
+        (None if no item arrives within the idle time).
+        """
+        try:
+            batch = [items.get(timeout=self.idle_seconds)]
+        except queue.Empty:
+            return None
+
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(items.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _work(self, model_name, items):
+        """
+        Answer the items of a model, one micro-batch at a time.
+        """
+        while True:
+            batch = self._collect(items)
+
+            if batch is None:
+                with self._lock:
+                    if items.empty():
+                        # Idle: the next item for the model starts a new worker
+                        del self._queues[model_name]
+                        return
+                continue
+
+            batch = [(item, batch_size, future) for item, batch_size, future in batch
+                     if future.set_running_or_notify_cancel()]
+
+            if not batch:
+                continue
+
+            try:
+                with self.model_lock(model_name):
+                    outputs = get_qa_pipeline(model_name)([item for item, _, _ in batch],
+                                                          batch_size=max(batch_size for _, batch_size, _ in batch))
+
+                # A single input gives back a single dictionary instead of a list
+                if isinstance(outputs, dict):
+                    outputs = [outputs]
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, _, future), output in zip(batch, outputs):
+                future.set_result(output)
+
+
+# Scheduler shared by all the views of the worker process
+scheduler = Scheduler()
+
+
+def model_lock(model_name):
+    """
+    Return the lock held while a model is in use.
+    """
+    return scheduler.model_lock(model_name)
+
+
+def run(model_name, inputs, batch_size):
+    """
+    Answer {'question', 'context'} items with a model, micro-batched with the items of the other requests.
+
+    :param model_name: The name (or local path) of the model.
+    :type model_name: str
+    :param inputs: The items.
+    :type inputs: list
+    :param batch_size: The number of windows per forward pass.
+    :type batch_size: int
+    :return: One result per item, in the same order.
+    :rtype: list
+    """
+    if not inputs:
+        return []
+
+    if inference_client.enabled():
+        # The models are held by the inference daemon, whose own scheduler batches the work of all the web workers
+        return inference_client.call('qa', model_name, inputs, batch_size)
+
+    if enabled():
+        return scheduler.run(model_name, inputs, batch_size)
+
+    with model_lock(model_name):
+        outputs = get_qa_pipeline(model_name)(inputs, batch_size=batch_size)
+
+    # A single input gives back a single dictionary instead of a list
+    return [outputs] if isinstance(outputs, dict) else outputs
@@ -0,0 +1,181 @@
+"""
+Persistent per-document index of the tokens of the contexts, one per tokenizer.
+
+Every question asked about a stored contract made the pipeline tokenize the whole text again and rebuild its windows.
+The tokens of a context do not depend on the question, so they are computed once per (context, tokenizer) and kept
+on disk in a compact binary format:
+
+    - `input_ids.npy`: the ids of the tokens of the context, without special tokens (int32, shape (n,));
+    - `offsets.npy`: the character offsets of each token in the context (int32, shape (n, 2)).
+
+The files are stored under `QA_INDEX_DIR` (default: `myapp/upload_file/txt_files/index/`), in a folder named after the
+SHA-256 of the context, with the name of the tokenizer key in front: an edited text gets a new index, a tokenizer
+shared by several models is indexed once. They are memory-mapped on load, so opening the index of a long contract
+costs neither tokenization nor a copy.
+
+    - `tokenizer_key(tokenizer)`: the identifier of a tokenizer in the file names.
+    - `get_index(tokenizer, context)`: returns the `TokenIndex` of the context, building and saving it on first use.
+    - `remove(context)`: deletes the indexes of a context (used when a text is edited).
+    - `windows(n_tokens, budget, stride)`: the token ranges of the overlapping windows of a context.
+
+The windows themselves depend on the length of the question, so they are computed from the index for each question:
+it is plain arithmetic on the token positions.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from django.conf import settings
+
+
+# Default folder of the indexes
+DEFAULT_INDEX_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'upload_file', 'txt_files', 'index')
+
+
+class TokenIndex:
+    """
+    Tokens of a context: their ids and their character offsets.
+    """
+
+    def __init__(self, input_ids, offsets):
+        self.input_ids = input_ids
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.input_ids)
+
+
+def index_dir():
+    """
+    Return the folder of the indexes (`QA_INDEX_DIR` in the settings).
+    """
+    return getattr(settings, 'QA_INDEX_DIR', None) or DEFAULT_INDEX_DIR
+
+
+def tokenizer_key(tokenizer):
+    """
+    Return an identifier of a tokenizer: its name, its class and the size of its vocabulary.
+
+    :param tokenizer: The Hugging Face tokenizer.
+    :return: A short hexadecimal digest.
+    :rtype: str
+    """
+    description = '\x00'.join([str(tokenizer.name_or_path), type(tokenizer).__name__, str(len(tokenizer))])
+
+    return hashlib.sha256(description.encode('utf-8')).hexdigest()[:16]
+
+
+def context_dir(context):
+    """
+    Return the folder of the indexes of a context.
+    """
+    return os.path.join(index_dir(), hashlib.sha256(context.encode('utf-8')).hexdigest())
+
+
+def remove(context):
+    """
+    Delete the indexes of a context, for every tokenizer.
+
+    :param context: The context (e.g. the previous version of an edited text).
+    :type context: str
+    """
+    shutil.rmtree(context_dir(context), ignore_errors=True)
+
+
+def build_index(tokenizer, context):
+    """
+    Tokenize a context.
+
+    :param tokenizer: The Hugging Face tokenizer (a fast one, which gives the offsets).
+    :param context: The context.
+    :type context: str
+    :return: The index of the context.
+    :rtype: TokenIndex
+    """
+    encoding = tokenizer(context, add_special_tokens=False, return_offsets_mapping=True, truncation=False,
+                         verbose=False)
+
+    input_ids = np.asarray(encoding['input_ids'], dtype=np.int32)
+    offsets = np.asarray(encoding['offset_mapping'], dtype=np.int32).reshape(-1, 2)
+
+    return TokenIndex(input_ids, offsets)
+
+
+def _save(array, path):
+    """
+    Save an array atomically, so that a concurrent reader never maps a partial file.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.npy')
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def get_index(tokenizer, context):
+    """
+    Return the index of a context for a tokenizer, building and saving it on first use.
+
+    :param tokenizer: The Hugging Face tokenizer.
+    :param context: The context.
+    :type context: str
+    :return: The index, memory-mapped from disk.
+    :rtype: TokenIndex
+    """
+    folder = context_dir(context)
+    key = tokenizer_key(tokenizer)
+
+    path_ids = os.path.join(folder, key + '.input_ids.npy')
+    path_offsets = os.path.join(folder, key + '.offsets.npy')
+
+    if not (os.path.exists(path_ids) and os.path.exists(path_offsets)):
+        os.makedirs(folder, exist_ok=True)
+
+        index = build_index(tokenizer, context)
+
+        _save(index.offsets, path_offsets)
+        _save(index.input_ids, path_ids)
+
+    try:
+        return TokenIndex(np.load(path_ids, mmap_mode='r'), np.load(path_offsets, mmap_mode='r'))
+    except ValueError:
+        # An empty array cannot be memory-mapped
+        return TokenIndex(np.load(path_ids), np.load(path_offsets))
+
+
+def windows(n_tokens, budget, stride):
+    """
+    Return the token ranges of the windows of a context, overlapping by `stride` tokens.
+
+    :param n_tokens: The number of tokens of the context.
+    :type n_tokens: int
+    :param budget: The number of context tokens that fit in a window.
+    :type budget: int
+    :param stride: The number of tokens shared by two consecutive windows.
+    :type stride: int
+    :return: The (start, end) token ranges, in order.
+    :rtype: list
+    """
+    budget = max(1, budget)
+    step = max(1, budget - stride)
+
+    ranges = []
+    start = 0
+
+    while True:
+        end = min(start + budget, n_tokens)
+        ranges.append((start, end))
+
+        if end >= n_tokens:
+            return ranges
+
+        start += step
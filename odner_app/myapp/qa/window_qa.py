@@ -0,0 +1,339 @@
+"""
+Question answering over the windows of a context, built from its token index.
+
+The pipeline tokenizes the question and the context together and splits the result in overlapping windows at every
+call. Here the context comes already tokenized from `token_index.py`, and the features of each window are assembled
+directly from the token ids: the special tokens and the question around a slice of the context ids, padded to the
+longest window of the batch. The model scores every window, and the best span of each window is chosen as the
+pipeline does:
+
+    - the start and end logits are turned into probabilities over the tokens of the context and the [CLS] token, whose
+      probability is then dropped (as the question-answering pipeline does, so that the scores are the same);
+    - the score of a span is the product of the probability of its start and of its end, with
+      start <= end < start + `QA_MAX_ANSWER_LENGTH`;
+    - the span is mapped back to characters with the offsets of its tokens.
+
+The forward pass runs either the torch model of the pipeline or an ONNX Runtime session (see `onnx_backend.py`).
+
+The size of the windows and their overlap are `QA_MAX_LENGTH` and `QA_STRIDE` (384 and 128 tokens by default,
+as the question-answering pipeline). The token index of a context is stored on disk only when `QA_TOKEN_INDEX` is
+enabled; otherwise it is built in memory for the request.
+
+    - `answer_windows(qa, question, context)`: the best span of each window of the context.
+    - `answer_items(qa, items)`: the same for many (question, context) pairs, whose windows share the same batches.
+    - `best(results)`: the best of them.
+    - `per_sentence(results, bounds)`: the best of them inside each sentence, with offsets relative to the sentence.
+"""
+
+from bisect import bisect_right
+
+import numpy as np
+import torch
+from django.conf import settings
+
+from myapp.qa import token_index
+
+
+# Default number of tokens of a window (question and special tokens included)
+DEFAULT_MAX_LENGTH = 384
+
+# Default number of tokens shared by two consecutive windows
+DEFAULT_STRIDE = 128
+
+# Default maximum number of tokens of an answer
+DEFAULT_MAX_ANSWER_LENGTH = 15
+
+# Default maximum number of tokens of a question
+DEFAULT_MAX_QUESTION_LENGTH = 64
+
+# Default number of windows per forward pass
+DEFAULT_BATCH_SIZE = 16
+
+
+def window_params(max_length=None, stride=None, tokenizer=None, check=False):
+    """
+    Return the size of the windows and their overlap (None reads `QA_MAX_LENGTH` and `QA_STRIDE` from the settings).
+
+    The size is clamped to `model_max_length` of the tokenizer, when one is given, and the overlap to
+    0 <= stride < max_length.
+
+    :param check: Whether the values are checked (and a ValueError raised) instead of clamped.
+    :type check: bool
+    :return: The (max_length, stride) pair.
+    :rtype: tuple
+    :raises ValueError: If `check` is set and the values are not 0 <= stride < max_length.
+    """
+    if max_length is None:
+        max_length = getattr(settings, 'QA_MAX_LENGTH', DEFAULT_MAX_LENGTH)
+
+    if stride is None:
+        stride = getattr(settings, 'QA_STRIDE', DEFAULT_STRIDE)
+
+    max_length, stride = int(max_length), int(stride)
+
+    if check and not 0 <= stride < max_length:
+        raise ValueError(f"Finestre non valide: max_length={max_length}, stride={stride} (0 <= stride < max_length)")
+
+    if tokenizer is not None and tokenizer.model_max_length:
+        max_length = min(max_length, int(tokenizer.model_max_length))
+
+    max_length = max(1, max_length)
+
+    return max_length, min(max(0, stride), max_length - 1)
+
+
+def layout(tokenizer, question_ids):
+    """
+    Return the tokens placed around the context in a window: the ids and the token types before it and after it,
+    and the token type of the context.
+    """
+    # A placeholder context of one token shows where the context goes between the special tokens
+    sequence = tokenizer.build_inputs_with_special_tokens(list(question_ids), [-1])
+    position = sequence.index(-1)
+
+    prefix, suffix = sequence[:position], sequence[position + 1:]
+
+    if 'token_type_ids' in tokenizer.model_input_names:
+        types = tokenizer.create_token_type_ids_from_sequences(list(question_ids), [-1])
+    else:
+        types = [0] * len(sequence)
+
+    return prefix, suffix, types[:position], types[position], types[position + 1:]
+
+
+def softmax(logits):
+    exp = np.exp(logits - logits.max())
+    return exp / exp.sum()
+
+
+def best_span(start_logits, end_logits, max_answer_length, null_logits=None):
+    """
+    Return the best span of a window.
+
+    :param start_logits: The start logits of the tokens of the context.
+    :param end_logits: The end logits of the tokens of the context.
+    :param max_answer_length: The maximum number of tokens of the span.
+    :param null_logits: The (start, end) logits of the [CLS] token, which take part in the normalization without being
+        a possible answer, as in the question-answering pipeline (None: the context tokens only).
+    :return: The (start token, end token, score) of the span.
+    :rtype: tuple
+    """
+    if null_logits is None:
+        start_probs, end_probs = softmax(start_logits), softmax(end_logits)
+    else:
+        start_probs = softmax(np.append(start_logits, null_logits[0]))[:-1]
+        end_probs = softmax(np.append(end_logits, null_logits[1]))[:-1]
+
+    scores = np.outer(start_probs, end_probs)
+
+    # Only the spans with start <= end < start + max_answer_length
+    scores = np.tril(np.triu(scores), max_answer_length - 1)
+
+    start, end = np.unravel_index(np.argmax(scores), scores.shape)
+
+    return int(start), int(end), float(scores[start, end])
+
+
+def forward(model, input_ids, attention_mask, token_type_ids):
+    """
+    Run the model on a batch of windows.
+
+    :param model: The question-answering model: a torch model, or an `onnx_backend.ORTModel`.
+    :param input_ids: The ids of the tokens, shape (windows, tokens).
+    :type input_ids: numpy.ndarray
+    :param attention_mask: The attention mask, shape (windows, tokens).
+    :type attention_mask: numpy.ndarray
+    :param token_type_ids: The token types (None for the models that do not use them), shape (windows, tokens).
+    :type token_type_ids: numpy.ndarray
+    :return: The (start logits, end logits) arrays, shape (windows, tokens).
+    :rtype: tuple
+    """
+    if not isinstance(model, torch.nn.Module):
+        return model.logits(input_ids, attention_mask, token_type_ids)
+
+    inputs = {'input_ids': torch.from_numpy(input_ids), 'attention_mask': torch.from_numpy(attention_mask)}
+
+    if token_type_ids is not None:
+        inputs['token_type_ids'] = torch.from_numpy(token_type_ids)
+
+    inputs = {name: tensor.to(model.device) for name, tensor in inputs.items()}
+
+    with torch.no_grad():
+        outputs = model(**inputs)
+
+    return outputs.start_logits.float().cpu().numpy(), outputs.end_logits.float().cpu().numpy()
+
+
+def answer_windows(qa, question, context, max_length=None, stride=None, batch_size=None):
+    """
+    Answer a question over every window of a context.
+
+    :param qa: The question-answering pipeline (its model and tokenizer are used).
+    :type qa: transformers.QuestionAnsweringPipeline
+    :param question: The question.
+    :type question: str
+    :param context: The context.
+    :type context: str
+    :param max_length: The number of tokens of a window (None reads `QA_MAX_LENGTH` from the settings).
+    :type max_length: int
+    :param stride: The number of tokens shared by two windows (None reads `QA_STRIDE` from the settings).
+    :type stride: int
+    :param batch_size: The number of windows per forward pass (None reads `QA_BATCH_SIZE` from the settings).
+    :type batch_size: int
+    :return: For each window, in order, its best answer: a dictionary with the `answer`, `score`, `start` and `end`
+        keys (character offsets in the context) and `window`, the (start, end) characters of the window.
+    :rtype: list
+    """
+    return answer_items(qa, [(question, context)], max_length, stride, batch_size)[0]
+
+
+def answer_items(qa, items, max_length=None, stride=None, batch_size=None, persist=None):
+    """
+    Answer many (question, context) pairs over the windows of their contexts, the windows of all the pairs sharing
+    the same batches.
+
+    :param qa: The question-answering pipeline, or any object with the `tokenizer` and `model` attributes.
+    :param items: The (question, context) pairs.
+    :type items: list
+    :param persist: Whether the token index of the contexts is read from (and saved to) disk, or only built in memory
+        (None reads `QA_TOKEN_INDEX` from the settings: the indexes are stored only when they are used).
+    :type persist: bool
+    :return: For each pair, in order, the best answer of each window of its context (see `answer_windows`).
+    :rtype: list
+    """
+    tokenizer, model = qa.tokenizer, qa.model
+
+    max_length, stride = window_params(max_length, stride, tokenizer)
+
+    if persist is None:
+        persist = getattr(settings, 'QA_TOKEN_INDEX', False)
+
+    if batch_size is None:
+        batch_size = getattr(settings, 'QA_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+    batch_size = max(1, batch_size)
+
+    max_answer_length = getattr(settings, 'QA_MAX_ANSWER_LENGTH', DEFAULT_MAX_ANSWER_LENGTH)
+    max_question_length = getattr(settings, 'QA_MAX_QUESTION_LENGTH', DEFAULT_MAX_QUESTION_LENGTH)
+
+    use_types = 'token_type_ids' in tokenizer.model_input_names
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+
+    # The windows of all the pairs: (pair, index, layout, token range, position of [CLS])
+    features = []
+
+    for item, (question, context) in enumerate(items):
+        index = token_index.get_index(tokenizer, context) if persist else token_index.build_index(tokenizer, context)
+
+        if not len(index):
+            continue
+
+        question_ids = tokenizer(question, add_special_tokens=False)['input_ids'][:max_question_length]
+
+        window_layout = layout(tokenizer, question_ids)
+        prefix, suffix = window_layout[0], window_layout[1]
+
+        # Position of the [CLS] token in the window, if the model has one
+        cls_position = prefix.index(tokenizer.cls_token_id) if tokenizer.cls_token_id in prefix else None
+
+        budget = max_length - len(prefix) - len(suffix)
+
+        for token_range in token_index.windows(len(index), budget, min(stride, budget - 1)):
+            features.append((item, index, window_layout, token_range, cls_position))
+
+    results = [[] for _ in items]
+
+    for i in range(0, len(features), batch_size):
+        batch = features[i:i + batch_size]
+        width = max(len(prefix) + end - start + len(suffix) for _, _, (prefix, suffix, *_), (start, end), _ in batch)
+
+        input_ids = np.full((len(batch), width), pad_id, dtype=np.int64)
+        attention_mask = np.zeros((len(batch), width), dtype=np.int64)
+        token_type_ids = np.zeros((len(batch), width), dtype=np.int64)
+
+        for row, (_, index, (prefix, suffix, prefix_types, context_type, suffix_types), (start, end), _) in enumerate(batch):
+            ids = prefix + index.input_ids[start:end].tolist() + suffix
+            types = prefix_types + [context_type] * (end - start) + suffix_types
+
+            input_ids[row, :len(ids)] = ids
+            attention_mask[row, :len(ids)] = 1
+            token_type_ids[row, :len(ids)] = types
+
+        start_logits, end_logits = forward(model, input_ids, attention_mask, token_type_ids if use_types else None)
+
+        for row, (item, index, (prefix, *_), (start, end), cls_position) in enumerate(batch):
+            # Positions of the context tokens in the window
+            first, last = len(prefix), len(prefix) + end - start
+
+            null_logits = None
+            if cls_position is not None:
+                null_logits = (start_logits[row, cls_position], end_logits[row, cls_position])
+
+            span_start, span_end, score = best_span(start_logits[row, first:last], end_logits[row, first:last],
+                                                    max_answer_length, null_logits)
+
+            char_start = int(index.offsets[start + span_start][0])
+            char_end = int(index.offsets[start + span_end][1])
+
+            context = items[item][1]
+
+            results[item].append({'answer': context[char_start:char_end], 'score': score, 'start': char_start,
+                                  'end': char_end,
+                                  'window': (int(index.offsets[start][0]), int(index.offsets[end - 1][1]))})
+
+    return results
+
+
+def best(results):
+    """
+    Return the best of the answers of the windows, without its window (None if there are none).
+    """
+    if not results:
+        return None
+
+    result = dict(max(results, key=lambda result: result['score']))
+    result.pop('window', None)
+
+    return result
+
+
+def per_sentence(results, bounds):
+    """
+    Map the answers of the windows to the sentences of the context.
+
+    Each answer goes to the sentence where it starts (and is cut at the end of the sentence), and every sentence keeps
+    the best answer it received; the sentences without any answer get an empty one.
+
+    :param results: The answers of the windows (see `answer_windows`).
+    :type results: list
+    :param bounds: The (start, end) characters of each sentence in the context, in order.
+    :type bounds: list
+    :return: One answer per sentence, with the `start` and `end` offsets relative to the sentence.
+    :rtype: list
+    """
+    starts = [start for start, _ in bounds]
+    chosen = [None] * len(bounds)
+
+    for result in results:
+        if not result['answer']:
+            continue
+
+        i = bisect_right(starts, result['start']) - 1
+
+        if i >= 0 and (chosen[i] is None or result['score'] > chosen[i]['score']):
+            chosen[i] = result
+
+    sentences = []
+
+    for (start, end), result in zip(bounds, chosen):
+        if result is None:
+            sentences.append({'answer': '', 'score': 0.0, 'start': 0, 'end': 0})
+            continue
+
+        answer_end = min(result['end'], end)
+
+        sentences.append({'answer': result['answer'][:answer_end - result['start']], 'score': result['score'],
+                          'start': result['start'] - start, 'end': answer_end - start})
+
+    return sentences
+
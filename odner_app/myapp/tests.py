@@ -1,3 +1,1537 @@
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.connection import Listener
+from unittest import mock
+
+import numpy as np
+import openpyxl
+import torch
+from django.http import JsonResponse
 from django.test import TestCase
+from rest_framework.test import APIRequestFactory
+from transformers import BertConfig, BertForQuestionAnswering
+
+from myapp.edit_file import edit_file
+from myapp.filter import highlighter
+from myapp.inference import client, server
+from myapp.jobs import job_queue
+from myapp.load_config import bulkNER, loadConfig
+from myapp.models import NER, PDF, Config, Job, NERResult, QAAnswer, TranslationMemory
+from myapp.nlp import incremental, ner_cache, ner_engine, spacy_loader
+from myapp.qa import answer_cache, model_registry, qa_engine, quantization, retrieval, scheduler, window_qa
+from myapp.qa.qa_stream import QAStream, event
+from myapp.qa.question_answering import QA, answer_sentences, build_response, qa_params
+from myapp.translation import translator
+from myapp.upload_file import text_extraction, xlsx_upload
+
+
+class AnswerCacheTests(TestCase):
+    """
+    Round trip of the answers through the persistent cache (myapp/qa/answer_cache.py).
+    """
+
+    model_name = 'deepset/roberta-base-squad2'
+
+    contexts = ["The contract starts on 1 January 2024.", "The supplier is ACME S.p.A."]
+
+    results = [{'answer': '1 January 2024', 'score': 0.9, 'start': 23, 'end': 37},
+               {'answer': 'ACME S.p.A.', 'score': 0.8, 'start': 16, 'end': 27}]
+
+    def setUp(self):
+        answer_cache._memory.clear()
+
+    def test_round_trip(self):
+        self.assertEqual(answer_cache.get_many(self.model_name, "When?", self.contexts), [None, None])
+
+        answer_cache.set_many(self.model_name, "When?", self.contexts, self.results)
+        self.assertEqual(QAAnswer.objects.count(), 2)
+
+        # From the database, with the question normalized
+        answer_cache._memory.clear()
+        self.assertEqual(answer_cache.get_many(self.model_name, " When?  ", self.contexts), self.results)
+
+        # From the in-process dictionary
+        with self.assertNumQueries(0):
+            self.assertEqual(answer_cache.get_many(self.model_name, "When?", self.contexts), self.results)
+
+    def test_items(self):
+        items = [("When?", self.contexts[0]), ("Who?", self.contexts[1])]
+
+        answer_cache.set_items(self.model_name, items, self.results)
+        answer_cache._memory.clear()
+
+        self.assertEqual(answer_cache.get_items(self.model_name, items + [("Who?", self.contexts[0])]),
+                         self.results + [None])
+        self.assertEqual(answer_cache.get_items('distilbert-base-cased-distilled-squad', items), [None, None])
+
+    def test_invalidate(self):
+        answer_cache.set_many(self.model_name, "When?", self.contexts, self.results)
+
+        answer_cache.invalidate(self.contexts[0])
+
+        self.assertEqual(answer_cache.get_many(self.model_name, "When?", self.contexts), [None, self.results[1]])
+        self.assertEqual(QAAnswer.objects.count(), 1)
+
+
+class HighlighterTests(TestCase):
+    """
+    Leftmost-longest matching of the entity highlighter (myapp/filter/highlighter.py).
+    """
+
+    def automaton(self, *patterns):
+        automaton = highlighter.Automaton()
+
+        for pattern in patterns:
+            automaton.add(pattern, pattern)
+
+        return automaton
+
+    def test_longest_at_the_same_start(self):
+        automaton = self.automaton('New', 'New York', 'York City')
+
+        self.assertEqual(automaton.find("New York City"), [(0, 8, 'New York')])
+
+    def test_leftmost_first(self):
+        automaton = self.automaton('Bank of Italy', 'Italy', 'of')
+
+        self.assertEqual(automaton.find("The Bank of Italy and Italy"),
+                         [(4, 17, 'Bank of Italy'), (22, 27, 'Italy')])
+
+    def test_every_occurrence(self):
+        automaton = self.automaton('he', 'she', 'hers')
+
+        self.assertEqual(sorted(automaton.iter_matches("ushers")),
+                         [(1, 4, 'she'), (2, 4, 'he'), (2, 6, 'hers')])
+        self.assertEqual(automaton.find("ushers"), [(1, 4, 'she')])
+
+    def test_highlight_entities(self):
+        text = "Mario Rossi lives in Roma"
+
+        html, colors, entities = highlighter.highlight_entities(
+            text, {'PER': ['Mario Rossi', 'Rossi'], 'LOC': ['Roma', 'Rossi'], 'MISC': ['background', 'span']})
+
+        style = "<span style='background-color: %s;'>"
+
+        self.assertEqual(html, "%sMario Rossi</span> lives in %sRoma</span>" % (
+            style % highlighter.HTML_COLORS[0], style % highlighter.HTML_COLORS[1]))
+        self.assertEqual(colors, highlighter.HTML_COLORS[:3])
+        self.assertEqual(entities, ['PER', 'LOC', 'MISC'])
+
+
+class TextCleaningTests(TestCase):
+    """
+    Page-by-page cleaning of the extracted text (myapp/upload_file/text_extraction.py).
+    """
+
+    text = "The sup-\nplier  pays the  fee\nwithin thirty-\n  days.\r\nLate pay- ments  bear interest. "
+
+    def test_safe_cut(self):
+        self.assertEqual(text_extraction._safe_cut("foo bar baz"), 8)
+        self.assertEqual(text_extraction._safe_cut("foo bar-"), 4)
+        self.assertEqual(text_extraction._safe_cut("foo- bar"), 0)
+        self.assertEqual(text_extraction._safe_cut("foo  bar"), 0)
+        self.assertEqual(text_extraction._safe_cut("foobar "), 0)
+
+    def test_clean_text(self):
+        self.assertEqual(text_extraction.clean_text(self.text),
+                         "The supplier pays the fee within thirtydays. Late payments bear interest. ")
+
+    def test_clean_pages(self):
+        expected = text_extraction.clean_text(self.text)
+
+        # A page can end anywhere, even in the middle of a hyphenated word or of a run of spaces
+        for i in range(len(self.text) + 1):
+            for j in range(i, len(self.text) + 1):
+                pages = [self.text[:i], self.text[i:j], self.text[j:]]
+
+                self.assertEqual(''.join(text_extraction.clean_pages(pages)), expected, pages)
+
+
+def make_pdf(texts):
+    """
+    Return a PDF with one line of text per page.
+    """
+    n_pages = len(texts)
+
+    # 1: catalog, 2: pages, 3: font, then the page and the content of each page
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+                   b" ".join(b"%d 0 R" % (4 + 2 * i) for i in range(n_pages)), n_pages),
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+
+    for i, text in enumerate(texts):
+        content = b"BT /F1 12 Tf 72 720 Td (%s) Tj ET" % text.encode('latin-1')
+
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+                       b"/Contents %d 0 R >>" % (5 + 2 * i))
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+
+    pdf = io.BytesIO()
+    pdf.write(b"%PDF-1.4\n")
+
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(pdf.tell())
+        pdf.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+
+    xref = pdf.tell()
+    pdf.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    pdf.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+    pdf.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+    return pdf.getvalue()
+
+
+class BrokenPool:
+    """
+    Stand-in for a process pool whose processes die after extracting the first range of pages.
+    """
+
+    def map(self, function, *args):
+        yield function(*[arg[0] for arg in args])
+        raise BrokenProcessPool("A process died")
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+class PDFExtractionTests(TestCase):
+    """
+    Serial and parallel extraction of the pages of a PDF (myapp/upload_file/text_extraction.py).
+    """
+
+    texts = ["Page %d of the con-" % i for i in range(10)]
+
+    def setUp(self):
+        self.pdf = io.BytesIO(make_pdf(self.texts))
+
+    def pages(self, parallel):
+        return [page.strip() for page in text_extraction.iter_pdf_pages(self.pdf, parallel)]
+
+    def test_worker_count(self):
+        with self.settings(PDF_EXTRACTION_WORKERS=4, PDF_PAGES_PER_WORKER=10):
+            self.assertEqual([text_extraction.worker_count(n) for n in [1, 19, 20, 35, 1000]], [1, 1, 2, 3, 4])
+
+    def test_serial(self):
+        self.assertEqual(self.pages(False), self.texts)
+
+    def test_parallel(self):
+        pool = ThreadPoolExecutor(3)
+        self.addCleanup(pool.shutdown)
+
+        # The ranges of pages come back in order from the pool
+        with self.settings(PDF_EXTRACTION_WORKERS=3, PDF_PAGES_PER_WORKER=2), \
+                mock.patch.object(text_extraction, 'get_pool', return_value=pool) as get_pool:
+            self.assertEqual(self.pages(True), self.texts)
+
+        get_pool.assert_called_once_with()
+
+    def test_process_pool(self):
+        pool = text_extraction.get_pool()
+        self.addCleanup(text_extraction.discard_pool, pool)
+
+        with self.settings(PDF_EXTRACTION_WORKERS=2, PDF_PAGES_PER_WORKER=2):
+            self.assertEqual(text_extraction.extract_pdf_text(self.pdf, parallel=True),
+                             text_extraction.extract_pdf_text(self.pdf, parallel=False))
+
+        self.assertIs(text_extraction.get_pool(), pool)
+
+    def test_broken_pool(self):
+        pool = BrokenPool()
+
+        with self.settings(PDF_EXTRACTION_WORKERS=2, PDF_PAGES_PER_WORKER=2), \
+                mock.patch.object(text_extraction, 'get_pool', return_value=pool), \
+                mock.patch.object(text_extraction, 'discard_pool') as discard_pool:
+            # The pages the pool did not extract are extracted serially
+            self.assertEqual(self.pages(True), self.texts)
+
+        discard_pool.assert_called_once_with(pool)
+
+
+class XLSXExtractionTests(TestCase):
+    """
+    Streaming extraction of the text of every sheet of a workbook (myapp/upload_file/xlsx_upload.py).
+    """
+
+    def setUp(self):
+        workbook = openpyxl.Workbook()
+        workbook.active.title = "Contratto"
+
+        for row in [["Fornitore", "ACME   S.p.A."], ["Importo", 100]]:
+            workbook.active.append(row)
+
+        workbook.create_sheet("Note").append(["Pagamento  entro  30 giorni"])
+
+        self.xlsx = io.BytesIO()
+        workbook.save(self.xlsx)
+        self.xlsx.seek(0)
+
+    def test_every_sheet(self):
+        out = io.BytesIO()
+
+        text = xlsx_upload.extraction(self.xlsx, out)
+
+        self.assertEqual(text, " Fornitore\n ACME S.p.A.\n Importo\n 100\n Pagamento entro 30 giorni\n")
+        self.assertEqual(out.getvalue(), text.encode('utf-8'))
+
+    def test_read_only(self):
+        workbooks = []
+        original = openpyxl.load_workbook
+
+        def load_workbook(*args, **kwargs):
+            workbook = original(*args, **kwargs)
+            workbook.close = mock.Mock(wraps=workbook.close)
+            workbooks.append(workbook)
+            return workbook
+
+        with mock.patch.object(xlsx_upload.openpyxl, 'load_workbook', side_effect=load_workbook) as patched:
+            rows = xlsx_upload.iter_rows_text(self.xlsx)
+
+            self.assertEqual(next(rows), " Fornitore\n ACME S.p.A.\n")
+
+            # The rows come one at a time, and the workbook is closed when the generator ends
+            rows.close()
+
+        patched.assert_called_once_with(self.xlsx, read_only=True, data_only=True)
+        workbooks[0].close.assert_called_once_with()
+
+
+class SplitChunksTests(TestCase):
+    """
+    Splitting of long texts before NER (myapp/nlp/ner_engine.py).
+    """
+
+    def check(self, text, chunk_size):
+        chunks = ner_engine.split_chunks(text, chunk_size)
+
+        self.assertEqual(''.join(chunk for _, chunk in chunks), text)
+        self.assertTrue(all(text[offset:offset + len(chunk)] == chunk for offset, chunk in chunks))
+        self.assertTrue(all(len(chunk) <= chunk_size for _, chunk in chunks))
+
+        return [chunk for _, chunk in chunks]
+
+    def test_short_text(self):
+        self.assertEqual(ner_engine.split_chunks("A short text.", 100), [(0, "A short text.")])
+
+    def test_paragraphs_first(self):
+        text = "First clause. It has two sentences.\n\nSecond clause. It has two sentences too."
+
+        self.assertEqual(self.check(text, 60), ["First clause. It has two sentences.\n\n",
+                                                "Second clause. It has two sentences too."])
+
+    def test_sentences(self):
+        text = "First sentence of the clause. Second sentence of the clause. Third sentence."
+
+        self.assertEqual(self.check(text, 40), ["First sentence of the clause. ",
+                                                "Second sentence of the clause. ",
+                                                "Third sentence."])
+
+    def test_no_boundary(self):
+        self.assertEqual(self.check("x" * 25, 10), ["x" * 10, "x" * 10, "x" * 5])
+
+    def test_long_text(self):
+        text = "Clause %d. The parties agree on the terms of the contract.\n" * 500 % tuple(range(500))
+
+        self.check(text, 1000)
+
+
+def fake_ner_spans(text, language, use_cache=True):
+    """
+    Stand-in for `ner_engine.ner_spans`: every capitalized word is a PER entity.
+    """
+    return [(match.start(), match.end(), 'PER', match.group()) for match in re.finditer(r'[A-Z][a-z]+', text)]
+
+
+class UpdateSpansTests(TestCase):
+    """
+    Incremental refresh of the entities after an edit (myapp/nlp/incremental.py).
+    """
+
+    old = "Alice signed the contract.\nBob pays the fee to Carol every month.\nDave audits the accounts."
+
+    def update(self, new, old_spans=None):
+        if old_spans is None:
+            old_spans = fake_ner_spans(self.old, 'en')
+
+        with mock.patch.object(ner_engine, 'ner_spans', side_effect=fake_ner_spans) as ner_spans:
+            spans, region = incremental.update_spans(old_spans, self.old, new, 'en')
+
+        # The same entities as NER over the whole edited text
+        self.assertEqual(spans, fake_ner_spans(new, 'en'))
+
+        return [call.args[0] for call in ner_spans.call_args_list], region
+
+    def test_unchanged(self):
+        self.assertEqual(self.update(self.old), ([], None))
+
+    def test_only_the_changed_paragraph(self):
+        texts, region = self.update(self.old.replace("Carol", "Erin Smith"))
+
+        self.assertEqual(texts, ["Bob pays the fee to Erin Smith every month.\n"])
+        self.assertEqual(region, (27, 66, 71))
+
+    def test_entity_cut_by_the_region(self):
+        # An entity across the two sentences is recomputed as a whole
+        old_spans = [(0, 5, 'PER', "Alice"), (17, 30, 'MISC', "contract.\nBob"), (66, 70, 'PER', "Dave")]
+
+        texts, region = self.update(self.old.replace("Carol", "Erin"), old_spans)
+
+        self.assertEqual(texts, ["contract.\nBob pays the fee to Erin every month.\n"])
+        self.assertEqual(region, (17, 66, 65))
+
+    def test_insertion_and_deletion(self):
+        self.update("Zoe. " + self.old)
+        self.update(self.old + "\nFrank renews it.")
+        self.update(self.old.replace("\nBob pays the fee to Carol every month.", ""))
+
+
+class SpacyLoaderTests(TestCase):
+    """
+    Process-wide cache of the spaCy pipelines (myapp/nlp/spacy_loader.py), with `spacy.load` stubbed.
+    """
+
+    def setUp(self):
+        for cache in [spacy_loader._pipelines, spacy_loader._info]:
+            patcher = mock.patch.dict(cache, clear=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        def load(model_name, enable=None):
+            time.sleep(0.01)
+            return mock.Mock(name=model_name)
+
+        patcher = mock.patch.object(spacy_loader, 'spacy')
+        self.spacy = patcher.start()
+        self.spacy.load.side_effect = load
+        self.addCleanup(patcher.stop)
+
+    def test_loaded_once(self):
+        nlp = spacy_loader.ner_nlp('it')
+
+        self.assertIs(spacy_loader.ner_nlp('it'), nlp)
+        self.assertIsNot(spacy_loader.load("it_core_news_lg"), nlp)
+
+        self.assertEqual(self.spacy.load.call_args_list, [mock.call("it_core_news_lg", enable=["tok2vec", "ner"]),
+                                                          mock.call("it_core_news_lg")])
+
+    def test_concurrent_loads(self):
+        results = []
+
+        threads = [threading.Thread(target=lambda: results.append(spacy_loader.sentence_nlp())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(self.spacy.load.call_count, 1)
+        self.assertTrue(all(nlp is results[0] for nlp in results))
+
+    def test_preload(self):
+        with self.settings(SPACY_PRELOAD=['sentences', 'ner-en']):
+            spacy_loader.preload()
+
+        self.assertEqual(self.spacy.load.call_args_list, [mock.call("en_core_web_md", enable=["senter"]),
+                                                          mock.call("en_core_web_lg", enable=["tok2vec", "ner"])])
+
+        # Nothing more is loaded on first use
+        spacy_loader.sentence_nlp()
+        spacy_loader.ner_nlp('en')
+
+        self.assertEqual(self.spacy.load.call_count, 2)
+
+    def test_no_preload_with_a_daemon(self):
+        with self.settings(SPACY_PRELOAD=['sentences', 'ner-it'], INFERENCE_SOCKET='/tmp/inference.sock'):
+            spacy_loader.preload()
+
+        self.spacy.load.assert_not_called()
+
+
+class RetrievalTests(TestCase):
+    """
+    BM25 shortlist of the sentences sent to the question-answering model (myapp/qa/retrieval.py).
+    """
+
+    documents = [['the', 'termination', 'notice'], ['the', 'price', 'is', 'paid', 'monthly'],
+                 ['notice', 'period', 'of', 'thirty', 'days'], ['the', 'parties']]
+
+    def test_scores(self):
+        scores = retrieval.BM25(self.documents).scores(['notice', 'of', 'termination', 'unknown'])
+
+        self.assertEqual(scores[1], 0.0)
+        self.assertEqual(scores[3], 0.0)
+        self.assertGreater(scores[0], scores[2])
+        self.assertGreater(scores[2], 0.0)
+
+        # A repeated query term counts once
+        self.assertEqual(retrieval.BM25(self.documents).scores(['notice', 'notice']),
+                         retrieval.BM25(self.documents).scores(['notice']))
+
+    def test_empty(self):
+        self.assertEqual(retrieval.BM25([]).scores(['notice']), [])
+        self.assertEqual(retrieval.BM25([[]]).scores(['notice']), [0.0])
+
+    def test_shortlist(self):
+        scores = [3.0, 1.0, 2.8, 0.0, 2.0]
+
+        self.assertEqual(retrieval.shortlist(scores, 1, margin=0.0), [0])
+        self.assertEqual(retrieval.shortlist(scores, 2, margin=0.0), [0, 2])
+
+        # The passages within the margin of the k-th score are kept too, in document order
+        self.assertEqual(retrieval.shortlist(scores, 1, margin=0.1), [0, 2])
+        self.assertEqual(retrieval.shortlist(scores, 1, margin=1.0), [0, 1, 2, 4])
+
+    def test_shortlist_everything(self):
+        self.assertEqual(retrieval.shortlist([3.0, 1.0, 2.0], 0, margin=0.0), [0, 1, 2])
+        self.assertEqual(retrieval.shortlist([3.0, 1.0, 2.0], 3, margin=0.0), [0, 1, 2])
+        self.assertEqual(retrieval.shortlist([0.0, 0.0, 0.0], 1, margin=0.0), [0, 1, 2])
+
+
+class BestSpanTests(TestCase):
+    """
+    Choice of the answer span of a window (myapp/qa/window_qa.py).
+    """
+
+    def brute_force(self, start_logits, end_logits, max_answer_length):
+        start_probs, end_probs = window_qa.softmax(start_logits), window_qa.softmax(end_logits)
+
+        return max(((s, e, start_probs[s] * end_probs[e]) for s in range(len(start_logits))
+                    for e in range(s, min(s + max_answer_length, len(end_logits)))), key=lambda span: span[2])
+
+    def test_best_span(self):
+        start, end, score = window_qa.best_span(np.array([0.0, 5.0, 0.0, 1.0]), np.array([0.0, 0.0, 5.0, 1.0]), 15)
+
+        self.assertEqual((start, end), (1, 2))
+        self.assertAlmostEqual(score, float(window_qa.softmax(np.array([0.0, 5.0, 0.0, 1.0]))[1]
+                                            * window_qa.softmax(np.array([0.0, 0.0, 5.0, 1.0]))[2]))
+
+    def test_constraints(self):
+        rng = np.random.default_rng(0)
+
+        for max_answer_length in (1, 2, 5, 30):
+            for _ in range(20):
+                start_logits, end_logits = rng.normal(size=20), rng.normal(size=20)
+
+                start, end, score = window_qa.best_span(start_logits, end_logits, max_answer_length)
+                expected = self.brute_force(start_logits, end_logits, max_answer_length)
+
+                self.assertTrue(start <= end < start + max_answer_length)
+                self.assertEqual((start, end), expected[:2])
+                self.assertAlmostEqual(score, expected[2])
+
+    def test_end_before_start(self):
+        # The best start is after the best end: the span is the best one with start <= end
+        start, end, _ = window_qa.best_span(np.array([0.0, 0.0, 9.0]), np.array([9.0, 1.0, 0.0]), 15)
+
+        self.assertLessEqual(start, end)
+
+    def test_null_logits(self):
+        start_logits, end_logits = np.array([1.0, 4.0, 0.5]), np.array([0.5, 1.0, 4.0])
+
+        start, end, score = window_qa.best_span(start_logits, end_logits, 15, null_logits=(3.0, 3.0))
+
+        # The [CLS] token is normalized with the context, as in the question-answering pipeline, but never chosen
+        start_probs = window_qa.softmax(np.array([1.0, 4.0, 0.5, 3.0]))
+        end_probs = window_qa.softmax(np.array([0.5, 1.0, 4.0, 3.0]))
+
+        self.assertEqual((start, end), (1, 2))
+        self.assertAlmostEqual(score, float(start_probs[1] * end_probs[2]))
+        self.assertLess(score, window_qa.best_span(start_logits, end_logits, 15)[2])
+
+
+def fake_pipeline(inputs, batch_size=None):
+    """
+    Stand-in for a question-answering pipeline: the answer is the first word of the context.
+    """
+    outputs = [{'answer': item['context'].split()[0], 'score': 0.5, 'start': 0, 'end': len(item['context'].split()[0])}
+               for item in inputs]
+
+    # A single input gives back a single dictionary, as the pipeline does
+    return outputs[0] if len(outputs) == 1 else outputs
+
+
+class QATestCase(TestCase):
+    """
+    Base class of the tests of the answering code, with the pipeline stubbed by `fake_pipeline`.
+    """
+
+    def setUp(self):
+        answer_cache._memory.clear()
+
+        self.pipeline = mock.Mock(side_effect=fake_pipeline)
+
+        patcher = mock.patch.object(scheduler, 'get_qa_pipeline', return_value=self.pipeline)
+        self.get_qa_pipeline = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def inputs(self):
+        """
+        Return the inputs of each call to the pipeline.
+        """
+        return [call.args[0] for call in self.pipeline.call_args_list]
+
+
+class AnswerBatchTests(QATestCase):
+    """
+    Answers of the sentences of a document in batched forward passes (myapp/qa/qa_engine.py).
+    """
+
+    sentences = ["Alice signs the contract.", "  ", "Bob pays the fee."]
+
+    def test_single_call(self):
+        with self.settings(QA_BATCH_SIZE=8):
+            results = qa_engine.answer_batch('model', "Who?", self.sentences)
+
+        self.assertEqual([result['answer'] for result in results], ["Alice", "", "Bob"])
+        self.assertEqual(results[1], qa_engine.empty_result())
+
+        # One call for all the sentences but the empty one, in batches of QA_BATCH_SIZE
+        self.assertEqual(self.inputs(), [[{'question': "Who?", 'context': self.sentences[0]},
+                                          {'question': "Who?", 'context': self.sentences[2]}]])
+        self.assertEqual(self.pipeline.call_args.kwargs['batch_size'], 8)
+
+    def test_without_scheduler(self):
+        with self.settings(QA_SCHEDULER=False):
+            results = qa_engine.answer_batch('model', "Who?", self.sentences[:1], batch_size=4)
+
+        self.assertEqual(results, [{'answer': "Alice", 'score': 0.5, 'start': 0, 'end': 5}])
+        self.assertEqual(self.pipeline.call_args.kwargs['batch_size'], 4)
+
+    def test_cached(self):
+        results = qa_engine.answer_batch('model', "Who?", self.sentences)
+
+        self.assertEqual(qa_engine.answer_batch('model', "Who?", self.sentences + ["Carol signs."]),
+                         results + [{'answer': "Carol", 'score': 0.5, 'start': 0, 'end': 5}])
+
+        # Only the new sentence reaches the model
+        self.assertEqual(self.inputs()[1], [{'question': "Who?", 'context': "Carol signs."}])
+
+
+class AnswerEntitiesTests(QATestCase):
+    """
+    Answers of the questions of a configuration, one batched call per model (myapp/qa/qa_engine.py).
+    """
+
+    context = "ACME pays the fee within thirty days."
+
+    entity_models = {'PER': 'Spacy', 'supplier': 'model-a', 'fee': 'model-b', 'deadline': 'model-a'}
+
+    questions = {'supplier': "Who is the supplier?", 'fee': "What is paid?", 'deadline': "When?"}
+
+    def test_one_call_per_model(self):
+        results = qa_engine.answer_entities(self.entity_models, self.questions, self.context)
+
+        self.assertEqual(sorted(results), ['deadline', 'fee', 'supplier'])
+        self.assertTrue(all(result['answer'] == "ACME" for result in results.values()))
+
+        self.assertEqual([call.args[0] for call in self.get_qa_pipeline.call_args_list], ['model-a', 'model-b'])
+        self.assertEqual(self.inputs(), [[{'question': "Who is the supplier?", 'context': self.context},
+                                          {'question': "When?", 'context': self.context}],
+                                         [{'question': "What is paid?", 'context': self.context}]])
+
+    def test_keys(self):
+        results = qa_engine.answer_entities(self.entity_models, self.questions, self.context, keys=['PER', 'fee'])
+
+        self.assertEqual(list(results), ['fee'])
+        self.assertEqual(self.inputs(), [[{'question': "What is paid?", 'context': self.context}]])
+
+    def test_cached_questions(self):
+        qa_engine.answer_questions('model-a', ["When?"], self.context)
+
+        qa_engine.answer_entities(self.entity_models, self.questions, self.context)
+
+        # Only the questions without a cached answer reach the model
+        self.assertEqual(self.inputs()[1], [{'question': "Who is the supplier?", 'context': self.context}])
+
+    def test_empty_context(self):
+        results = qa_engine.answer_questions('model-a', ["Who?", "When?"], "  ")
+
+        self.assertEqual(results, [qa_engine.empty_result()] * 2)
+        self.pipeline.assert_not_called()
+
+
+class EchoView:
+    """
+    View run by the job queue tests: reports its progress and returns the data of its request.
+    """
+
+    def post(self, request, *args, **kwargs):
+        job_queue.report('echo', 1, 2)
+
+        return JsonResponse({'data': request.data, 'job': job_queue.current_job()})
+
+
+class FailingView:
+    """
+    View run by the job queue tests: fails.
+    """
+
+    def post(self, request, *args, **kwargs):
+        raise ValueError("No text sent")
+
+
+class JobQueueTests(TestCase):
+    """
+    Claim, run and completion of the background jobs (myapp/jobs/job_queue.py).
+    """
+
+    def queue(self, view, payload):
+        return Job.objects.create(view='myapp.tests.' + view.__name__, payload=json.dumps(payload), files='{}')
+
+    def test_claim_run_done(self):
+        job = self.queue(EchoView, {'text': "The contract."})
+
+        claimed = job_queue.claim('worker-1')
+
+        self.assertEqual(claimed.id, job.id)
+        self.assertEqual((claimed.status, claimed.worker, claimed.attempts), (Job.RUNNING, 'worker-1', 1))
+        self.assertIsNotNone(claimed.started)
+
+        # A running job is not claimed twice
+        self.assertIsNone(job_queue.claim('worker-2'))
+
+        self.assertTrue(job_queue.run(claimed))
+        self.assertIsNone(job_queue.current_job())
+
+        status = job_queue.status(job.id)
+
+        self.assertEqual(status['status'], Job.DONE)
+        self.assertEqual(status['stage'], 'echo')
+        self.assertEqual(status['progress'], 1.0)
+        self.assertEqual(status['result'], {'data': {'text': "The contract."}, 'job': job.id})
+        self.assertIsNotNone(status['finished'])
+
+    def test_oldest_first(self):
+        first = self.queue(EchoView, {'text': "First"})
+        second = self.queue(EchoView, {'text': "Second"})
+
+        self.assertEqual(job_queue.claim('worker-1').id, first.id)
+        self.assertEqual(job_queue.claim('worker-2').id, second.id)
+        self.assertIsNone(job_queue.claim('worker-3'))
+
+    def test_failed(self):
+        job = self.queue(FailingView, {})
+
+        self.assertFalse(job_queue.run(job_queue.claim('worker-1')))
+
+        status = job_queue.status(job.id)
+
+        self.assertEqual(status['status'], Job.FAILED)
+        self.assertIn("ValueError: No text sent", status['error'])
+        self.assertIsNone(status['result'])
+
+    def test_unknown_job(self):
+        self.assertIsNone(job_queue.status(0))
+
+
+class BuildResponseTests(TestCase):
+    """
+    Response of /api/qa/ in its 'html' and 'offsets' modes (myapp/qa/question_answering.py).
+    """
+
+    sentes = ["The supplier is ACME. ", "The fee is 100 euros. "]
+
+    results = [{'answer': 'ACME', 'score': 0.9, 'start': 16, 'end': 20},
+               {'answer': '100 euros', 'score': 0.7, 'start': 11, 'end': 20}]
+
+    context = ''.join(sentes)
+
+    result = {'answer': 'ACME', 'score': 0.9, 'start': 16, 'end': 20}
+
+    def test_offsets(self):
+        data = build_response(self.sentes, self.results, self.result, self.context, self.context, 'offsets')
+
+        self.assertEqual(data, {'answer': 'ACME', 'score': 0.9, 'answers': ['ACME', '100 euros'], 'scores': [0.9, 0.7],
+                                'sentes': self.sentes, 'offsets': [[16, 20], [11, 20]], 'start': 16, 'end': 20})
+
+        for sentence, (start, end), answer in zip(data['sentes'], data['offsets'], data['answers']):
+            self.assertEqual(sentence[start:end], answer)
+
+    def test_offsets_of_the_selected_sentences(self):
+        # The retrieval kept the second sentence only: the offsets of the answer refer to it
+        result = {'answer': '100 euros', 'score': 0.7, 'start': 11, 'end': 20}
+
+        data = build_response(self.sentes, self.results, result, self.sentes[1], self.context, 'offsets')
+
+        self.assertEqual(data['context_qa'], self.sentes[1])
+        self.assertEqual(data['context_qa'][data['start']:data['end']], data['answer'])
+
+    def test_html(self):
+        data = build_response(self.sentes, self.results, self.result, self.context, self.context)
+
+        self.assertEqual(data['high_qa'], "The supplier is <span style='background-color: red;'>ACME</span>. "
+                                          "The fee is <span style='background-color: red;'>100 euros</span>. ")
+        self.assertNotIn('offsets', data)
+        self.assertNotIn('context_qa', data)
+
+
+class QAParamsTests(TestCase):
+    """
+    Answering parameters of /api/qa/ and /api/qa-stream/ (myapp/qa/question_answering.py, myapp/qa/window_qa.py).
+    """
+
+    def params(self, **data):
+        return qa_params(mock.Mock(data=data))
+
+    def test_defaults(self):
+        with self.settings(QA_MAX_LENGTH=256, QA_STRIDE=64):
+            params = self.params(max_length='', stride=None)
+
+        self.assertEqual((params['max_length'], params['stride']), (256, 64))
+
+        params = self.params(max_length='200', stride=50, top_k='3', margin='0.5')
+
+        self.assertEqual((params['max_length'], params['stride'], params['top_k'], params['margin']), (200, 50, 3, 0.5))
+
+    def test_bad_values(self):
+        for data in [{'max_length': 'long'}, {'stride': [1]}, {'top_k': 'all'}, {'margin': 'x'},
+                     {'max_length': 128, 'stride': 128}, {'stride': -1}, {'max_length': 0}]:
+            with self.subTest(data=data), self.assertRaises(ValueError):
+                self.params(**data)
+
+    def test_bad_request(self):
+        for view in [QA, QAStream]:
+            for data in [{'max_length': 'long'}, {'max_length': 100, 'stride': 200}]:
+                request = APIRequestFactory().post('/', dict(data, question="Who?", text="Alice.", model='m'),
+                                                   format='json')
+
+                with self.subTest(view=view.__name__, data=data):
+                    response = view.as_view()(request)
+
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn('error', json.loads(response.content))
+
+    def test_clamped_to_the_tokenizer(self):
+        tokenizer = mock.Mock(model_max_length=512)
+
+        self.assertEqual(window_qa.window_params(4096, 1024, tokenizer), (512, 511))
+        self.assertEqual(window_qa.window_params(384, 128, tokenizer), (384, 128))
+
+        # Tokenizers without a limit report a huge model_max_length
+        self.assertEqual(window_qa.window_params(4096, 1024, mock.Mock(model_max_length=int(1e30))), (4096, 1024))
+
+
+class FakeModel:
+    """
+    Stand-in for the model of a pipeline, whose size is given (see `model_registry.model_size`).
+    """
+
+    def __init__(self, size):
+        self.size = size
+
+
+class ModelRegistryTests(TestCase):
+    """
+    Process-wide registry of the question-answering pipelines (myapp/qa/model_registry.py).
+    """
+
+    sizes = {'small': 30, 'medium': 50, 'large': 70}
+
+    def setUp(self):
+        self.registry = model_registry.ModelRegistry(max_bytes=100)
+        self.loads = []
+
+        def load(model_name):
+            self.loads.append(model_name)
+            time.sleep(0.02)
+
+            if model_name not in self.sizes:
+                raise OSError("No such model: %s" % model_name)
+
+            return mock.Mock(model=FakeModel(self.sizes[model_name]))
+
+        patcher = mock.patch.object(self.registry, 'load', side_effect=load)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_lru_by_bytes(self):
+        small, medium = self.registry.get('small'), self.registry.get('medium')
+
+        self.assertIs(self.registry.get('small'), small)
+        self.assertEqual(self.registry.used_bytes, 80)
+
+        # 'medium' is the least recently used: evicted to make room for 'large', 'small' stays
+        self.registry.get('large')
+
+        self.assertEqual(list(self.registry._pipelines), ['small', 'large'])
+        self.assertEqual(self.registry.used_bytes, 100)
+
+        self.assertIsNot(self.registry.get('medium'), medium)
+        self.assertEqual(self.loads, ['small', 'medium', 'large', 'medium'])
+
+    def test_concurrent_get_loads_once(self):
+        results = []
+
+        threads = [threading.Thread(target=lambda: results.append(self.registry.get('small'))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(self.loads, ['small'])
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(qa is results[0] for qa in results))
+
+    def test_failed_load(self):
+        for _ in range(2):
+            with self.assertRaises(OSError):
+                self.registry.get('missing')
+
+        self.assertEqual(self.loads, ['missing', 'missing'])
+        self.assertEqual(self.registry._loading, {})
+        self.assertEqual(self.registry.used_bytes, 0)
+
+
+class QuantizationTests(TestCase):
+    """
+    The int8 quantized backend of the question-answering models (myapp/qa/quantization.py), with a tiny model.
+    """
+
+    def setUp(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+
+        self.model_name = os.path.join(folder, 'model')
+
+        config = BertConfig(vocab_size=100, hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+                            intermediate_size=64)
+        BertForQuestionAnswering(config).save_pretrained(self.model_name)
+
+        quantized_dir = self.settings(QA_QUANTIZED_DIR=os.path.join(folder, 'quantized'))
+        quantized_dir.enable()
+        self.addCleanup(quantized_dir.disable)
+
+    def test_split_name(self):
+        self.assertEqual(quantization.split_name('legal-bert-finetuned-squad-it@int8'),
+                         ('legal-bert-finetuned-squad-it', True))
+        self.assertEqual(quantization.split_name('legal-bert-finetuned-squad-it'),
+                         ('legal-bert-finetuned-squad-it', False))
+
+    def test_weights_cached_on_disk(self):
+        model = quantization.load_quantized_model(self.model_name)
+
+        self.assertTrue(os.path.exists(quantization.weights_path(self.model_name)))
+        self.assertLess(model_registry.model_size(model),
+                        model_registry.model_size(BertForQuestionAnswering.from_pretrained(self.model_name)))
+
+        # The second load reads the quantized weights, not the float32 ones
+        with mock.patch.object(quantization.AutoModelForQuestionAnswering, 'from_pretrained') as from_pretrained:
+            cached = quantization.load_quantized_model(self.model_name)
+
+        from_pretrained.assert_not_called()
+
+        for name, value in model.state_dict().items():
+            if isinstance(value, torch.Tensor):
+                self.assertTrue(torch.equal(cached.state_dict()[name], value), name)
+
+    def test_weights_path(self):
+        path = quantization.weights_path(self.model_name)
+
+        with mock.patch.object(quantization.torch, '__version__', '0.0'):
+            self.assertNotEqual(quantization.weights_path(self.model_name), path)
+
+        # Retraining the checkpoint quantizes it again
+        os.utime(os.path.join(self.model_name, 'config.json'), (time.time() + 10, time.time() + 10))
+
+        self.assertNotEqual(quantization.weights_path(self.model_name), path)
+
+    def test_dispatch(self):
+        registry = model_registry.ModelRegistry()
+
+        with mock.patch.object(model_registry, 'load_quantized_pipeline') as load_quantized_pipeline, \
+                mock.patch.object(model_registry.onnx_backend, 'available', return_value=False), \
+                mock.patch.object(model_registry, 'pipeline') as pipeline:
+            self.assertIs(registry.load('model@int8'), load_quantized_pipeline.return_value)
+            self.assertIs(registry.load('model'), pipeline.return_value)
+
+        load_quantized_pipeline.assert_called_once_with('model')
+        pipeline.assert_called_once_with("question-answering", model='model')
+
+        with mock.patch.object(model_registry.onnx_backend, 'available', return_value=True), \
+                mock.patch.object(model_registry.onnx_backend, 'ORTPipeline') as ort_pipeline:
+            self.assertIs(registry.load('model'), ort_pipeline.return_value)
+
+        ort_pipeline.assert_called_once_with('model')
+
+    def test_same_revision(self):
+        self.assertEqual(answer_cache.model_revision(self.model_name + '@int8'),
+                         answer_cache.model_revision(self.model_name))
+
+
+class SchedulerTests(TestCase):
+    """
+    Micro-batching of the question-answering work of concurrent requests (myapp/qa/scheduler.py).
+    """
+
+    def setUp(self):
+        self.batches = []
+
+        def pipeline(inputs, batch_size):
+            self.batches.append(len(inputs))
+            time.sleep(0.01)
+            return [{'answer': item['context'], 'score': 1.0} for item in inputs]
+
+        patcher = mock.patch.object(scheduler, 'get_qa_pipeline', return_value=pipeline)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_concurrent_requests(self):
+        qa_scheduler = scheduler.Scheduler(max_batch=4, max_wait_ms=20)
+        results = {}
+
+        def request(caller):
+            inputs = [{'question': "Who?", 'context': '%d-%d' % (caller, i)} for i in range(3)]
+            results[caller] = [output['answer'] for output in qa_scheduler.run('model', inputs, 16)]
+
+        threads = [threading.Thread(target=request, args=(caller,)) for caller in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        # Every caller gets its own results, in order
+        self.assertEqual(results, {caller: ['%d-%d' % (caller, i) for i in range(3)] for caller in range(8)})
+
+        self.assertEqual(sum(self.batches), 24)
+        self.assertLessEqual(max(self.batches), 4)
+        self.assertLess(len(self.batches), 24)
+
+    def test_idle_worker_exits(self):
+        qa_scheduler = scheduler.Scheduler(max_wait_ms=0, idle_seconds=0.05)
+
+        for model_name in ['idle-a', 'idle-b']:
+            self.assertEqual(qa_scheduler.run(model_name, [{'question': "Who?", 'context': "Alice"}], 16)[0]['answer'],
+                             "Alice")
+
+        workers = [thread for thread in threading.enumerate() if thread.name in ['qa-scheduler-idle-a',
+                                                                                 'qa-scheduler-idle-b']]
+        self.assertEqual(len(workers), 2)
+
+        for thread in workers:
+            thread.join(5)
+
+        self.assertFalse(any(thread.is_alive() for thread in workers))
+        self.assertEqual(qa_scheduler._queues, {})
+
+        # A new worker starts with the next item
+        self.assertEqual(qa_scheduler.run('idle-a', [{'question': "Who?", 'context': "Bob"}], 16)[0]['answer'], "Bob")
+
+
+def fake_sentences(text, question):
+    """
+    Stand-in for the `sentences` handler of the inference daemon: a sentence ends with a period.
+    """
+    return {'bounds': [(match.start(), match.end()) for match in re.finditer(r'[^.]+\.?', text)]}
+
+
+def parse_events(chunks):
+    """
+    Return the (name, data) pairs of server-sent events.
+    """
+    events = []
+
+    for chunk in chunks:
+        for block in chunk.decode('utf-8').split('\n\n')[:-1]:
+            name, data = block.split('\n')
+            events.append((name[len('event: '):], json.loads(data[len('data: '):])))
+
+    return events
+
+
+class QAStreamTests(QATestCase):
+    """
+    Server-sent events of /api/qa-stream/ (myapp/qa/qa_stream.py).
+    """
+
+    text = "Alice signs. Bob pays."
+
+    def setUp(self):
+        super().setUp()
+
+        patcher = mock.patch.object(spacy_loader, 'sentences', side_effect=fake_sentences)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, **data):
+        data = dict({'question': "Who?", 'model': 'model', 'text': self.text}, **data)
+
+        return QAStream.as_view()(APIRequestFactory().post('/', data, format='json'))
+
+    def test_event(self):
+        self.assertEqual(event('start', {'sentences': 2}), 'event: start\ndata: {"sentences": 2}\n\n')
+
+    def test_stream(self):
+        response = self.post(chunk=1, highlight='offsets')
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(response['X-Accel-Buffering'], 'no')
+
+        chunks = iter(response.streaming_content)
+
+        # The first sentence is sent after the first chunk of sentences, before the others are answered
+        self.assertEqual(parse_events([next(chunks), next(chunks)]),
+                         [('start', {'sentences': 2}),
+                          ('sentence', {'index': 0, 'sentence': "Alice signs.", 'answer': "Alice", 'score': 0.5,
+                                        'start': 0, 'end': 5})])
+        self.assertEqual(len(self.inputs()), 1)
+
+        self.assertEqual(parse_events(chunks),
+                         [('sentence', {'index': 1, 'sentence': " Bob pays.", 'answer': "Bob", 'score': 0.5,
+                                        'start': 0, 'end': 3}),
+                          ('result', {'answer': "Alice", 'score': 0.5, 'start': 0, 'end': 5})])
+
+    def test_html(self):
+        events = parse_events(self.post().streaming_content)
+
+        self.assertEqual([name for name, _ in events], ['start', 'sentence', 'sentence', 'result'])
+        self.assertEqual(events[1][1]['high'], "<span style='background-color: red;'>Alice</span> signs.")
+
+        # Without a chunk, the sentences are answered together
+        self.assertEqual(len(self.inputs()), 2)
+
+    def test_error(self):
+        self.pipeline.side_effect = RuntimeError("Out of memory")
+
+        with self.assertLogs('appLog', 'ERROR'):
+            events = parse_events(self.post().streaming_content)
+
+        self.assertEqual(events, [('start', {'sentences': 2}), ('error', {'error': "RuntimeError: Out of memory"})])
+
+
+class InferenceDaemonTests(TestCase):
+    """
+    Calls of the web workers to the inference daemon (myapp/inference/client.py and server.py).
+    """
+
+    def setUp(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder, ignore_errors=True)
+
+        # One connection served by the handlers of the daemon, in a thread
+        listener = Listener(os.path.join(folder, 'inference.sock'), family='AF_UNIX', authkey=client.authkey())
+        self.addCleanup(listener.close)
+
+        threading.Thread(target=lambda: server.serve_connection(listener.accept()), daemon=True).start()
+
+        settings_override = self.settings(INFERENCE_SOCKET=listener.address)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(client._close)
+
+    def test_call(self):
+        self.assertTrue(client.enabled())
+        self.assertEqual(client.call('ping'), 'pong')
+
+        with mock.patch.dict(server.HANDLERS, {'add': lambda a, b: a + b}):
+            self.assertEqual(client.call('add', 2, 3), 5)
+
+    def test_error(self):
+        def fail():
+            raise ValueError("No model")
+
+        with mock.patch.dict(server.HANDLERS, {'fail': fail}):
+            with self.assertLogs('appLog', 'ERROR'), \
+                    self.assertRaisesRegex(client.InferenceError, "ValueError: No model"):
+                client.call('fail')
+
+            # The connection is still usable
+            self.assertEqual(client.call('ping'), 'pong')
+
+    def test_sentences_in_the_daemon(self):
+        text = "The supplier is ACME. The fee is 100 euros."
+
+        with mock.patch.dict(server.HANDLERS, {'sentences': fake_sentences}), \
+                mock.patch.object(spacy_loader, 'sentence_nlp', side_effect=AssertionError("spaCy loaded")):
+            self.assertEqual(spacy_loader.sentences(text), {'bounds': [(0, 21), (21, 43)]})
+
+            self.assertEqual(next(answer_sentences('model', "Who is the supplier?", text)),
+                             ('sentences', ["The supplier is ACME.", " The fee is 100 euros."]))
+
+
+class CountingBackend(translator.TranslationBackend):
+    """
+    Translation backend of the tests: upper-cases the texts and records the batches it receives.
+    """
+
+    max_chars = 40
+
+    def __init__(self):
+        self.batches = []
+
+    def translate_batch(self, texts, source, target):
+        self.batches.append(list(texts))
+
+        return [text.upper() for text in texts]
+
+
+class TranslationMemoryTests(TestCase):
+    """
+    Packed batches and translation memory of the uploads (myapp/translation/translator.py).
+    """
+
+    def test_pack(self):
+        texts = ["first clause", "second clause", "third", "a fourth clause", "fifth"]
+
+        batches = translator.pack(texts, 30)
+
+        self.assertEqual(batches, [["first clause", "second clause"], ["third", "a fourth clause", "fifth"]])
+        self.assertTrue(all(sum(len(text) + 1 for text in batch) <= 30 for batch in batches))
+
+    def test_pack_long_text(self):
+        long_text = "x" * 50
+
+        self.assertEqual(translator.pack(["short", long_text, "end"], 30), [["short"], [long_text], ["end"]])
+        self.assertEqual(translator.pack([long_text], 30), [[long_text]])
+        self.assertEqual(translator.pack([], 30), [])
+
+    def test_long_fragment(self):
+        backend = CountingBackend()
+        text = "Il fornitore paga. " + "Una clausola molto lunga che supera il limite del lotto. Fine del testo."
+
+        translation = translator.translate_text(text, backend=backend)
+
+        self.assertEqual(translation, text.upper())
+        self.assertEqual(backend.batches, [["Il fornitore paga"],
+                                           [" Una clausola molto lunga che supera il limite del lotto"],
+                                           [" Fine del testo"]])
+
+    def test_memory(self):
+        fragments = ["Il fornitore paga il canone", "Il contratto dura un anno", "Il fornitore paga il canone"]
+
+        backend = CountingBackend()
+        translations = translator.translate_fragments(fragments, backend=backend)
+
+        self.assertEqual(translations, [fragment.upper() for fragment in fragments])
+
+        # The repeated fragment is sent once
+        self.assertEqual(sum(len(batch) for batch in backend.batches), 2)
+        self.assertEqual(TranslationMemory.objects.count(), 2)
+
+        # The second translation comes from the memory only
+        backend = CountingBackend()
+
+        self.assertEqual(translator.translate_fragments(fragments, backend=backend), translations)
+        self.assertEqual(backend.batches, [])
+
+        # The memory is kept per language pair
+        translator.translate_fragments(fragments[:1], target='fr', backend=backend)
+        self.assertEqual(backend.batches, [fragments[:1]])
+
+
+class FakeTranslationHandler(BaseHTTPRequestHandler):
+    """
+    Fake LibreTranslate server: upper-cases the texts. A text "sleep N" is answered after N seconds, and the first
+    `server.failures` requests get a 503.
+    """
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+
+        with self.server.lock:
+            self.server.requests += 1
+            fail = self.server.requests <= self.server.failures
+
+        if fail:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        for text in data['q']:
+            if text.startswith('sleep '):
+                time.sleep(float(text[6:]))
+
+        with self.server.lock:
+            self.server.answered.append(data['q'])
+
+        body = json.dumps({'translatedText': [text.upper() for text in data['q']]}).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TranslationServerTests(TestCase):
+    """
+    Concurrent translation of the batches against a local fake server (myapp/translation/translator.py).
+    """
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTranslationHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.requests = 0
+        self.server.failures = 0
+        self.server.answered = []
+
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.backend = translator.HTTPBackend('http://127.0.0.1:%d' % self.server.server_port)
+
+    def test_order(self):
+        batches = [['sleep 0.3', 'a'], ['sleep 0.2'], ['sleep 0.1', 'b'], ['c']]
+
+        with self.settings(TRANSLATION_MAX_IN_FLIGHT=4):
+            translations = translator.translate_batches(batches, self.backend, 'it', 'en')
+
+        # The responses arrived in reverse order, the translations are in the order of the batches
+        self.assertEqual(self.server.answered, batches[::-1])
+        self.assertEqual(translations, [['SLEEP 0.3', 'A'], ['SLEEP 0.2'], ['SLEEP 0.1', 'B'], ['C']])
+
+    def test_retry(self):
+        self.server.failures = 2
+
+        with self.settings(TRANSLATION_RETRIES=3, TRANSLATION_BACKOFF=0.1):
+            start = time.monotonic()
+            translations = translator.translate_batches([['a']], self.backend, 'it', 'en')
+            elapsed = time.monotonic() - start
+
+        self.assertEqual(translations, [['A']])
+        self.assertEqual(self.server.requests, 3)
+
+        # Backoff of 0.1 then 0.2 seconds
+        self.assertGreaterEqual(elapsed, 0.3)
+
+    def test_retries_exhausted(self):
+        self.server.failures = 10
+
+        with self.settings(TRANSLATION_RETRIES=2, TRANSLATION_BACKOFF=0.01):
+            with self.assertRaisesRegex(translator.TranslationError, "after 3 attempts"):
+                translator.translate_batches([['a']], self.backend, 'it', 'en')
+
+        self.assertEqual(self.server.requests, 3)
+
+    def test_deadline(self):
+        with self.settings(TRANSLATION_DEADLINE=0.5):
+            start = time.monotonic()
+
+            with self.assertRaisesRegex(translator.TranslationError, "deadline"):
+                translator.translate_batches([['a'], ['sleep 3']], self.backend, 'it', 'en')
+
+        self.assertLess(time.monotonic() - start, 2)
+
+
+class NERCacheTests(TestCase):
+    """
+    Content-addressed cache of the entities (myapp/nlp/ner_cache.py).
+    """
+
+    def setUp(self):
+        ner_cache._stored = 0
+
+    def store(self, text):
+        hash_text = ner_cache.text_hash(text)
+        key = ner_cache.make_key('it_core_news_lg', '3.7.0', 100000, hash_text)
+
+        ner_cache.store(key, 'it_core_news_lg', '3.7.0', hash_text, fake_ner_spans(text, 'it'))
+
+        return key
+
+    def test_round_trip(self):
+        key = self.store("Mario Rossi vive a Roma.")
+
+        self.assertEqual(ner_cache.lookup(key),
+                         [(0, 5, 'PER', "Mario"), (6, 11, 'PER', "Rossi"), (19, 23, 'PER', "Roma")])
+        self.assertIsNone(ner_cache.lookup(ner_cache.make_key('it_core_news_lg', '3.8.0', 100000,
+                                                              ner_cache.text_hash("Mario Rossi vive a Roma."))))
+
+    def test_eviction_interval(self):
+        with self.settings(NER_CACHE_SIZE=2), mock.patch.object(ner_cache, 'EVICT_INTERVAL', 3):
+            keys = [self.store("Testo %d." % i) for i in range(5)]
+
+            # Evicted once, after the third text: the two most recent ones are kept
+            self.assertEqual(NERResult.objects.count(), 4)
+            self.assertIsNone(ner_cache.lookup(keys[0]))
+            self.assertEqual(ner_cache.lookup(keys[2]), [(0, 5, 'PER', "Testo")])
+
+            self.store("Testo 5.")
+
+        self.assertEqual(NERResult.objects.count(), 2)
+
+
+def remove_file(path):
+    if os.path.isfile(path):
+        os.remove(path)
+
+
+class DocumentTestCase(TestCase):
+    """
+    Base class of the tests on the documents: the .txt files are written to a temporary folder, the NER model has a
+    single PER label, and the JSONDicts files written by the tests are removed.
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+
+        # LoadConfig and BulkNER write the entities of the documents next to themselves
+        base_dir = os.path.dirname(os.path.abspath(loadConfig.__file__))
+        self.json_dicts = os.path.join(base_dir, 'JSONDicts')
+
+        if not os.path.isdir(self.json_dicts):
+            os.makedirs(self.json_dicts)
+            self.addCleanup(shutil.rmtree, self.json_dicts, ignore_errors=True)
+
+        file_config = os.path.join(base_dir, 'json_configs', 'base-it.json')
+        Config.objects.create(title=file_config, json=file_config, language='it',
+                              entity_model=json.dumps({label: 'Spacy' for label in ('LOC', 'MISC', 'ORG', 'PER')}))
+
+        ner_info = mock.patch.object(spacy_loader, 'ner_info', return_value={'labels': ['PER']})
+        ner_info.start()
+        self.addCleanup(ner_info.stop)
+
+        index_dir = self.settings(QA_INDEX_DIR=self.folder)
+        index_dir.enable()
+        self.addCleanup(index_dir.disable)
+
+    def document(self, text):
+        """
+        Write the text of a new document, and return its .txt file and the path of its base JSONDicts file.
+        """
+        txt_file = os.path.join(self.folder, 'contract%s-it.txt' % uuid.uuid4().hex)
+
+        with open(txt_file, 'w') as out:
+            out.write(text)
+
+        json_dict = os.path.join(self.json_dicts, os.path.basename(txt_file)[:-6] + 'base-it.json')
+
+        for path in (json_dict, incremental.state_path(json_dict)):
+            self.addCleanup(remove_file, path)
+
+        return txt_file, json_dict
+
+
+class FirstEditTests(DocumentTestCase):
+    """
+    The first edit of a freshly loaded document is refreshed incrementally (myapp/nlp/incremental.py).
+    """
+
+    text = "Alice signed the contract.\nBob pays the fee to Carol every month.\nDave audits the accounts."
+
+    def setUp(self):
+        super().setUp()
+
+        self.txt_file, self.json_dict = self.document(self.text)
+
+    def test_first_edit(self):
+        factory = APIRequestFactory()
+
+        with mock.patch.object(loadConfig, 'ner_spans', side_effect=fake_ner_spans):
+            loadConfig.LoadConfig.as_view()(factory.post('/', {'file_txt_path': self.txt_file, 'language': 'it',
+                                                               'text': self.text}, format='json'))
+
+        self.assertTrue(os.path.isfile(incremental.state_path(self.json_dict)))
+
+        edited = self.text.replace("Carol", "Erin")
+
+        # NER runs on the changed paragraph only, never on the whole text
+        with mock.patch.object(edit_file, 'ner_spans', side_effect=AssertionError("full NER")), \
+                mock.patch.object(ner_engine, 'ner_spans', side_effect=fake_ner_spans) as ner_spans:
+            edit_file.EditTXTView.as_view()(factory.post('/', {'file_toEdit': self.txt_file, 'text_toEdit': edited,
+                                                              'file_source': 'contract.pdf', 'language': 'it'},
+                                                         format='json'))
+
+        self.assertEqual([call.args[0] for call in ner_spans.call_args_list],
+                         ["Bob pays the fee to Erin every month.\n"])
+
+        ner_obj = NER.objects.get(title=self.txt_file)
+
+        self.assertEqual(json.loads(ner_obj.jsondict_str), {'PER': ["Alice", "Bob", "Erin", "Dave"]})
+        self.assertEqual(incremental.load_state(incremental.state_path(self.json_dict), edited, 'it')['spans'],
+                         [list(span) for span in fake_ner_spans(edited, 'it')])
+
+    def test_record_answers(self):
+        path = incremental.state_path(self.json_dict)
+        answer = incremental.answer_state('model', "Who pays?",
+                                          {'answer': "Bob", 'score': 0.9, 'start': 27, 'end': 30})
+
+        # No entities yet: nothing to record
+        incremental.record(path, self.text, 'it', qa={'PAYER': answer})
+        self.assertFalse(os.path.isfile(path))
+
+        incremental.record(path, self.text, 'it', fake_ner_spans(self.text, 'it'))
+        incremental.record(path, self.text, 'it', qa={'PAYER': answer})
+
+        state = incremental.load_state(path, self.text, 'it')
+
+        self.assertEqual(len(state['spans']), 4)
+        self.assertEqual(state['qa'], {'PAYER': answer})
+        self.assertIsNone(incremental.load_state(path, self.text + " ", 'it'))
+
+
+def fake_iter_ner_spans(texts, language):
+    """
+    Stand-in for `ner_engine.iter_ner_spans` (see `fake_ner_spans`).
+    """
+    for text in texts:
+        yield fake_ner_spans(text, language)
+
+
+class BulkNERTests(DocumentTestCase):
+    """
+    NER of many documents in a background job (myapp/load_config/bulkNER.py).
+    """
+
+    def post(self, data):
+        return bulkNER.BulkNER.as_view()(APIRequestFactory().post('/', data, format='json'))
+
+    def test_job(self):
+        documents = [self.document("Alice signed the contract."), self.document("Bob pays the fee.")]
+        txt_files = [txt_file for txt_file, _ in documents]
+
+        PDF.objects.create(title='contract.pdf', txt_file_pdf_it=txt_files[0])
+
+        response = self.post({'file_txt_paths': txt_files + ['/missing-it.txt'], 'language': 'it'})
+
+        # Queued, not run inside the request
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(NER.objects.exists())
+
+        job_id = json.loads(response.content)['job']
+
+        with mock.patch.object(bulkNER, 'iter_ner_spans', side_effect=fake_iter_ner_spans):
+            self.assertTrue(job_queue.run(job_queue.claim('worker-1')))
+
+        status = job_queue.status(job_id)
+
+        self.assertEqual(status['status'], Job.DONE)
+        self.assertEqual((status['stage'], status['progress']), ('ner', 1.0))
+        self.assertEqual(status['result'], {'processed': txt_files, 'skipped': [], 'missing': ['/missing-it.txt']})
+
+        self.assertEqual([NER.objects.get(title=txt_file).raw_file.name for txt_file in txt_files],
+                         ['contract.pdf', ''])
+        self.assertEqual(json.loads(NER.objects.get(title=txt_files[1]).jsondict_str), {'PER': ["Bob"]})
+
+        # The first edit of the documents is incremental
+        state_path = incremental.state_path(documents[1][1])
+        self.assertIsNotNone(incremental.load_state(state_path, "Bob pays the fee.", 'it'))
+
+    def test_in_the_request(self):
+        txt_file, _ = self.document("Alice signed the contract.")
+
+        with mock.patch.object(bulkNER, 'iter_ner_spans', side_effect=fake_iter_ner_spans):
+            response = self.post({'file_txt_paths': [txt_file], 'language': 'it', 'async': False})
+
+            self.assertEqual(json.loads(response.content), {'processed': [txt_file], 'skipped': [], 'missing': []})
+
+            response = self.post({'file_txt_paths': [txt_file], 'language': 'it', 'async': False})
+
+            self.assertEqual(json.loads(response.content), {'processed': [], 'skipped': [txt_file], 'missing': []})
 
-# Create your tests here.
+        self.assertFalse(Job.objects.exists())
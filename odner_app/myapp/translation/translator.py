@@ -0,0 +1,327 @@
+"""
+Translation of the uploaded documents (Italian -> English).
+
+The text is split on '.' as before: every fragment longer than 5 characters is translated and followed by '.', the
+shorter ones are kept as they are. The fragments are not sent one by one:
+
+    - the fragments already translated are taken from the translation memory (the `TranslationMemory` model, keyed by
+      the SHA-256 of source language, target language and fragment), so the boilerplate clauses repeated across the
+      contracts are translated only once;
+    - the remaining fragments are packed in batches of at most `max_chars` characters of the backend, one request per batch;
+    - the batches are sent concurrently, with at most `TRANSLATION_MAX_IN_FLIGHT` requests in flight, and reassembled
+      in order; a failed request is retried `TRANSLATION_RETRIES` times with exponential backoff (`TRANSLATION_BACKOFF`
+      seconds, doubled at each attempt), and the whole document must be translated within `TRANSLATION_DEADLINE` seconds;
+    - the backend is pluggable (`TRANSLATION_BACKEND` setting): `GoogleBackend` calls Google Translate through
+      deep_translator, `HTTPBackend` calls a LibreTranslate-compatible server (`TRANSLATION_SERVER_URL`, e.g. a local
+      or fake server), `IdentityBackend` returns the text unchanged and stands in for the remote service in tests and
+      air-gapped deployments. Any class with `max_chars` and `translate_batch(texts, source, target)` can be used.
+
+    - `translate_text(text, source, target)`: translates a whole text.
+"""
+
+import hashlib
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from deep_translator import GoogleTranslator
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from myapp.jobs import job_queue
+from myapp.models import TranslationMemory
+
+
+# Default backend used for the translations
+DEFAULT_BACKEND = 'myapp.translation.translator.GoogleBackend'
+
+# Fragments shorter than this are not translated
+MIN_LENGTH = 5
+
+# Number of keys looked up in the translation memory per query
+LOOKUP_CHUNK = 500
+
+# Defaults of the concurrent translation: requests in flight, retries of a failed request,
+# first backoff delay (seconds) and deadline of a whole document (seconds)
+DEFAULT_MAX_IN_FLIGHT = 8
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_DEADLINE = 300
+
+
+class TranslationError(Exception):
+    """
+    Raised when a document cannot be translated (a batch keeps failing or the deadline expires).
+    """
+
+
+class TranslationBackend:
+    """
+    Base class of the translation backends.
+    """
+
+    # Maximum number of characters of a batch
+    max_chars = 4500
+
+    def translate_batch(self, texts, source, target):
+        """
+        Translate a batch of texts.
+
+        :param texts: The texts to translate (their total length is at most `max_chars`, unless a single text is longer).
+        :type texts: list
+        :param source: The language of the texts.
+        :type source: str
+        :param target: The language of the translations.
+        :type target: str
+        :return: The translations, in the same order.
+        :rtype: list
+        """
+        raise NotImplementedError
+
+
+class GoogleBackend(TranslationBackend):
+    """
+    Google Translate through deep_translator: the texts of a batch are sent in a single request, one per line.
+    """
+
+    max_chars = 4500
+
+    def translate_batch(self, texts, source, target):
+        translator = GoogleTranslator(source=source, target=target)
+
+        # Texts spanning several lines cannot be told apart once joined: they are sent alone
+        if len(texts) == 1 or any('\n' in text for text in texts):
+            return [translator.translate(text=text) for text in texts]
+
+        translations = translator.translate(text='\n'.join(texts)).split('\n')
+
+        if len(translations) != len(texts):
+            # The service merged or split some lines: fall back to one request per text
+            return [translator.translate(text=text) for text in texts]
+
+        return translations
+
+
+class HTTPBackend(TranslationBackend):
+    """
+    LibreTranslate-compatible server: POST {url}/translate with the texts of the batch in `q`, the translations are
+    returned in `translatedText`.
+    """
+
+    max_chars = 4500
+
+    def __init__(self, url=None, timeout=60):
+        self.url = (url or getattr(settings, 'TRANSLATION_SERVER_URL', 'http://127.0.0.1:5000')).rstrip('/')
+        self.timeout = timeout
+
+    def translate_batch(self, texts, source, target):
+        response = requests.post(self.url + '/translate', timeout=self.timeout,
+                                 json={'q': list(texts), 'source': source, 'target': target, 'format': 'text'})
+        response.raise_for_status()
+
+        translations = response.json()['translatedText']
+
+        if len(translations) != len(texts):
+            raise TranslationError("the server returned %d translations for %d texts" % (len(translations), len(texts)))
+
+        return translations
+
+
+class IdentityBackend(TranslationBackend):
+    """
+    Local stand-in for the remote service: returns the texts unchanged.
+    """
+
+    max_chars = 1000000
+
+    def translate_batch(self, texts, source, target):
+        return list(texts)
+
+
+def get_backend():
+    """
+    Return an instance of the backend selected by the `TRANSLATION_BACKEND` setting.
+    """
+    return import_string(getattr(settings, 'TRANSLATION_BACKEND', DEFAULT_BACKEND))()
+
+
+def memory_key(text, source, target):
+    """
+    Return the key of a fragment in the translation memory.
+
+    :return: The hexadecimal SHA-256 digest of (source, target, text).
+    :rtype: str
+    """
+    return hashlib.sha256('\x00'.join([source, target, text]).encode('utf-8')).hexdigest()
+
+
+def pack(texts, max_chars):
+    """
+    Pack the texts in consecutive batches of at most `max_chars` characters (separators included).
+
+    :param texts: The texts to pack.
+    :type texts: list
+    :param max_chars: The maximum number of characters of a batch (a longer text gets a batch of its own).
+    :type max_chars: int
+    :return: The batches.
+    :rtype: list
+    """
+    batches = []
+    batch = []
+    size = 0
+
+    for text in texts:
+        if batch and size + len(text) + 1 > max_chars:
+            batches.append(batch)
+            batch = []
+            size = 0
+
+        batch.append(text)
+        size += len(text) + 1
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+def translate_with_retry(batch, backend, source, target, retries, backoff, deadline):
+    """
+    Translate a batch, retrying with exponential backoff when the backend fails.
+
+    :param deadline: The time (as returned by `time.monotonic()`) after which no new attempt is made.
+    :return: The translations of the batch.
+    :rtype: list
+    """
+    attempt = 0
+
+    while True:
+        try:
+            return backend.translate_batch(batch, source, target)
+        except Exception as error:
+            delay = backoff * 2 ** attempt
+            attempt += 1
+
+            if attempt > retries or time.monotonic() + delay >= deadline:
+                raise TranslationError("translation of a batch failed after %d attempts: %s" % (attempt, error))
+
+            time.sleep(delay)
+
+
+def translate_batches(batches, backend, source, target):
+    """
+    Translate the batches concurrently, with at most `TRANSLATION_MAX_IN_FLIGHT` requests in flight.
+
+    :return: The translations of each batch, in the same order.
+    :rtype: list
+    """
+    max_in_flight = max(1, getattr(settings, 'TRANSLATION_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT))
+    retries = getattr(settings, 'TRANSLATION_RETRIES', DEFAULT_RETRIES)
+    backoff = getattr(settings, 'TRANSLATION_BACKOFF', DEFAULT_BACKOFF)
+    deadline = time.monotonic() + getattr(settings, 'TRANSLATION_DEADLINE', DEFAULT_DEADLINE)
+
+    executor = ThreadPoolExecutor(max_workers=min(max_in_flight, max(1, len(batches))))
+
+    try:
+        futures = [executor.submit(translate_with_retry, batch, backend, source, target, retries, backoff, deadline)
+                   for batch in batches]
+
+        pending = futures
+
+        while pending:
+            done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                # A batch that failed for good stops the whole document
+                future.result()
+
+            if not done:
+                raise TranslationError("translation deadline expired with %d batches left" % len(pending))
+
+            job_queue.report('translation', len(futures) - len(pending), len(futures))
+
+        return [future.result() for future in futures]
+
+    finally:
+        # Do not wait for the requests still in flight, and drop the batches not started yet
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def translate_fragments(fragments, source='it', target='en', backend=None):
+    """
+    Translate a list of fragments, using the translation memory for the ones already translated.
+
+    :param fragments: The fragments to translate.
+    :type fragments: list
+    :param source: The language of the fragments.
+    :type source: str
+    :param target: The language of the translations.
+    :type target: str
+    :param backend: The translation backend (None uses the one of the `TRANSLATION_BACKEND` setting).
+    :type backend: TranslationBackend
+    :return: The translations, in the same order.
+    :rtype: list
+    """
+    if backend is None:
+        backend = get_backend()
+
+    keys = {}  # key -> fragment
+
+    for fragment in fragments:
+        keys.setdefault(memory_key(fragment, source, target), fragment)
+
+    known = {}
+    all_keys = list(keys.keys())
+
+    # Look up the memory in chunks, to stay below the limit of query parameters of the database
+    for i in range(0, len(all_keys), LOOKUP_CHUNK):
+        rows = TranslationMemory.objects.filter(key__in=all_keys[i:i + LOOKUP_CHUNK])
+        known.update(rows.values_list('key', 'translation'))
+
+    missing = [key for key in keys if key not in known]
+
+    if missing:
+        batches = pack([keys[key] for key in missing], backend.max_chars)
+
+        translations = [translation for batch in translate_batches(batches, backend, source, target)
+                        for translation in batch]
+
+        rows = []
+
+        for key, translation in zip(missing, translations):
+            known[key] = translation
+            rows.append(TranslationMemory(key=key, source=source, target=target,
+                                          text=keys[key], translation=translation))
+
+        with transaction.atomic():
+            TranslationMemory.objects.bulk_create(rows, ignore_conflicts=True)
+
+    return [known[memory_key(fragment, source, target)] for fragment in fragments]
+
+
+def translate_text(towrite, source='it', target='en', backend=None):
+    """
+    Translate text from Italian to English.
+
+    :param towrite: text to translate
+    :param source: language of the text
+    :param target: language of the translation
+    :param backend: translation backend (None uses the one of the `TRANSLATION_BACKEND` setting)
+    :return: translated text as a string
+    """
+    parts = towrite.split('.')
+
+    fragments = [p for p in parts if len(p) > MIN_LENGTH]
+
+    translations = iter(translate_fragments(fragments, source, target, backend))
+
+    result = []
+
+    for p in parts:
+        if len(p) > MIN_LENGTH:
+            result.append(next(translations) + '.')
+        else:
+            result.append(p)
+
+    return ''.join(result)
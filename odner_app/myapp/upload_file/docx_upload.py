@@ -1,13 +1,14 @@
 from django.http import JsonResponse # importazione libreria per gestire richieste http utilizzando JSON come formato per la serializzazione e deserializzazione dei dati e per inviare al richiedente il testo processato
 from rest_framework import generics 
+from myapp.jobs import job_queue
 from myapp.models import DOC # importazione modello per documenti MSWord (vedi django_pr/models.py)
 from myapp.serializers.docx_serializer import DOCSerializer # importazione serializzatore JSON del modello (vedi my_app/serializers/docx_serializer.py)
 import threading
-import re # libreria per operare con REGEX
 import os # libreria per operare all'interno del SO -> recuperare path_file per salvataggio dei file creati durante il processo
 import docx2txt # libreria per estrarre il testo dal documento .docx
-from deep_translator import GoogleTranslator
+from myapp.upload_file.text_extraction import clean_text
 from django.db import transaction
+from myapp.translation.translator import translate_text
 
 def extraction(to_extract):
         """
@@ -18,43 +19,18 @@ def extraction(to_extract):
         """
         text = docx2txt.process(to_extract) # estrazione testo dal file .docx
 
-        towrite = ""
-
-        # pulizia e riformattazione del testo
-        for line in text:
-
-            if(line == '\n') | (line == '\r') | (line == '\r'):
-                towrite = towrite + ' '
-            else:
-                towrite = towrite + line
-
-        pattern = r'(\w)-\s*(\w)' 
-        replacement = r'\1\2'
-        towrite = re.sub(pattern, replacement, towrite) # aggiustamenti sul testo per gestire \n utilizzando REGEX
-
-        towrite = re.sub(' +', ' ', towrite) # eliminazione spazi superflui sempre tramite REGEX
+        towrite = clean_text(text) # pulizia e riformattazione del testo in un solo passaggio (a capo, parole sillabate, spazi superflui)
 
         return towrite
     
 def translate(towrite):
         """
-        Translate text from Italian to English using Google Translate API.
+        Translate text from Italian to English (batched, with translation memory).
     
         :param towrite: text to translate
         :return: translated text as a string
         """
-        result = ""
-
-        parts = towrite.split('.')
-
-        for p in parts:
-            if len(p) > 5:
-                tmp = GoogleTranslator(source='it', target='en').translate(text=p)
-                result = result + tmp + '.'
-
-            else:
-                result += p
-        return result
+        return translate_text(towrite)
 
 
 # classe per gestire l'upload di un file .docx, estrarne il testo, tradurlo e infine inviare il risultato sotto forma di JSON al richiedente
@@ -75,6 +51,13 @@ class DOCUploadView(generics.CreateAPIView):
         :return: HTTP response.
         :rtype: JsonResponse.
         """
+
+        # Run in the background when the request asks to (see myapp/jobs/job_queue.py)
+        deferred = job_queue.defer(self, request)
+
+        if deferred is not None:
+            return deferred
+
     
 
         uploaded_file = request.FILES.get('file', None)
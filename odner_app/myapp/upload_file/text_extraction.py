@@ -0,0 +1,267 @@
+"""
+Linear-time extraction and cleanup of the text of the uploaded documents.
+
+The text is handled one page at a time and in a single regex pass:
+
+    - the line breaks ('\\n' and '\\r') become spaces;
+    - the words split by a hyphen are joined again ("con- tratto" -> "contratto"), chains included ("a-b-c" -> "abc");
+    - the runs of spaces are collapsed to a single space.
+
+The two substitutions are fused in one compiled pattern. A page can end in the middle of a hyphenated word or of a
+run of spaces, so the tail of each page that could still take part in a substitution is carried over to the next
+one: the cleaned text is the same as cleaning the whole document at once, but it is produced page by page.
+
+    - `clean_pages(pages)`: yields the cleaned text, piece by piece, from an iterable of raw page texts.
+    - `clean_text(text)`: cleans a whole text at once.
+    - `extract_pdf_text(to_extract, out)`: extracts and cleans the text of a PDF, writing each piece to `out` (a binary
+      file, optional) as soon as it is ready, and returns the whole text joined once.
+
+`page.extract_text()` is CPU-bound and holds the GIL, so the pages of a large PDF can be extracted in parallel
+(opt-in, `PDF_PARALLEL_EXTRACTION` setting): the pages are split in contiguous ranges across a bounded process pool
+and their texts are joined back in order. The number of workers depends on the cores (`PDF_EXTRACTION_WORKERS`,
+default: all of them) and on the pages (at least `PDF_PAGES_PER_WORKER` pages each); small files are extracted serially.
+The worker processes re-import this module without setting Django up, so it must not import the models at load time.
+A pool whose processes died is replaced, and the pages it did not extract are extracted serially.
+"""
+
+import io
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from PyPDF2 import PdfReader
+
+
+# Default minimum number of pages extracted by each worker process
+DEFAULT_PAGES_PER_WORKER = 25
+
+# Line breaks become spaces
+NEWLINES = str.maketrans({'\n': ' ', '\r': ' '})
+
+# Hyphens between two words (removed with the whitespace that follows them) or runs of spaces (collapsed), in a single pass
+CLEANUP = re.compile(r'(?<=\w)-\s*(?=\w)| {2,}')
+
+
+def _cleanup(match):
+    """
+    Replacement of the CLEANUP pattern.
+    """
+    if match.group().startswith('-'):
+        return ''
+    return ' '
+
+
+def _safe_cut(buffer):
+    """
+    Return the last position of the buffer before which the text can be cleaned independently of what follows.
+
+    The position must follow a single whitespace character preceded by a character that is neither a whitespace nor
+    a hyphen, and precede a non-whitespace character: no substitution can span it.
+
+    :return: The position, or 0 if there is none.
+    :rtype: int
+    """
+    for i in range(len(buffer) - 1, 1, -1):
+        if buffer[i - 1].isspace() and not buffer[i].isspace() \
+                and not buffer[i - 2].isspace() and buffer[i - 2] != '-':
+            return i
+
+    return 0
+
+
+def clean_pages(pages):
+    """
+    Clean the text of a document page by page.
+
+    :param pages: The raw text of each page, in order.
+    :type pages: iterable
+    :return: The pieces of the cleaned text, in order.
+    :rtype: generator
+    """
+    carry = ''
+
+    for page in pages:
+        buffer = carry + page.translate(NEWLINES)
+
+        cut = _safe_cut(buffer)
+
+        if cut:
+            yield CLEANUP.sub(_cleanup, buffer[:cut])
+            carry = buffer[cut:]
+        else:
+            carry = buffer
+
+    if carry:
+        yield CLEANUP.sub(_cleanup, carry)
+
+
+def clean_text(text):
+    """
+    Clean a whole text.
+
+    :param text: The raw text.
+    :type text: str
+    :return: The cleaned text.
+    :rtype: str
+    """
+    return ''.join(clean_pages([text]))
+
+
+def write_pieces(pieces, out=None):
+    """
+    Write the pieces of a text to a binary file as they come, and join them once.
+
+    :param pieces: The pieces of the text, in order.
+    :type pieces: iterable
+    :param out: The binary file to write to (optional).
+    :return: The whole text.
+    :rtype: str
+    """
+    text = []
+
+    for piece in pieces:
+        if out is not None:
+            out.write(piece.encode('utf-8'))
+        text.append(piece)
+
+    return ''.join(text)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def max_workers():
+    """
+    Return the maximum number of processes used to extract the pages of a PDF.
+    """
+    return max(1, getattr(settings, 'PDF_EXTRACTION_WORKERS', None) or os.cpu_count() or 1)
+
+
+def worker_count(n_pages):
+    """
+    Return the number of processes to use for a PDF with the given number of pages.
+
+    :param n_pages: The number of pages of the PDF.
+    :type n_pages: int
+    :return: The number of processes (1 means serial extraction).
+    :rtype: int
+    """
+    pages_per_worker = max(1, getattr(settings, 'PDF_PAGES_PER_WORKER', DEFAULT_PAGES_PER_WORKER))
+
+    return max(1, min(max_workers(), n_pages // pages_per_worker))
+
+
+def get_pool():
+    """
+    Return the process pool shared by the extractions of the worker process, creating it on first use (or when the
+    previous one is broken).
+
+    The processes are spawned rather than forked, so that they do not inherit the models loaded by the web worker.
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is None or getattr(_pool, '_broken', False):
+            _pool = ProcessPoolExecutor(max_workers=max_workers(), mp_context=multiprocessing.get_context('spawn'))
+
+    return _pool
+
+
+def discard_pool(pool):
+    """
+    Forget a broken process pool, so that the next extraction creates a new one.
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _read_bytes(to_extract):
+    """
+    Return the content of a PDF given as a path or as a file object.
+    """
+    if isinstance(to_extract, (str, os.PathLike)):
+        with open(to_extract, 'rb') as pdf_file:
+            return pdf_file.read()
+
+    to_extract.seek(0)
+    return to_extract.read()
+
+
+def _extract_range(data, start, stop):
+    """
+    Extract the raw text of the pages [start, stop) of a PDF (run in the worker processes).
+    """
+    pdf = PdfReader(io.BytesIO(data))
+
+    return [pdf.pages[i].extract_text() for i in range(start, stop)]
+
+
+def iter_pdf_pages(to_extract, parallel=None):
+    """
+    Yield the raw text of each page of a PDF, in order.
+
+    :param to_extract: path to the PDF file (or file object)
+    :param parallel: whether to split the pages across the process pool (None reads `PDF_PARALLEL_EXTRACTION` from the settings)
+    :return: the text of each page
+    :rtype: generator
+    """
+    # Imported here: the worker processes import this module without Django being set up
+    from myapp.jobs import job_queue
+
+    if parallel is None:
+        parallel = getattr(settings, 'PDF_PARALLEL_EXTRACTION', False)
+
+    data = _read_bytes(to_extract)
+    pdf = PdfReader(io.BytesIO(data))
+
+    n_pages = len(pdf.pages)
+    workers = worker_count(n_pages) if parallel else 1
+
+    if workers == 1:
+        for i, page in enumerate(pdf.pages):
+            job_queue.report('extraction', i, n_pages)
+            yield page.extract_text()
+        return
+
+    # Contiguous ranges of pages, one per worker: pool.map gives them back in order
+    bounds = [n_pages * i // workers for i in range(workers + 1)]
+
+    pool = get_pool()
+    done = 0
+
+    try:
+        for stop, pages in zip(bounds[1:], pool.map(_extract_range, [data] * workers, bounds[:-1], bounds[1:])):
+            job_queue.report('extraction', stop, n_pages)
+            yield from pages
+            done = stop
+    except BrokenProcessPool:
+        # A worker process died: the next extraction gets a new pool, this one ends serially
+        discard_pool(pool)
+
+        for i in range(done, n_pages):
+            job_queue.report('extraction', i, n_pages)
+            yield pdf.pages[i].extract_text()
+
+
+def extract_pdf_text(to_extract, out=None, parallel=None):
+    """
+    Extract the text of a PDF and clean it up, one page at a time.
+
+    :param to_extract: path to the PDF file (or file object)
+    :param out: binary file to stream the cleaned text to (optional)
+    :param parallel: whether to extract the pages in parallel (None reads `PDF_PARALLEL_EXTRACTION` from the settings)
+    :return: cleaned text as a string
+    """
+    pages = iter_pdf_pages(to_extract, parallel)
+
+    return write_pieces(clean_pages(pages), out)
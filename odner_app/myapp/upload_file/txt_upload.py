@@ -4,13 +4,14 @@ import logging
 import getpass
 from django.http import JsonResponse
 from rest_framework import generics
-from PyPDF2 import PdfReader
-from deep_translator import GoogleTranslator
+from myapp.jobs import job_queue
 
 from myapp.models import PDF
+from myapp.upload_file.text_extraction import extract_pdf_text
 from myapp.serializers.pdf_serializer import PDFSerializer
 import threading
 from django.db import transaction
+from myapp.translation.translator import translate_text
 
 
 class TXTUploadView(generics.CreateAPIView):
@@ -21,60 +22,25 @@ class TXTUploadView(generics.CreateAPIView):
 
     lock = threading.RLock()
 
-    def extraction(to_extract):
+    def extraction(to_extract, out=None):
         """
-        Extract text from the given PDF and clean it up.
+        Extract text from the given PDF and clean it up, one page at a time.
         
         :param to_extract: path to the PDF file
+        :param out: binary file to stream the cleaned text to (optional)
         :return: cleaned text as a string
         """
-        pdf = PdfReader(to_extract)
-
-        towrite = ""
-
-        for page in pdf.pages:
-            text = page.extract_text()
-
-            for line in text:
-                if(line == '\n') | (line == '\r') | (line == '\r'):
-                    towrite = towrite + ' '
-                else:
-                    towrite = towrite + line
-
-        pattern = r'(\w)-\s*(\w)'
-        pattern2 = r'(\w)-\n*(\w)'
-        pattern3 = r'(\w)-\n\s*(\w)'
-        replacement = r'\1\2'
-        towrite = re.sub(pattern, replacement, towrite)
-
-        towrite = re.sub(pattern2, replacement, towrite)
-
-        towrite = re.sub(pattern3, replacement, towrite)
-
-        towrite = re.sub(' +', ' ', towrite)
-
-        return towrite
+        return extract_pdf_text(to_extract, out)
 
 
     def translate(towrite):
         """
-        Translate text from Italian to English using Google Translate API.
+        Translate text from Italian to English (batched, with translation memory).
         
         :param towrite: text to translate
         :return: translated text as a string
         """
-        result = ""
-
-        parts = towrite.split('.')
-
-        for p in parts:
-            if len(p) > 5:
-                tmp = GoogleTranslator(source='it', target='en').translate(text=p)
-                result = result + tmp + '.'
-
-            else:
-                result += p
-        return result
+        return translate_text(towrite)
 
     def post(self, request, *args, **kwargs):
         """
@@ -85,6 +51,13 @@ class TXTUploadView(generics.CreateAPIView):
         :return: HTTP response.
         :rtype: JsonResponse.
         """
+
+        # Run in the background when the request asks to (see myapp/jobs/job_queue.py)
+        deferred = job_queue.defer(self, request)
+
+        if deferred is not None:
+            return deferred
+
         logger = logging.getLogger('appLog')
         uploaded_file = request.FILES.get('file', None)
         logger.error("START")
@@ -1,57 +1,59 @@
 from django.http import JsonResponse # importazione libreria per gestire richieste http utilizzando JSON come formato per la serializzazione e deserializzazione dei dati e per inviare al richiedente il testo processato
 from rest_framework import generics
+from myapp.jobs import job_queue
 from myapp.models import XLSX # importazione modello per documenti EXCEL .xlsx (vedi django_pr/models.py)
 from myapp.serializers.xlsxs_erializers import XLSXSerializer # importazione serializzatore JSON del modello (vedi my_app/serializers/xlsx_serializer.py)
 import threading
 import openpyxl # libreria per estrarre il testo dal documento .xlsx
-from deep_translator import (GoogleTranslator) # libreria per la traduzione del testo all'interno del file .txt creato dopo l'estrazione del testo del documento
+from myapp.translation.translator import translate_text # traduzione del testo (a lotti, con memoria di traduzione)
 import re # libreria per operare con REGEX
 import os # libreria per operare all'interno del SO -> recuperare path_file per salvataggio dei file creati durante il processo
 from django.db import transaction
+from myapp.upload_file.text_extraction import write_pieces # scrittura incrementale del testo estratto
 
-# classe per gestire l'upload di un file .xlsx, estrarne il testo, tradurlo e infine inviare il risultato sotto forma di JSON al richiedente
-def extraction(to_extract):
-        """
-        Extract text from the given PDF and clean it up.
-        
-        :param to_extract: path to the PDF file
-        :return: cleaned text as a string
+# spazi multipli, compattati in uno solo
+SPACES = re.compile(' +')
+
+def iter_rows_text(to_extract):
         """
-        workbook = openpyxl.load_workbook(to_extract)
+        Yield the text of each row of every sheet of the given XLSX file, one row at a time.
 
-        worksheet = workbook.active
+        The workbook is opened in read-only mode and only the cell values are read, so the memory used does not grow
+        with the number of cells. Each cell becomes a line (' ' + value, with the runs of spaces collapsed).
 
-        towrite = ""
+        :param to_extract: path to the XLSX file (or file object)
+        :return: the text of each row
+        :rtype: generator
+        """
+        workbook = openpyxl.load_workbook(to_extract, read_only=True, data_only=True)
 
-        for row in worksheet.iter_rows():
-            for cell in row:
-                towrite += ' ' + str(cell.value)  # estrazione testo
-                # eliminazione spazi superflui sempre tramite REGEX
-                towrite = re.sub(' +', ' ', towrite)
-                towrite = towrite + '\n'   
-        return towrite
+        try:
+            for worksheet in workbook.worksheets:
+                for row in worksheet.iter_rows(values_only=True):
+                    # eliminazione spazi superflui tramite REGEX, una sola volta per riga
+                    yield SPACES.sub(' ', ''.join(' ' + str(value) + '\n' for value in row))
+        finally:
+            workbook.close()
+
+# classe per gestire l'upload di un file .xlsx, estrarne il testo, tradurlo e infine inviare il risultato sotto forma di JSON al richiedente
+def extraction(to_extract, out=None):
+        """
+        Extract text from the given XLSX file, all the sheets included.
+        
+        :param to_extract: path to the XLSX file (or file object)
+        :param out: binary file to stream the text to, row by row (optional)
+        :return: extracted text as a string
+        """
+        return write_pieces(iter_rows_text(to_extract), out)
 
 def translate(towrite):
         """
-        Translate text from Italian to English using Google Translate API.
+        Translate text from Italian to English (batched, with translation memory).
     
         :param towrite: text to translate
         :return: translated text as a string
         """
-        result = ""
-        
-        parts = towrite.split('.')
-
-        for p in parts:
-            if len(p) > 5:
-                tmp = GoogleTranslator(
-                    source='it', target='en').translate(text=p)
-                result = result + tmp + '.'
-                                
-            else:
-                result += p
-
-        return result
+        return translate_text(towrite)
 
 class XLSXUploadView(generics.CreateAPIView):
     """
@@ -70,6 +72,12 @@ class XLSXUploadView(generics.CreateAPIView):
         :rtype: JsonResponse.
         """
 
+        # Run in the background when the request asks to (see myapp/jobs/job_queue.py)
+        deferred = job_queue.defer(self, request)
+
+        if deferred is not None:
+            return deferred
+
         uploaded_file = request.FILES.get('file', None)
 
         if not uploaded_file:
@@ -97,8 +105,7 @@ class XLSXUploadView(generics.CreateAPIView):
 
                     with open(file_path, "wb") as out:
 
-                        towrite = XLSXUploadView.extraction(uploaded_file)
-                        out.write(towrite.encode('utf-8'))
+                        towrite = extraction(uploaded_file, out)
 
                 xlsx_new = XLSX.objects.filter(title = file_path_xlsx).first()
 
@@ -123,8 +130,8 @@ class XLSXUploadView(generics.CreateAPIView):
 
                     with open(file_path, "wb") as out:
 
-                        towrite = XLSXUploadView.extraction(uploaded_file)
-                        towrite = XLSXUploadView.translate(towrite)
+                        towrite = extraction(uploaded_file)
+                        towrite = translate(towrite)
                         out.write(towrite.encode('utf-8'))
 
                 with transaction.atomic():
@@ -147,8 +154,7 @@ class XLSXUploadView(generics.CreateAPIView):
                     with self.lock:
                         with open(file_path, "wb") as out:
 
-                            towrite = XLSXUploadView.extraction(uploaded_file)
-                            out.write(towrite.encode('utf-8'))
+                            towrite = extraction(uploaded_file, out)
 
                     # recupero record
                     queryset = XLSX.objects.select_for_update().filter(title=file_path_xlsx) .all()
@@ -168,8 +174,8 @@ class XLSXUploadView(generics.CreateAPIView):
                     with self.lock:
                         with open(file_path, "wb") as out:
 
-                            towrite = XLSXUploadView.extraction(uploaded_file)
-                            towrite = XLSXUploadView.translate(towrite)
+                            towrite = extraction(uploaded_file)
+                            towrite = translate(towrite)
                             out.write(towrite.encode('utf-8'))
 
                     # recupero record